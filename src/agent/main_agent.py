@@ -12,9 +12,13 @@ from .schemas import AgentOutput, Deps, MaybeSummarizedContent
 from ..config.settings import API_KEY, MODEL
 from ..tools.base import ToolAbortedException
 from ..tools.ctags import CtagsTool
-from ..tools.directory import DirectoryTool
+from ..tools.directory import DEFAULT_EXCLUDE_DIRS, DirectoryTool
 from ..tools.file_reader import FileReaderTool
 from ..tools.file_writer import FileWriterTool
+from ..tools.line_index import split_lines
+from ..tools.outline import MAX_OUTLINE_LINES
+from ..tools.read_history import read_key
+from ..tools.search import SearchTool
 from ..tools.terminal import TerminalTool
 
 
@@ -75,7 +79,9 @@ logger = logging.getLogger(__name__)
 async def directory(ctx: RunContext[Deps], intention_of_this_call: str, relative_path_from_project_root: str, max_depth: int,
               additional_exclude_dirs=None,
               file_filter: Optional[str] = None,
-              hide_empty_folder: bool = False) -> MaybeSummarizedContent[List[str]]:
+              hide_empty_folder: bool = False,
+              rebuild_index: bool = False,
+              include_generated: bool = False) -> MaybeSummarizedContent[List[str]]:
     """Get the directory structure at the given path (also recursively). Use it for get an overview of the project structure and for filter files and folders. It also provides metadata for lastModified and fileSize. It is always a good idea to show the repo map with this tool with the default max_depth=99999
 
     Args:
@@ -83,22 +89,18 @@ async def directory(ctx: RunContext[Deps], intention_of_this_call: str, relative
         intention_of_this_call (required): Provide a clear, specific statement of what you aim to accomplish with this tool invocation: "I do this to get this information."
         relative_path_from_project_root: The relative path from the project root to analyze
         max_depth: Maximum depth to traverse in the directory tree (default=99999)
-        additional_exclude_dirs: Additional directories to exclude beyond the default exclusions. The defaults are: [".git", ".hg", ".svn", ".DS_Store", "node_modules", "bower_components", "dist", "build", "env", "venv", ".venv", "__pycache__", ".pytest_cache", ".mypy_cache", ".cache", ".idea", ".vscode", "vendor", "out", "target", ".bundle", "coverage", "bin", "nuget", ".nuget"]
+        additional_exclude_dirs: Additional directories to exclude beyond the default exclusions. The defaults are: [".git", ".hg", ".svn", ".DS_Store", "node_modules", "bower_components", "dist", "build", "env", "venv", ".venv", "__pycache__", ".pytest_cache", ".mypy_cache", ".cache", ".idea", ".vscode", "vendor", "out", "target", ".bundle", "coverage", "bin", "nuget", ".nuget"]. Glob patterns like "*generated*" are supported. Entries ignored by .gitignore/.ignore files are always skipped.
         file_filter: Optional pattern to filter files (e.g. "*.py" for Python files)
         hide_empty_folder: If True, folders that have no matching files (based on file_filter) and no non-empty subfolders will be hidden from the results.
+        rebuild_index: If True, the cached directory index is rebuilt from scratch. Only needed if the result looks stale.
+        include_generated: If True, also list lock files, minified bundles, generated sources and binaries (left out by default).
 
     Returns:
         MaybeSummarizedContent[List[str]]: A response containing the directory structure. The result could be summarized.
     """
     directory_tool = DirectoryTool()
     try:
-        default_exclude_dirs = [
-                ".git", ".hg", ".svn", ".DS_Store", "node_modules", "bower_components",
-                "dist", "build", "env", "venv", ".venv", "__pycache__", ".pytest_cache",
-                ".mypy_cache", ".cache", ".idea", ".vscode", "vendor", "out", "target",
-                ".bundle", "coverage", "bin", "nuget", "*nuget*",  ".nuget", "obj", "debug", "release"
-            ]
-        exclude_dirs = default_exclude_dirs + (additional_exclude_dirs or [])
+        exclude_dirs = DEFAULT_EXCLUDE_DIRS + (additional_exclude_dirs or [])
         full_path = get_safe_path(ctx.deps.project_root, relative_path_from_project_root)
         logger.info(f"Scanning directory at {full_path} with max_depth={max_depth}")
         if file_filter:
@@ -112,10 +114,16 @@ async def directory(ctx: RunContext[Deps], intention_of_this_call: str, relative
             exclude_dirs=exclude_dirs,
             verbose=ctx.deps.verbose,
             file_filter=file_filter,
-            hide_empty_folder=hide_empty_folder
+            hide_empty_folder=hide_empty_folder,
+            project_root=ctx.deps.project_root,
+            rebuild_snapshot=rebuild_index,
+            stream=True,
+            use_ignore_files=True,
+            include_generated=include_generated
         )
         is_summarized = result.get("is_summarized", False)
-        content = result.get("summary", result["items"]) if is_summarized else result["items"]
+        # Entries are kept in columnar form inside the tool and only serialized here
+        content = result.get("summary") if is_summarized else list(result["items"])
         return MaybeSummarizedContent(
             total_length=result["total_count"],
             content=content,
@@ -169,6 +177,8 @@ async def file_writer(
             verbose=ctx.deps.verbose
         )
         written_bytes = result["total_count"]
+        # The model knows what it wrote: a re-read only needs to report later changes
+        ctx.deps.read_history.record(read_key(full_path), split_lines(content.encode("utf-8", errors="replace")))
         return MaybeSummarizedContent(
             total_length=written_bytes,
             content=[str(written_bytes)],
@@ -195,17 +205,30 @@ async def file_writer(
 
 
 @agent.tool
-async def file_reader(ctx: RunContext[Deps], intention_of_this_call: str, relative_path_from_project_root: str) -> MaybeSummarizedContent[List[str]]:
+async def file_reader(ctx: RunContext[Deps], intention_of_this_call: str, relative_path_from_project_root: str,
+                      start_line: int = 0, end_line: int = 0, symbol: str = "",
+                      outline: bool = False, include_generated: bool = False,
+                      full_content: bool = False) -> MaybeSummarizedContent[List[str]]:
     """
-    Read the contents of a file.
+    Read the contents of a file, the whole file or only a range of lines or the definition of a symbol.
+    Prefer ranges and symbols for big files: you get the exact lines instead of a summary. To learn
+    what a big file contains, read its outline first and then the ranges you need.
+    A file (or range) you already read or wrote in this conversation is not sent again: you get
+    a notice that it is unchanged since then, or a unified diff against the version you have.
 
     Args:
         ctx: The run context with dependencies
         intention_of_this_call (required): Provide a clear, specific statement of what you aim to accomplish with this tool invocation: "I do this to get this information."
         relative_path_from_project_root (str): The file path relative to the project root.
+        start_line (int): First line to read (1-based, 0 = from the start), e.g. from search or references results.
+        end_line (int): Last line to read (inclusive, 0 = to the end).
+        symbol (str): Name of a function, class, method, ... defined in this file; only its definition is returned ("Class.method" for a member). Needs the tags file (ctags action 'generate_tags').
+        outline (bool): Return only the outline of the file: its classes and functions with their signatures, line spans and the first line of their docstrings.
+        full_content (bool): Return the content even if it was already read in this conversation (instead of "unchanged" or a diff).
+        include_generated (bool): Return the whole content of binary, lock, minified and generated files too (by default they are only reported with a one-line stub).
 
     Returns:
-        MaybeSummarizedContent[List[str]]: A list of all lines in the file. The result could be summarized.
+        MaybeSummarizedContent[List[str]]: The lines read (start_line tells the number of the first one for ranges and symbols). The result could be summarized.
     """
     file_reader_tool = FileReaderTool()
     try:
@@ -213,17 +236,27 @@ async def file_reader(ctx: RunContext[Deps], intention_of_this_call: str, relati
         result = await file_reader_tool.run(
             intention_of_this_call=intention_of_this_call,
             file_path=full_path,
-            limit=ctx.deps.limit,
+            start_line=start_line or None,
+            end_line=end_line or None,
+            symbol=symbol or None,
+            outline=outline,
+            include_generated=include_generated,
+            read_history=None if full_content else ctx.deps.read_history,
+            project_root=ctx.deps.project_root,
+            limit=max(ctx.deps.limit, MAX_OUTLINE_LINES) if outline else ctx.deps.limit,
             verbose=ctx.deps.verbose
         )
         # Handle potential summarized content
         is_summarized = result.get("is_summarized", False)
         content = result.get("summary") if is_summarized else result["items"]
+        if "read_key" in result and not is_summarized:
+            ctx.deps.read_history.record(result["read_key"], result["read_lines"])
         return MaybeSummarizedContent(
             total_length=result["total_count"],
             content=content,
             error=False,
-            is_summarized=is_summarized
+            is_summarized=is_summarized,
+            start_line=result.get("start_line", 1)
         )
     except ToolAbortedException:
         return MaybeSummarizedContent(
@@ -249,6 +282,7 @@ async def terminal(ctx: RunContext[Deps], intention_of_this_call: str, command:
     """
     Run a terminal command to explore the codebase.
     Recommended commands: rg (with context lines), find, ls, cat. Always think about narrowing down the scope of the command (in big codebases)!
+    Commands are killed after a timeout or when they produce too much output; is_truncated and truncation_reason tell if that happened (total_length then only counts the lines read before).
 
     Args:
         ctx: The run context with dependencies
@@ -275,7 +309,9 @@ async def terminal(ctx: RunContext[Deps], intention_of_this_call: str, command:
             total_length=result["total_count"],
             content=content,
             error=False,
-            is_summarized=is_summarized
+            is_summarized=is_summarized,
+            is_truncated=result.get("is_truncated", False),
+            truncation_reason=result.get("truncation_reason", "")
         )
     except ToolAbortedException:
         return MaybeSummarizedContent(
@@ -296,27 +332,98 @@ async def terminal(ctx: RunContext[Deps], intention_of_this_call: str, command:
         )
 
 
+@agent.tool
+async def search(ctx: RunContext[Deps], intention_of_this_call: str, pattern: str,
+                 relative_path_from_project_root: str = "", is_regex: bool = False, ignore_case: bool = False,
+                 file_glob: str = "", context_lines: int = 0,
+                 max_matches_per_file: int = 20, include_generated: bool = False) -> MaybeSummarizedContent[List[str]]:
+    """
+    Search the content of the files in the project (like rg/grep, but built in). Files ignored by git and binary files are skipped.
+    Matches in lock, minified and generated files are reported with one stub record per file.
+
+    Args:
+        ctx: The run context with dependencies
+        intention_of_this_call (required): Provide a clear, specific statement of what you aim to accomplish with this tool invocation: "I do this to get this information."
+        pattern (str): The text to search for (a Python regular expression when is_regex).
+        relative_path_from_project_root (str): The file or directory to search in (default: the whole project).
+        is_regex (bool): If True, pattern is a regular expression, otherwise a literal text.
+        ignore_case (bool): If True, search case-insensitively.
+        file_glob (str): Only search files whose name matches this glob, e.g. "*.py".
+        context_lines (int): Number of lines before and after each match to include.
+        max_matches_per_file (int): Maximum number of matching lines reported per file.
+        include_generated (bool): If True, report the matches in lock, minified and generated files like in any other file.
+
+    Returns:
+        MaybeSummarizedContent[List[str]]: One JSON record per matching line: {"file", "line", "column", "text", optional "context_before"/"context_after", and "file_match_cap_reached" on the last record of a file that had more matches}. The result could be summarized.
+    """
+    search_tool = SearchTool()
+    try:
+        full_path = get_safe_path(ctx.deps.project_root, relative_path_from_project_root)
+        result = await search_tool.run(
+            intention_of_this_call=intention_of_this_call,
+            pattern=pattern,
+            path=full_path,
+            project_root=ctx.deps.project_root,
+            is_regex=is_regex,
+            ignore_case=ignore_case,
+            file_glob=file_glob,
+            context_lines=context_lines,
+            max_matches_per_file=max_matches_per_file,
+            include_generated=include_generated,
+            limit=ctx.deps.limit,
+            verbose=ctx.deps.verbose
+        )
+        is_summarized = result.get("is_summarized", False)
+        content = result.get("summary", result["items"]) if is_summarized else result["items"]
+        return MaybeSummarizedContent(
+            total_length=result["total_count"],
+            content=content,
+            error=False,
+            is_summarized=is_summarized
+        )
+    except ToolAbortedException:
+        return MaybeSummarizedContent(
+            total_length=0,
+            content=[],
+            error=False,
+            aborted=True,
+            is_summarized=False
+        )
+    except Exception as e:
+        logger.error(f"Error in search tool: {str(e)}")
+        return MaybeSummarizedContent(
+            total_length=0,
+            content=[str(e)],
+            error=True,
+            aborted=False,
+            is_summarized=False
+        )
+
+
 @agent.tool
 async def ctags_readtags_tool(ctx: RunContext[Deps], intention_of_this_call: str, action: str,
                         relative_path_from_project_root: str = "", symbol: str = "",
-                        kind: str = "", is_symbol_regex: bool = False) -> MaybeSummarizedContent[List[str]]:
+                        kind: str = "", is_symbol_regex: bool = False,
+                        full_rebuild: bool = False) -> MaybeSummarizedContent[List[str]]:
     """
     Use this to get symbol information about the codebase(i.e. how many classes, where is this function,  method, variable, ...see kind argument).
     Query tags using universal-ctags and readtags utilities. This tool provides access to ctags and readtags functionalities.
-    You need ALWAYS to first generate the tags file using the 'generate_tags' action.
+    You need ALWAYS to first generate the tags file using the 'generate_tags' action (not needed for 'references').
     HINT: imports are not considered as symbols!
     Actions:
-        'generate_tags': Generate or update a tags file for the given path.
+        'generate_tags': Generate or update a tags file for the given path. For a directory only files changed since the last run are re-tagged.
         'filter': Filter tags by symbol and/or kind. If neither is provided, lists all tags. Regex for symbols is supported, see is_symbol_regex
+        'references': Find where an identifier (symbol, exact and case-sensitive, no regex) is used: every line containing it below the given path, as "path:line:text". Does not need generate_tags and is much faster than grep.
 
     Args:
         ctx: The run context with dependencies
         intention_of_this_call (required): Provide a clear, specific statement of what you aim to accomplish with this tool invocation: "I do this to get this information."
         action (str): The action to perform.
-        relative_path_from_project_root (str): The file or directory to generate tags from (with action 'generate_tags'). The file or directory you want to get tag information from (with action 'filter').
+        relative_path_from_project_root (str): The file or directory to generate tags from (with action 'generate_tags'). The file or directory you want to get tag information from (with action 'filter') or references in (with action 'references').
         symbol (str): The symbol to search for (can be a regex when is_symbol_regex).
         kind (str): The kind of symbol to filter by (c: classes, f: functions, v: variables, m: class/struct members and methods, d: macro definitions, t: typedefs, e: enumerators, g: enumerations, s: structures, u: unions, p: function prototypes).
         is_symbol_regex (bool): If True, treat the symbol parameter as a regular expression pattern.
+        full_rebuild (bool): With 'generate_tags', re-tag all files instead of only the changed ones. Use it only if the tags look wrong.
 
     Returns:
         MaybeSummarizedContent[List[str]]: A list of raw ctags output lines (The result could be summarized). Each line contains tab-separated fields with symbol information. sample:
@@ -334,6 +441,8 @@ async def ctags_readtags_tool(ctx: RunContext[Deps], intention_of_this_call: str
             limit=ctx.deps.limit,
             verbose=ctx.deps.verbose,
             is_symbol_regex=is_symbol_regex,
+            full_rebuild=full_rebuild,
+            project_root=ctx.deps.project_root,
         )
         is_summarized = result.get("is_summarized", False)
         content = result.get("summary", result["items"]) if is_summarized else result["items"]
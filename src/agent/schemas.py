@@ -1,8 +1,10 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import TypeVar, Generic, List
 
 from pydantic import BaseModel
 
+from ..tools.read_history import ReadHistory
+
 T = TypeVar('T')
 
 
@@ -14,6 +16,9 @@ class MaybeSummarizedContent(Generic[T]):
     error: bool = False
     aborted: bool = False
     is_summarized: bool = False
+    is_truncated: bool = False  # the output was cut off, e.g. the command hit the timeout or output cap
+    truncation_reason: str = ""
+    start_line: int = 1  # line number of the first content line (file_reader ranges and symbols)
 
 @dataclass
 class Deps:
@@ -21,6 +26,7 @@ class Deps:
     limit: int = 100
     project_root: str = "."
     verbose: bool = False
+    read_history: ReadHistory = field(default_factory=ReadHistory)  # file contents sent to the model in this session
 
 
 class AgentOutput(BaseModel):
@@ -0,0 +1,38 @@
+"""
+Micro benchmarks for codesearch tools.
+
+Run a benchmark from the repository root, e.g.:
+    CODESEARCH_API_KEY=dummy python -m src.benchmarks.directory_walk
+"""
+import os
+import time
+from contextlib import contextmanager
+from typing import Iterator, List
+
+
+def make_synthetic_tree(root: str, fanout: int = 8, depth: int = 3, files_per_dir: int = 20) -> int:
+    """Create a balanced directory tree below root and return the number of files created."""
+    created = 0
+    level: List[str] = [root]
+    for current_depth in range(depth + 1):
+        next_level = []
+        for dir_path in level:
+            for i in range(files_per_dir):
+                with open(os.path.join(dir_path, f"file_{i}.py"), "w") as f:
+                    f.write(f"# {dir_path} {i}\n")
+                created += 1
+            if current_depth < depth:
+                for i in range(fanout):
+                    sub_dir = os.path.join(dir_path, f"dir_{i}")
+                    os.mkdir(sub_dir)
+                    next_level.append(sub_dir)
+        level = next_level
+    return created
+
+
+@contextmanager
+def timed(label: str, results: dict) -> Iterator[None]:
+    """Measure the wall-clock time of a block and store it in results[label]."""
+    start = time.perf_counter()
+    yield
+    results[label] = time.perf_counter() - start
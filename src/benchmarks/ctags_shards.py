@@ -0,0 +1,62 @@
+"""
+Wall-clock time of a full generate_tags with one ctags process versus byte-balanced shards
+tagged by 4 and N (CPU count) ctags processes, on a synthetic Python tree or on PATH.
+The merged tags file of every run is compared with the single-process output.
+
+    CODESEARCH_API_KEY=dummy python -m src.benchmarks.ctags_shards [PATH]
+"""
+import os
+import shutil
+import tempfile
+
+import click
+
+from . import make_synthetic_tree, timed
+from ..tools.ctags import CtagsTool, list_source_files
+
+
+def read_tags(path: str):
+    with open(path, "r", encoding="utf-8", errors="surrogateescape") as f:
+        return [line for line in f if not line.startswith("!_")]
+
+
+def make_python_sources(root: str) -> None:
+    make_synthetic_tree(root, fanout=6, depth=3, files_per_dir=30)
+    for dir_path, _, files in os.walk(root):
+        for name in files:
+            with open(os.path.join(dir_path, name), "w") as f:
+                for i in range(40):
+                    f.write(f"class Model{i}:\n    def method_{i}(self):\n        return {i}\n\n"
+                            f"def function_{i}(value):\n    return Model{i}().method_{i}() + value\n\n")
+
+
+@click.command()
+@click.argument('path', required=False)
+@click.option('--repeat', default=2, help='Runs per worker count (best time is reported)')
+def main(path, repeat):
+    if shutil.which("ctags") is None:
+        print("ctags is not installed, nothing to measure")
+        return
+    with tempfile.TemporaryDirectory() as tmpdir:
+        if path is None:
+            path = os.path.join(tmpdir, "repo")
+            os.mkdir(path)
+            make_python_sources(path)
+        sizes = {rel_path: os.path.getsize(os.path.join(path, rel_path)) for rel_path in list_source_files(path)}
+        print(f"{len(sizes)} files, {sum(sizes.values()) / 2**20:.0f}MiB, {os.cpu_count()} CPUs")
+
+        expected = None
+        for workers in sorted({1, 4, os.cpu_count() or 1}):
+            results = {}
+            best = None
+            for _ in range(repeat):
+                with timed("run", results):
+                    CtagsTool._tag_all(path, sizes, workers)
+                best = results["run"] if best is None else min(best, results["run"])
+            tags = read_tags(os.path.join(path, "tags"))
+            expected = tags if expected is None else expected
+            print(f"workers={workers:<3} wall={best:.2f}s tags={len(tags)} same_as_single={tags == expected}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""
+Memory and time of the directory tool result: one JSON string per entry (legacy) versus the
+columnar DirectoryEntries container. The tree is synthesized in memory, so no files are created.
+Path strings are shared with the listings, so "retained" is the memory added by the result itself.
+
+    CODESEARCH_API_KEY=dummy python -m src.benchmarks.directory_entries --entries 1000000
+"""
+import gc
+import json
+import os
+import time
+import tracemalloc
+from datetime import datetime
+
+import click
+
+from ..tools.directory import DirectoryEntries, DirectoryTool, entry_to_json
+from ..tools.scanner import DirListing
+
+
+def synthetic_listings(root: str, entries: int, files_per_dir: int = 50, fanout: int = 10):
+    listings = {}
+    pending = [root]
+    created = 0
+    now = time.time()
+    while pending and created < entries:
+        dir_path = pending.pop(0)
+        listing = DirListing(mtime=now)
+        for i in range(min(files_per_dir, entries - created)):
+            listing.files.append((os.path.join(dir_path, f"module_{i}.py"), 1000 + i, now))
+            created += 1
+        listing.dirs = [os.path.join(dir_path, f"package_{i}") for i in range(fanout)]
+        pending.extend(listing.dirs)
+        listings[dir_path] = listing
+    return listings
+
+
+def legacy_emit(path, listings, flattened):
+    listing = listings.get(path)
+    if listing is None:
+        return
+    for file_path, size, mtime in listing.files:
+        flattened.append(entry_to_json(file_path, "file", size, datetime.fromtimestamp(mtime).isoformat()))
+    for sub_dir in listing.dirs:
+        legacy_emit(sub_dir, listings, flattened)
+    flattened.append(entry_to_json(path, "directory", 0, datetime.fromtimestamp(listing.mtime).isoformat()))
+
+
+def measure(label, build, render):
+    # Time and memory are measured in separate runs, tracemalloc slows down allocations a lot
+    gc.collect()
+    start = time.perf_counter()
+    items = build()
+    build_time = time.perf_counter() - start
+    del items
+
+    gc.collect()
+    tracemalloc.start()
+    items = build()
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    summarizer_input = "\n".join(items[:1000])
+    boundary_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    render(items)
+    render_time = time.perf_counter() - start
+
+    print(f"{label:<10} entries={len(items):<9} build={build_time:.2f}s retained={retained / 2**20:.0f}MiB "
+          f"summarizer_input={boundary_time * 1000:.1f}ms verbose_render={render_time:.2f}s")
+    assert summarizer_input
+
+
+def legacy_render(items):
+    for entry_json in items:
+        entry = json.loads(entry_json)
+        f"{entry['type'].ljust(10)} {entry['path']} (size={entry['size']}, modified={entry['modified']})"
+
+
+def columnar_render(entries):
+    for i in range(len(entries)):
+        f"{entries.entry_type(i).ljust(10)} {entries.paths[i]} (size={entries.sizes[i]}, modified={entries.modified(i)})"
+
+
+@click.command()
+@click.option('--entries', default=1_000_000, help='Number of file entries in the synthetic tree')
+def main(entries):
+    root = "/synthetic/repo"
+    listings = synthetic_listings(root, entries)
+    tool = DirectoryTool()
+
+    def build_legacy():
+        flattened = []
+        legacy_emit(root, listings, flattened)
+        return flattened
+
+    def build_columnar():
+        flattened = DirectoryEntries()
+        tool._emit_listing(root, listings, flattened, hide_empty_folder=False)
+        return flattened
+
+    measure("json", build_legacy, legacy_render)
+    measure("columnar", build_columnar, columnar_render)
+
+
+if __name__ == '__main__':
+    main()
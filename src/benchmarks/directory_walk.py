@@ -0,0 +1,59 @@
+"""
+Compare the recursive directory walker with the parallel scandir walker, the streaming
+walker that stops after the summarizer input cap, and answers served from the persistent
+directory snapshot.
+
+    CODESEARCH_API_KEY=dummy python -m src.benchmarks.directory_walk [PATH] --workers 1,4,16
+"""
+import tempfile
+
+import click
+
+from . import make_synthetic_tree, timed
+from ..tools.directory import DEFAULT_EXCLUDE_DIRS, DirectoryTool
+
+
+@click.command()
+@click.argument('path', required=False)
+@click.option('--workers', default='1,4,8,16,32', help='Comma separated worker counts to compare')
+@click.option('--repeat', default=3, help='Runs per worker count (best time is reported)')
+def main(path, workers, repeat):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        if path is None:
+            files = make_synthetic_tree(tmpdir, fanout=8, depth=4, files_per_dir=10)
+            print(f"synthetic tree: {files} files")
+            path = tmpdir
+
+        tool = DirectoryTool()
+        reference = None
+        for worker_count in [int(w) for w in workers.split(',')]:
+            times = {}
+            for i in range(repeat):
+                with timed(i, times):
+                    result = tool._run("benchmark", path=path, max_depth=None, exclude_dirs=[".git"], workers=worker_count)
+            if reference is None:
+                reference = result['items']
+            status = "same output" if result['items'] == reference else "OUTPUT DIFFERS"
+            print(f"workers={worker_count:<3} entries={result['total_count']:<8} best={min(times.values()):.3f}s  {status}")
+
+        times = {}
+        for i in range(repeat):
+            with timed(i, times):
+                result = tool._run("benchmark", path=path, limit=100, exclude_dirs=DEFAULT_EXCLUDE_DIRS, stream=True)
+        estimate = "~" if result['is_total_estimated'] else ""
+        print(f"stream      entries={len(result['items']):<8} best={min(times.values()):.3f}s  total_count={estimate}{result['total_count']}")
+
+        times = {}
+        with timed("cold", times):
+            tool._run("benchmark", path=path, exclude_dirs=DEFAULT_EXCLUDE_DIRS, project_root=path,
+                      use_ignore_files=True, rebuild_snapshot=True)
+        for i in range(repeat):
+            with timed(i, times):
+                result = tool._run("benchmark", path=path, exclude_dirs=DEFAULT_EXCLUDE_DIRS, project_root=path,
+                                   use_ignore_files=True)
+        warm = min(times[i] for i in range(repeat))
+        print(f"snapshot    entries={result['total_count']:<8} cold={times['cold']:.3f}s warm={warm:.3f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+"""
+An agent session re-reading the same source files: FileReaderTool over a set of files, several
+rounds, with a read + split per call (the behavior before the shared file cache) versus the cache.
+
+    CODESEARCH_API_KEY=dummy python -m src.benchmarks.file_cache [--rounds N]
+"""
+import os
+import tempfile
+
+import click
+
+from . import timed
+from .ctags_shards import make_python_sources
+from ..tools.file_cache import get_file_cache
+from ..tools.file_reader import FileReaderTool
+
+
+@click.command()
+@click.option('--rounds', default=5, help='Times every file is read')
+def main(rounds):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        make_python_sources(tmpdir)
+        paths = sorted(os.path.join(dirpath, name) for dirpath, _, names in os.walk(tmpdir) for name in names)
+
+        results = {}
+        with timed("uncached", results):
+            for _ in range(rounds):
+                for path in paths:
+                    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+                        f.read().splitlines()
+        tool = FileReaderTool()
+        with timed("cached", results):
+            for _ in range(rounds):
+                for path in paths:
+                    tool._run("benchmark", file_path=path)
+        print(f"{len(paths)} files x {rounds} rounds: uncached={results['uncached'] * 1000:.1f}ms "
+              f"cached={results['cached'] * 1000:.1f}ms")
+        print(*get_file_cache().stats(), sep="\n")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,30 @@
+"""
+Outline of large Python modules with FileReaderTool: time of the local ast parse and lines of the
+outline versus lines of the file (the input a summarizer round-trip would otherwise get).
+
+    CODESEARCH_API_KEY=dummy python -m src.benchmarks.file_outline
+"""
+import inspect
+import typing
+
+import click
+
+from . import timed
+from ..tools.file_reader import FileReaderTool
+
+
+@click.command()
+def main():
+    tool = FileReaderTool()
+    for module in (inspect, typing, click.core):
+        path = module.__file__
+        results = {}
+        with timed("outline", results):
+            outline = tool._run("benchmark", file_path=path, outline=True)
+        file_lines = tool._run("benchmark", file_path=path)["total_count"]
+        print(f"{module.__name__}: {file_lines} lines -> {outline['total_count']} outline lines "
+              f"in {results['outline'] * 1000:.1f}ms")
+
+
+if __name__ == '__main__':
+    main()
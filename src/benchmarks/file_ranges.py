@@ -0,0 +1,40 @@
+"""
+Reading lines 40,000-40,100 of a large file with FileReaderTool: whole file read + splitlines()
+(the previous behavior) versus the cold and the cached line index.
+
+    CODESEARCH_API_KEY=dummy python -m src.benchmarks.file_ranges [--lines N]
+"""
+import os
+import tempfile
+
+import click
+
+from . import timed
+from ..tools.file_reader import FileReaderTool
+
+
+@click.command()
+@click.option('--lines', default=1_000_000, help='Lines of the generated file')
+def main(lines):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "big.py")
+        with open(path, "w") as f:
+            for i in range(lines):
+                f.write(f"    value_{i} = compute(value_{i - 1}, {i})  # line {i + 1}\n")
+
+        results = {}
+        with timed("splitlines", results):
+            with open(path, 'r', encoding='utf-8', errors='replace') as f:
+                expected = f.read().splitlines()[39999:40100]
+        tool = FileReaderTool()
+        with timed("cold", results):
+            cold = tool._run("benchmark", file_path=path, start_line=40000, end_line=40100)
+        with timed("cached", results):
+            cached = tool._run("benchmark", file_path=path, start_line=40000, end_line=40100)
+        print(f"{lines} lines, {os.path.getsize(path) / 2**20:.0f}MiB: splitlines={results['splitlines'] * 1000:.1f}ms "
+              f"index_cold={results['cold'] * 1000:.1f}ms index_cached={results['cached'] * 1000:.3f}ms "
+              f"same={cold['items'] == cached['items'] == expected}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+"""
+Search and read output of a project with a lock file and minified bundles next to its sources:
+the bytes handed to the agent (or summarizer) with and without include_generated.
+
+    CODESEARCH_API_KEY=dummy python -m src.benchmarks.generated_files
+"""
+import json
+import os
+import tempfile
+
+import click
+
+from . import timed
+from ..tools.file_reader import FileReaderTool
+from ..tools.search import SearchTool
+
+
+@click.command()
+@click.option('--bundles', default=5, help='Number of minified bundles')
+def main(bundles):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        os.makedirs(os.path.join(tmpdir, "src"))
+        os.makedirs(os.path.join(tmpdir, "static"))
+        for i in range(50):
+            with open(os.path.join(tmpdir, "src", f"module_{i}.js"), "w") as f:
+                f.write("".join(f"export function render_{j}(props) {{\n  return props.value + {j};\n}}\n" for j in range(40)))
+        for i in range(bundles):
+            with open(os.path.join(tmpdir, "static", f"bundle_{i}.js"), "w") as f:
+                f.write("".join(f"function render_{j}(p){{return p.value+{j}}};" for j in range(20000)))
+        with open(os.path.join(tmpdir, "package-lock.json"), "w") as f:
+            json.dump({"packages": {f"render-{j}": {"version": "1.0.0"} for j in range(5000)}}, f, indent=2)
+
+        search, reader = SearchTool(), FileReaderTool()
+        bundle = os.path.join(tmpdir, "static", "bundle_0.js")
+        for include_generated in (True, False):
+            results = {}
+            with timed("search", results):
+                found = search._run("benchmark", pattern="render_1", path=tmpdir, include_generated=include_generated)
+            read = reader._run("benchmark", file_path=bundle, include_generated=include_generated)
+            print(f"include_generated={include_generated}: search {len(found['items'])} records, "
+                  f"{sum(map(len, found['items'])) / 1024:.0f}KiB in {results['search'] * 1000:.0f}ms; "
+                  f"reading a bundle {sum(map(len, read['items'])) / 1024:.1f}KiB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""
+Effect of pruning ignored directories: a small source tree next to large generated trees that
+are listed in .gitignore (or matched by the "*nuget*" exclude glob).
+
+    CODESEARCH_API_KEY=dummy python -m src.benchmarks.ignore_pruning [PATH]
+"""
+import os
+import tempfile
+
+import click
+
+from . import make_synthetic_tree, timed
+from ..tools.directory import DEFAULT_EXCLUDE_DIRS, DirectoryTool
+
+
+def make_repo_with_ignored_trees(root: str) -> None:
+    os.makedirs(os.path.join(root, "src"))
+    make_synthetic_tree(os.path.join(root, "src"), fanout=4, depth=2, files_per_dir=20)
+    for ignored in ["bazel-out", "generated-output", "packages.nuget.cache"]:
+        os.makedirs(os.path.join(root, ignored))
+        make_synthetic_tree(os.path.join(root, ignored), fanout=8, depth=3, files_per_dir=10)
+    with open(os.path.join(root, ".gitignore"), "w") as f:
+        f.write("/bazel-out/\ngenerated-output/\n*.pyc\n")
+
+
+@click.command()
+@click.argument('path', required=False)
+@click.option('--repeat', default=3, help='Runs per variant (best time is reported)')
+def main(path, repeat):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        if path is None:
+            make_repo_with_ignored_trees(tmpdir)
+            path = tmpdir
+
+        # Before globs were supported, "*nuget*" never matched anything
+        names_only = [d for d in DEFAULT_EXCLUDE_DIRS if not any(char in d for char in "*?[")]
+        variants = [
+            ("exclude names only", names_only, False),
+            ("globs + .gitignore", DEFAULT_EXCLUDE_DIRS, True),
+        ]
+        tool = DirectoryTool()
+        for label, exclude_dirs, use_ignore_files in variants:
+            for workers in (1, 8):
+                times = {}
+                for i in range(repeat):
+                    with timed(i, times):
+                        result = tool._run(
+                            "benchmark", path=path, exclude_dirs=exclude_dirs,
+                            use_ignore_files=use_ignore_files, workers=workers
+                        )
+                print(f"{label:<20} workers={workers:<2} entries={result['total_count']:<8} best={min(times.values()):.3f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+"""
+Summarizing large tool output with a stand-in model whose latency grows with the prompt
+(a fixed overhead plus a time per input token): one prompt of the first MAX_SUMMARIZER_INPUT_LINES
+lines versus map-reduce over all lines, for several output sizes.
+
+    CODESEARCH_API_KEY=dummy python -m src.benchmarks.map_reduce [--concurrency N] [--chunk-tokens N]
+"""
+import asyncio
+import tempfile
+
+import click
+
+from . import timed
+from ..summarize_agent import cache, main_agent
+
+
+@click.command()
+@click.option('--concurrency', default=4, help='Chunks summarized at the same time')
+@click.option('--chunk-tokens', default=8000, help='Estimated tokens per chunk')
+@click.option('--overhead', default=0.5, help='Seconds per model call')
+@click.option('--token-latency', default=0.0002, help='Seconds per input token')
+def main(concurrency, chunk_tokens, overhead, token_latency):
+    class _Result:
+        def __init__(self, summary):
+            self.data = type("Output", (), {"summary": summary})()
+
+    async def run(prompt, deps):
+        await asyncio.sleep(overhead + len(prompt) / main_agent.CHARS_PER_TOKEN * token_latency)
+        return _Result("\n".join(prompt.splitlines()[2:2 + deps.max_lines]))
+
+    main_agent.summarizer.run = run
+    with tempfile.TemporaryDirectory() as tmpdir:
+        cache._cache = cache.SummaryCache(tmpdir, max_bytes=0)
+        for lines in (1000, 4000, 16000):
+            output = [f"src/pkg_{i // 100}/module_{i}.py:{i}:    result = compute_value(item, index={i})" for i in range(lines)]
+            results = {}
+            for map_reduce in (False, True):
+                with timed(map_reduce, results):
+                    asyncio.run(main_agent.summarize_tool_output(
+                        output, "Find where compute_value is called", max_lines=50, mode="llm",
+                        map_reduce=map_reduce, chunk_tokens=chunk_tokens, concurrency=concurrency
+                    ))
+            chunks = len(main_agent.chunk_lines(output, chunk_tokens))
+            print(f"{lines} lines ({chunks} chunks): single prompt of {min(lines, main_agent.MAX_SUMMARIZER_INPUT_LINES)} "
+                  f"lines={results[False] * 1000:.0f}ms, map-reduce of all lines={results[True] * 1000:.0f}ms")
+
+
+if __name__ == '__main__':
+    main()
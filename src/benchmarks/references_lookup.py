@@ -0,0 +1,58 @@
+"""
+Reference lookups from the ReferenceIndex versus a full-tree `rg -nw` (or `grep -rnw`) per query,
+on the synthetic Python tree of the ctags benchmark or on PATH. Also measures the initial build,
+a warm refresh with no changes and a refresh after editing one file.
+
+    CODESEARCH_API_KEY=dummy python -m src.benchmarks.references_lookup [PATH]
+"""
+import os
+import shutil
+import subprocess
+import tempfile
+
+import click
+
+from . import timed
+from .ctags_shards import make_python_sources
+from ..tools.references import ReferenceIndex
+
+
+@click.command()
+@click.argument('path', required=False)
+@click.option('--symbol', default='method_7', help='Identifier to look up')
+def main(path, symbol):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        if path is None:
+            path = os.path.join(tmpdir, "repo")
+            os.mkdir(path)
+            make_python_sources(path)
+
+        results = {}
+        index = ReferenceIndex(path)
+        with timed("build", results):
+            index.refresh()
+        with timed("refresh", results):
+            index.refresh()
+        with timed("lookup", results):
+            found = index.lookup(symbol)
+        print(f"index   build={results['build']:.2f}s files={len(index.file_ids)} identifiers={len(index.postings)} "
+              f"refresh_unchanged={results['refresh']:.3f}s lookup={results['lookup'] * 1000:.1f}ms results={len(found)}")
+
+        edited = os.path.join(path, index.files[-1][0])
+        with open(edited, "a") as f:
+            f.write(f"\n{symbol}()\n")
+        with timed("edit", results):
+            index.refresh()
+        print(f"index   refresh_after_one_edit={results['edit']:.3f}s results={len(index.lookup(symbol))}")
+
+        if shutil.which("rg"):
+            cmd = ["rg", "-nw", symbol, path]
+        else:
+            cmd = ["grep", "-rnw", "--exclude-dir=.codesearch", symbol, path]
+        with timed("grep", results):
+            output = subprocess.run(cmd, stdout=subprocess.PIPE, text=True).stdout
+        print(f"{cmd[0]:<7} lookup={results['grep'] * 1000:.1f}ms results={len(output.splitlines())}")
+
+
+if __name__ == '__main__':
+    main()
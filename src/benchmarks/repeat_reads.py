@@ -0,0 +1,41 @@
+"""
+A session re-reading one module after small edits: lines sent to the model by FileReaderTool
+without and with the session read history (every read after the first is a diff or "unchanged").
+
+    CODESEARCH_API_KEY=dummy python -m src.benchmarks.repeat_reads [--lines N] [--reads N]
+"""
+import os
+import tempfile
+
+import click
+
+from ..tools.file_reader import FileReaderTool
+from ..tools.read_history import ReadHistory
+
+
+@click.command()
+@click.option('--lines', default=2000, help='Lines of the module')
+@click.option('--reads', default=10, help='Reads of the module, every other one after an edit')
+def main(lines, reads):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "module.py")
+        content = [f"def function_{i}(value):\n    return value + {i}\n" for i in range(lines // 2)]
+        tool = FileReaderTool()
+        history = ReadHistory()
+        sent = {"full": 0, "history": 0}
+        for read in range(reads):
+            if read % 2:
+                content[read * 7 % len(content)] = f"def function_{read}(value):\n    return value * {read}\n"
+            with open(path, "w") as f:
+                f.write("".join(content))
+            history.next_turn()
+            sent["full"] += len(tool._run("benchmark", file_path=path)["items"])
+            result = tool._run("benchmark", file_path=path, read_history=history)
+            history.record(result["read_key"], result["read_lines"])
+            sent["history"] += len(result["items"])
+        print(f"{reads} reads of a {lines}-line module: {sent['full']} lines sent without the read history, "
+              f"{sent['history']} with it")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""
+Literal and regex queries through the search tool (in-process and with the worker pool) versus
+`rg -n` (or `grep -rn`) on the synthetic Python tree of the ctags benchmark or on PATH.
+
+    CODESEARCH_API_KEY=dummy python -m src.benchmarks.search_literal [PATH]
+"""
+import os
+import shutil
+import subprocess
+import tempfile
+
+import click
+
+from . import timed
+from .ctags_shards import make_python_sources
+from ..tools import search
+from ..tools.search import SearchTool
+
+QUERIES = [("method_7(", False), ("return Model3", False), (r"def function_[0-9]+\(value\)", True)]
+
+
+@click.command()
+@click.argument('path', required=False)
+@click.option('--workers', default=os.cpu_count() or 1, help='Worker processes of the pooled runs')
+def main(path, workers):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        if path is None:
+            path = os.path.join(tmpdir, "repo")
+            os.mkdir(path)
+            make_python_sources(path)
+
+        tool = SearchTool()
+        for pattern, is_regex in QUERIES:
+            results = {}
+            with timed("inline", results):
+                inline = tool._run("benchmark", pattern, path, is_regex=is_regex, max_matches_per_file=10**9, workers=1)
+            threshold = search.PARALLEL_SEARCH_MIN_BYTES
+            search.PARALLEL_SEARCH_MIN_BYTES = 0
+            try:
+                tool._run("benchmark", pattern, path, is_regex=is_regex, workers=workers)  # start the pool
+                with timed("pool", results):
+                    pooled = tool._run("benchmark", pattern, path, is_regex=is_regex, max_matches_per_file=10**9,
+                                       workers=workers)
+            finally:
+                search.PARALLEL_SEARCH_MIN_BYTES = threshold
+
+            if shutil.which("rg"):
+                cmd = ["rg", "-n"] + ([] if is_regex else ["-F"]) + [pattern, path]
+            else:
+                cmd = ["grep", "-rn"] + (["-E"] if is_regex else ["-F"]) + ["--", pattern, path]
+            with timed("grep", results):
+                output = subprocess.run(cmd, stdout=subprocess.PIPE, text=True).stdout
+            print(f"{pattern!r:<32} search={results['inline'] * 1000:.0f}ms ({inline['total_count']}) "
+                  f"pool[{workers}]={results['pool'] * 1000:.0f}ms ({pooled['total_count']}) "
+                  f"{cmd[0]}={results['grep'] * 1000:.0f}ms ({len(output.splitlines())})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,39 @@
+"""
+Latency of summarizing oversized tool output (the source files of this repository as one read)
+with the local extractive summarizer and, with --llm and a real CODESEARCH_API_KEY, the
+summarizer agent.
+
+    CODESEARCH_API_KEY=dummy python -m src.benchmarks.summarizer [--max-lines N] [--llm]
+"""
+import asyncio
+import glob
+import os
+
+import click
+
+from . import timed
+from ..summarize_agent.main_agent import MAX_SUMMARIZER_INPUT_LINES, summarize_tool_output
+
+INTENTION = "Find where the directory snapshot is refreshed and how exclude_dirs are matched"
+
+
+@click.command()
+@click.option('--max-lines', default=100, help='Summary budget (the tool result limit)')
+@click.option('--llm', is_flag=True, default=False, help='Also time the summarizer agent (needs an API key)')
+def main(max_lines, llm):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    lines = []
+    for path in sorted(glob.glob(os.path.join(root, "**", "*.py"), recursive=True)):
+        with open(path, encoding="utf-8") as f:
+            lines += [f"==> {os.path.relpath(path, root)} <=="] + f.read().splitlines()
+    for size in (MAX_SUMMARIZER_INPUT_LINES, len(lines)):
+        results = {}
+        modes = ("local", "llm") if llm else ("local",)
+        for mode in modes:
+            with timed(mode, results):
+                summary = asyncio.run(summarize_tool_output(lines[:size], INTENTION, max_lines=max_lines, mode=mode))
+        print(f"{size} lines -> {len(summary)}: " + " ".join(f"{mode}={results[mode] * 1000:.0f}ms" for mode in modes))
+
+
+if __name__ == '__main__':
+    main()
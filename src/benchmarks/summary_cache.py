@@ -0,0 +1,43 @@
+"""
+A repeated summarization (the same directory listing and intention twice, e.g. in a new session)
+with a stand-in summarizer model of the given latency: time of the first call and of the repeat,
+answered from the on-disk summary cache.
+
+    CODESEARCH_API_KEY=dummy python -m src.benchmarks.summary_cache [--entries N] [--model-latency S]
+"""
+import asyncio
+import tempfile
+
+import click
+
+from . import timed
+from ..summarize_agent import cache, main_agent
+
+
+@click.command()
+@click.option('--entries', default=1000, help='Lines of the directory listing')
+@click.option('--model-latency', default=3.0, help='Seconds the stand-in model takes per summary')
+def main(entries, model_latency):
+    class _Result:
+        def __init__(self, summary):
+            self.data = type("Output", (), {"summary": summary})()
+
+    async def run(prompt, deps):
+        await asyncio.sleep(model_latency)
+        return _Result("\n".join(prompt.splitlines()[2:2 + deps.max_lines]))
+
+    main_agent.summarizer.run = run
+    listing = [f'{{"path": "src/pkg_{i // 50}/module_{i}.py", "type": "file", "size": {i * 37}}}' for i in range(entries)]
+    with tempfile.TemporaryDirectory() as tmpdir:
+        results = {}
+        for label in ("first", "repeat", "restart"):
+            if label != "repeat":
+                cache._cache = cache.SummaryCache(tmpdir)
+            with timed(label, results):
+                asyncio.run(main_agent.summarize_tool_output(listing, "Find the largest modules", max_lines=50, mode="llm"))
+        print(f"{entries}-line listing, model latency {model_latency:.1f}s: " +
+              " ".join(f"{label}={seconds * 1000:.1f}ms" for label, seconds in results.items()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Tag queries through the in-process TagsIndex versus one `readtags -e -n` process per query, on a
+synthetic sorted tags file (or an existing one). The readtags column is skipped if readtags is
+not installed; when it is, the outputs of both paths are compared as well.
+
+    CODESEARCH_API_KEY=dummy python -m src.benchmarks.tags_lookup --tags 2000000
+"""
+import os
+import random
+import shutil
+import subprocess
+import tempfile
+
+import click
+
+from . import timed
+from ..tools.tags_index import TagsIndex
+
+KINDS = ["f", "c", "m", "v"]
+
+
+def make_tags_file(path: str, tags: int, seed: int = 0) -> None:
+    rng = random.Random(seed)
+    words = ["get", "set", "load", "parse", "Request", "Handler", "cache", "index", "Tree", "node"]
+    lines = []
+    for i in range(tags):
+        name = "".join(rng.choice(words) for _ in range(3)) + str(i % 997)
+        file_name = f"src/module_{i % 5000}.py"
+        kind = KINDS[i % len(KINDS)]
+        lines.append(f"{name}\t{file_name}\t/^def {name}(self):$/;\"\t{kind}\tline:{i % 3000 + 1}\tclass:Owner{i % 50}")
+    lines.sort()
+    with open(path, "w") as f:
+        f.write("!_TAG_FILE_FORMAT\t2\t/extended format/\n")
+        f.write("!_TAG_FILE_SORTED\t1\t/0=unsorted, 1=sorted, 2=foldcase/\n")
+        f.write("\n".join(lines) + "\n")
+
+
+def queries(index: TagsIndex):
+    """Query name -> (readtags arguments, native query), mirroring CtagsTool's filter action."""
+    name = index.name(len(index) // 2)
+    return {
+        "exact": (["-i", name], lambda: index.lookup(name, ignore_case=True)),
+        "exact+kind": (["-i", name, "-Q", '(eq? $kind "f")'],
+                       lambda: [i for i in index.lookup(name, ignore_case=True) if index.entry(i).kind == "f"]),
+        "regex": (["-Q", '(#/^parse.*Tree/ $name)', "-l"], lambda: index.search("^parse.*Tree")),
+        "kind": (["-Q", '(eq? $kind "c")', "-l"], lambda: index.of_kind("c")),
+    }
+
+
+@click.command()
+@click.option('--tags', default=1_000_000, help='Number of tags in the synthetic tags file')
+@click.option('--tags-file', default=None, help='Use an existing tags file instead')
+def main(tags, tags_file):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        if tags_file is None:
+            tags_file = os.path.join(tmpdir, "tags")
+            make_tags_file(tags_file, tags)
+        print(f"tags file: {os.path.getsize(tags_file) / 2**20:.0f}MiB")
+
+        results = {}
+        with timed("index", results):
+            index = TagsIndex(tags_file)
+        print(f"{'index build':<12} native={results['index']:.3f}s ({len(index)} tags)")
+
+        readtags = shutil.which("readtags")
+        for label, (args, query) in queries(index).items():
+            with timed("cold", results):
+                native = index.format(query())
+            with timed("warm", results):
+                index.format(query())
+            line = f"{label:<12} native cold={results['cold']:.4f}s warm={results['warm']:.4f}s results={len(native)}"
+            if readtags:
+                with timed("readtags", results):
+                    output = subprocess.run([readtags, "-t", tags_file, "-e", "-n"] + args,
+                                            stdout=subprocess.PIPE, text=True, check=True).stdout
+                expected = [row.strip() for row in output.splitlines() if row.strip()]
+                line += f" readtags={results['readtags']:.4f}s same_output={expected == [row.strip() for row in native]}"
+            else:
+                line += " readtags=not installed"
+            print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+"""
+Per-command latency of the terminal tool spawning a process per call versus the persistent shell
+session, for a few short commands typical of an agent session.
+
+    CODESEARCH_API_KEY=dummy python -m src.benchmarks.terminal_shell [--runs N]
+"""
+import asyncio
+import os
+import statistics
+import time
+
+import click
+
+from ..tools.shell_session import stop_shell_sessions
+from ..tools.terminal import TerminalTool
+
+COMMANDS = ["ls", "git rev-parse HEAD", "find . -maxdepth 2 -name '*.py' | head -20", "echo done"]
+
+
+async def measure(persistent_shell: bool, runs: int):
+    tool = TerminalTool()
+    timings = {command: [] for command in COMMANDS}
+    await tool._run("benchmark", "true", root_dir=os.getcwd(), persistent_shell=persistent_shell)  # warm up
+    for _ in range(runs):
+        for command in COMMANDS:
+            start = time.perf_counter()
+            await tool._run("benchmark", command, root_dir=os.getcwd(), persistent_shell=persistent_shell)
+            timings[command].append(time.perf_counter() - start)
+    await stop_shell_sessions()
+    return timings
+
+
+@click.command()
+@click.option('--runs', default=50, help='Runs per command')
+def main(runs):
+    spawn = asyncio.run(measure(False, runs))
+    session = asyncio.run(measure(True, runs))
+    for command in COMMANDS:
+        print(f"{command!r:<48} spawn={statistics.median(spawn[command]) * 1000:.2f}ms "
+              f"session={statistics.median(session[command]) * 1000:.2f}ms (median of {runs})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+"""
+Wall-clock time of one model response with several independent tool calls (terminal commands
+that wait on I/O, a directory listing, a search), all approved: calls run one at a time
+(concurrency 1, as with the former global lock) versus concurrently.
+
+    CODESEARCH_API_KEY=dummy python -m src.benchmarks.tool_concurrency [--commands N]
+"""
+import asyncio
+import contextlib
+import io
+import tempfile
+
+import click
+
+from . import make_synthetic_tree, timed
+from ..tools import base
+from ..tools.directory import DirectoryTool
+from ..tools.search import SearchTool
+from ..tools.terminal import TerminalTool
+
+
+async def _approve_all(calls):
+    return set(range(len(calls)))
+
+
+async def _response(root: str, commands: int, concurrency: int) -> None:
+    base._batcher = base.ApprovalBatcher(concurrency)
+    calls = [
+        TerminalTool().run("benchmark", command="sleep 0.3", root_dir=root) for i in range(commands)
+    ] + [
+        DirectoryTool().run("benchmark", path=root, limit=10000, max_depth=None, exclude_dirs=[]),
+        SearchTool().run("benchmark", pattern="dir_3", path=root, limit=10000),
+    ]
+    await asyncio.gather(*calls)
+
+
+@click.command()
+@click.option('--commands', default=3, help='Terminal commands in the response')
+def main(commands):
+    base.ask_in_terminal = _approve_all
+    with tempfile.TemporaryDirectory() as tmpdir:
+        files = make_synthetic_tree(tmpdir, fanout=6, depth=3, files_per_dir=10)
+        results = {}
+        for concurrency in (1, 4):
+            with timed(concurrency, results), contextlib.redirect_stdout(io.StringIO()):
+                asyncio.run(_response(tmpdir, commands, concurrency))
+        print(f"{commands} commands + directory + search over {files} files: "
+              f"sequential={results[1] * 1000:.0f}ms concurrent={results[4] * 1000:.0f}ms")
+
+
+if __name__ == '__main__':
+    main()
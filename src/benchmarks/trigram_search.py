@@ -0,0 +1,64 @@
+"""
+Search tool queries with and without the trigram index on the synthetic Python tree of the ctags
+benchmark (with a rare identifier planted in a few files) or on PATH. Also reports the index build
+time, the compressed size on disk and a refresh after editing one file.
+
+    CODESEARCH_API_KEY=dummy python -m src.benchmarks.trigram_search [PATH]
+"""
+import os
+import tempfile
+
+import click
+
+from . import timed
+from .ctags_shards import make_python_sources
+from ..tools import search
+from ..tools.ctags import list_source_files
+from ..tools.search import SearchTool
+from ..tools.trigram import get_trigram_index
+
+QUERIES = [("rare_marker_", False), (r"def (open|close)_session_\w+", True), ("method_7(", False)]
+
+
+@click.command()
+@click.argument('path', required=False)
+def main(path):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        if path is None:
+            path = os.path.join(tmpdir, "repo")
+            os.mkdir(path)
+            make_python_sources(path)
+            for i, rel_path in enumerate(sorted(list_source_files(path))[::97]):
+                with open(os.path.join(path, rel_path), "a") as f:
+                    f.write(f"\ndef {('open', 'close')[i % 2]}_session_{i}():\n    return 'rare_marker_{i}'\n")
+
+        results = {}
+        index = get_trigram_index(path)
+        with timed("build", results):
+            index.refresh()
+        index.save_if_dirty()
+        with timed("refresh", results):
+            index.refresh()
+        print(f"index   build={results['build']:.2f}s files={len(index.file_ids)} trigrams={len(index.postings)} "
+              f"on_disk={os.path.getsize(index.index_path) / 2**20:.1f}MiB refresh_unchanged={results['refresh']:.3f}s")
+
+        tool = SearchTool()
+        threshold = search.TRIGRAM_INDEX_MIN_BYTES
+        for pattern, is_regex in QUERIES:
+            try:
+                search.TRIGRAM_INDEX_MIN_BYTES = float("inf")
+                with timed("scan", results):
+                    scanned = tool._run("benchmark", pattern, path, is_regex=is_regex, workers=1)
+                search.TRIGRAM_INDEX_MIN_BYTES = 0
+                with timed("indexed", results):
+                    indexed = tool._run("benchmark", pattern, path, is_regex=is_regex, workers=1)
+            finally:
+                search.TRIGRAM_INDEX_MIN_BYTES = threshold
+            candidates = index.candidates(pattern.encode() if is_regex else search.re.escape(pattern).encode())
+            print(f"{pattern!r:<36} scan={results['scan'] * 1000:.0f}ms indexed={results['indexed'] * 1000:.0f}ms "
+                  f"candidates={len(candidates) if candidates is not None else 'all'} "
+                  f"same_results={scanned['items'] == indexed['items']} ({indexed['total_count']})")
+
+
+if __name__ == '__main__':
+    main()
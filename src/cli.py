@@ -39,9 +39,12 @@ logger = logging.getLogger(__name__)
 @click.option('--verbose', is_flag=True, default=False, help='Enable verbose output')
 @click.option('--root-dir', default='.', help='Root directory to explore')
 @click.option('--tools-result-limit', default=100, help='Maximum number of results (lines) to return for tools')
-def main(verbose, root_dir, tools_result_limit):
+@click.option('--watch', is_flag=True, default=False, help='Watch the root directory and update the directory snapshot and tags incrementally')
+@click.option('--yes-read-only', is_flag=True, default=False, help='Run tool calls that only read the project (and read-only terminal commands) without asking')
+@click.option('--approval-policy', default=None, type=click.Path(exists=True, dir_okay=False), help='JSON file of allow/deny rules that decide tool calls without asking')
+def main(verbose, root_dir, tools_result_limit, watch, yes_read_only, approval_policy):
     """Main entry point for codesearch CLI."""
-    return asyncio.run(async_main(verbose, root_dir, tools_result_limit))
+    return asyncio.run(async_main(verbose, root_dir, tools_result_limit, watch, yes_read_only, approval_policy))
 
 def print_token_usage(current_cost, total_cost):
     """Print token usage statistics and costs."""
@@ -93,6 +96,7 @@ async def run_interactive_session(deps):
 
         from .agent.main_agent import agent
 
+        deps.read_history.next_turn()
 
         agent_output = await agent.run(
             prompt_to_use,
@@ -118,15 +122,33 @@ async def run_interactive_session(deps):
         for msg in previous_messages:
             logger.info(f"Message: {msg}")
 
-async def async_main(verbose, root_dir, tools_result_limit):
+async def async_main(verbose, root_dir, tools_result_limit, watch=False, yes_read_only=False, approval_policy=None):
     """Main entry point for codesearch CLI."""
     logger.info("Starting codesearch")
     try:
+        if yes_read_only or approval_policy:
+            from .tools.approval_policy import ApprovalPolicy, set_approval_policy
+            set_approval_policy(ApprovalPolicy.load(approval_policy, root_dir, read_only=yes_read_only))
+        if watch:
+            from .tools.directory import DEFAULT_EXCLUDE_DIRS
+            from .tools.watcher import start_watcher
+            start_watcher(root_dir, DEFAULT_EXCLUDE_DIRS)
         deps = Deps(limit=tools_result_limit, project_root=root_dir, verbose=verbose)
         await run_interactive_session(deps)
     except Exception as e:
         logger.error(f"An error occurred: {str(e)}", exc_info=True)
         colored_print(f"Error: {str(e)}", color="RED")
+    finally:
+        from .tools.references import save_reference_indexes
+        from .tools.shell_session import stop_shell_sessions
+        from .tools.snapshot import save_snapshots
+        from .tools.trigram import save_trigram_indexes
+        from .tools.watcher import stop_watchers
+        stop_watchers()
+        await stop_shell_sessions()
+        save_snapshots()
+        save_reference_indexes()
+        save_trigram_indexes()
 
 if __name__ == "__main__":
     main()  # This will now properly handle the async execution
@@ -49,6 +49,7 @@ def handle_command(command: str, previous_messages: list, messages_json: Optiona
             colored_print("  /add-context - Add text to chat history", color="CYAN", colorize_all=True)
             colored_print("  /copy        - Copy latest message to clipboard", color="CYAN", colorize_all=True)
             colored_print("  /copy-all    - Copy all messages as formatted JSON to clipboard", color="CYAN", colorize_all=True)
+            colored_print("  /cache-stats - Show file, terminal command and summary cache hits and misses", color="CYAN", colorize_all=True)
             print_blue_line()
             return CommandResult(
                 type=CommandType.CONTINUE,
@@ -122,6 +123,20 @@ def handle_command(command: str, previous_messages: list, messages_json: Optiona
                 messages=previous_messages
             )
 
+        case '/cache-stats':
+            from src.tools.command_cache import command_cache_stats
+            from src.tools.file_cache import get_file_cache
+            from src.summarize_agent.cache import get_summary_cache
+            stats = get_file_cache().stats() + (command_cache_stats() or ["No terminal commands were run yet"])
+            stats += get_summary_cache().stats()
+            for line in stats:
+                colored_print(line, color="CYAN", colorize_all=True)
+            print_blue_line()
+            return CommandResult(
+                type=CommandType.CONTINUE,
+                messages=previous_messages
+            )
+
         case '/copy-all':
             if not previous_messages:
                 colored_print("No messages to copy", color="RED", colorize_all=True)
@@ -5,5 +5,49 @@ API_KEY = os.getenv("CODESEARCH_API_KEY")
 #MODEL = os.getenv("CODESEARCH_MODEL", "claude-3-5-sonnet-latest")
 MODEL = os.getenv("CODESEARCH_MODEL", "claude-3-5-sonnet-latest")
 
+# Number of scandir worker threads used by the directory tool (1 = single-threaded recursion)
+DIRECTORY_WORKERS = int(os.getenv("CODESEARCH_DIRECTORY_WORKERS", min(32, (os.cpu_count() or 1) + 4)))
+
+# Number of parallel ctags processes for a full generate_tags (1 = one ctags over all files)
+CTAGS_WORKERS = int(os.getenv("CODESEARCH_CTAGS_WORKERS", os.cpu_count() or 1))
+
+# Number of worker processes of the search tool (1 = search in-process)
+SEARCH_WORKERS = int(os.getenv("CODESEARCH_SEARCH_WORKERS", os.cpu_count() or 1))
+
+# Wall-clock timeout (seconds) and output cap (bytes) of a terminal tool command
+TERMINAL_TIMEOUT = float(os.getenv("CODESEARCH_TERMINAL_TIMEOUT", 60))
+TERMINAL_MAX_BYTES = int(os.getenv("CODESEARCH_TERMINAL_MAX_BYTES", 4 * 1024 * 1024))
+# Run terminal commands in one long-lived shell per project instead of a new process per command
+TERMINAL_PERSISTENT_SHELL = os.getenv("CODESEARCH_PERSISTENT_SHELL", "0").lower() in ("1", "true", "yes")
+
+# Size bound (bytes) of the on-disk cache of read-only terminal command results (0 = disabled)
+TERMINAL_CACHE_MAX_BYTES = int(os.getenv("CODESEARCH_TERMINAL_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+
+# How tool output longer than the limit is summarized: "llm", "local" (extractive, no model call)
+# or "auto" (local unless its confidence is below SUMMARIZER_MIN_CONFIDENCE, then llm)
+SUMMARIZER_MODE = os.getenv("CODESEARCH_SUMMARIZER_MODE", "auto")
+SUMMARIZER_MIN_CONFIDENCE = float(os.getenv("CODESEARCH_SUMMARIZER_MIN_CONFIDENCE", 0.5))
+
+# Summarize tool output longer than one chunk (estimated tokens) by map-reduce instead of cutting it
+# at MAX_SUMMARIZER_INPUT_LINES: the chunks are summarized SUMMARIZER_CONCURRENCY at a time, then
+# the partial summaries are merged; output beyond SUMMARIZER_MAX_CHUNKS chunks is still cut
+SUMMARIZER_MAP_REDUCE = os.getenv("CODESEARCH_SUMMARIZER_MAP_REDUCE", "1").lower() in ("1", "true", "yes")
+SUMMARIZER_CHUNK_TOKENS = int(os.getenv("CODESEARCH_SUMMARIZER_CHUNK_TOKENS", 8000))
+SUMMARIZER_CONCURRENCY = int(os.getenv("CODESEARCH_SUMMARIZER_CONCURRENCY", 4))
+SUMMARIZER_MAX_CHUNKS = int(os.getenv("CODESEARCH_SUMMARIZER_MAX_CHUNKS", 64))
+
+# Directory, size bound (bytes, 0 = disabled) and time to live (seconds) of the on-disk cache of
+# summarizer agent results, shared by all projects
+SUMMARY_CACHE_DIR = os.getenv("CODESEARCH_SUMMARY_CACHE_DIR", os.path.join(
+    os.getenv("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache")), "codesearch", "summaries"))
+SUMMARY_CACHE_MAX_BYTES = int(os.getenv("CODESEARCH_SUMMARY_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+SUMMARY_CACHE_TTL = float(os.getenv("CODESEARCH_SUMMARY_CACHE_TTL", 7 * 24 * 3600))
+
+# Number of approved tool calls of one model response that run at the same time
+TOOL_CONCURRENCY = int(os.getenv("CODESEARCH_TOOL_CONCURRENCY", 4))
+
+# Memory budget (bytes) of the in-process cache of file contents shared by the tools
+FILE_CACHE_MAX_BYTES = int(os.getenv("CODESEARCH_FILE_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+
 if not API_KEY:
     raise ValueError("CODESEARCH_API_KEY environment variable is required")
@@ -0,0 +1,167 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from typing import Dict, List, Optional
+
+from ..config.settings import (MODEL, SUMMARIZER_MAX_CHUNKS, SUMMARY_CACHE_DIR, SUMMARY_CACHE_MAX_BYTES,
+                               SUMMARY_CACHE_TTL)
+
+logger = logging.getLogger(__name__)
+
+CACHE_VERSION = 2
+
+
+def normalize_intention(intention: str) -> str:
+    """Intention with case, whitespace and trailing punctuation normalized."""
+    return " ".join(intention.lower().split()).rstrip(".?!")
+
+
+def _is_entry(entry) -> bool:
+    return (isinstance(entry, dict) and isinstance(entry.get("created"), (int, float))
+            and isinstance(entry.get("summary"), list) and all(isinstance(line, str) for line in entry["summary"]))
+
+
+class SummaryCache:
+    """
+    On-disk cache of summarizer agent results, with one file per key in cache_dir (shared by all
+    projects, so it survives restarts), stored as JSON. The key is a hash of the tool output text,
+    the normalized intention, max_lines, total_count, the model and the summarization strategy
+    (map-reduce, its chunk size and chunk cap). Entries expire ttl seconds after they were
+    written; the least recently used ones (by file mtime, which is bumped on every hit) are evicted
+    once the cache grows beyond max_bytes.
+    """
+
+    def __init__(self, cache_dir: str = SUMMARY_CACHE_DIR, max_bytes: int = SUMMARY_CACHE_MAX_BYTES,
+                 ttl: float = SUMMARY_CACHE_TTL):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._sizes: Optional[Dict[str, int]] = None
+        self._lock = threading.Lock()
+
+    def key(self, tool_output: List[str], intention: str, max_lines: int, total_count: Optional[int] = None,
+            map_reduce: bool = False, chunk_tokens: int = 0) -> Optional[str]:
+        """Cache key of a summarization, or None if the cache is disabled."""
+        if self.max_bytes <= 0:
+            return None
+        strategy = f"map_reduce:{chunk_tokens}:{SUMMARIZER_MAX_CHUNKS}" if map_reduce else "single"
+        digest = hashlib.sha256()
+        for part in (str(CACHE_VERSION), MODEL, normalize_intention(intention), str(max_lines), str(total_count),
+                     strategy):
+            digest.update(part.encode("utf-8", errors="surrogateescape") + b"\0")
+        for line in tool_output:
+            digest.update(line.encode("utf-8", errors="surrogateescape") + b"\n")
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[List[str]]:
+        path = os.path.join(self.cache_dir, key)
+        summary = None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            if not _is_entry(entry):
+                raise ValueError("not a summary entry")
+            created, summary = entry["created"], entry["summary"]
+            if time.time() - created > self.ttl:
+                summary = None
+                self._remove(key)
+            else:
+                os.utime(path)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable summary cache entry {path}: {e}")
+            summary = None
+        with self._lock:
+            if summary is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        logger.info(f"Summary cache {'hit' if summary is not None else 'miss'} {key} ({self.hits} hits, {self.misses} misses)")
+        return summary
+
+    def put(self, key: str, summary: List[str]) -> None:
+        data = json.dumps({"created": time.time(), "summary": list(summary)}, separators=(",", ":")).encode("utf-8")
+        if len(data) > self.max_bytes:
+            return
+        path = os.path.join(self.cache_dir, key)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(f"{path}.tmp", "wb") as f:
+                f.write(data)
+            os.replace(f"{path}.tmp", path)
+        except OSError as e:
+            logger.warning(f"Could not write summary cache entry {path}: {e}")
+            return
+        with self._lock:
+            sizes = self._entry_sizes()
+            sizes[key] = len(data)
+            if sum(sizes.values()) > self.max_bytes:
+                self._evict(sizes)
+
+    def _remove(self, key: str) -> None:
+        try:
+            os.remove(os.path.join(self.cache_dir, key))
+        except OSError:
+            pass
+        with self._lock:
+            if self._sizes is not None:
+                self._sizes.pop(key, None)
+
+    def _entry_sizes(self) -> Dict[str, int]:
+        if self._sizes is None:
+            self._sizes = {}
+            try:
+                with os.scandir(self.cache_dir) as entries:
+                    for entry in entries:
+                        if entry.is_file() and not entry.name.endswith(".tmp"):
+                            self._sizes[entry.name] = entry.stat().st_size
+            except OSError:
+                pass
+        return self._sizes
+
+    def _evict(self, sizes: Dict[str, int]) -> None:
+        recency = []
+        for key in sizes:
+            try:
+                recency.append((os.stat(os.path.join(self.cache_dir, key)).st_mtime_ns, key))
+            except OSError:
+                recency.append((0, key))
+        total = sum(sizes.values())
+        for _, key in sorted(recency):
+            if total <= self.max_bytes:
+                break
+            total -= sizes.pop(key)
+            try:
+                os.remove(os.path.join(self.cache_dir, key))
+            except OSError:
+                pass
+
+    def stats(self) -> List[str]:
+        with self._lock:
+            sizes = self._entry_sizes()
+            total = self.hits + self.misses
+            return [
+                f"Summary cache {self.cache_dir}: {self.hits} hits, {self.misses} misses"
+                f"{f' ({self.hits / total:.0%} hit rate)' if total else ''}, "
+                f"{len(sizes)} entries, {sum(sizes.values()) / 1024:.0f}KiB of {self.max_bytes / 1024:.0f}KiB"
+            ]
+
+
+_cache: Optional[SummaryCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_summary_cache() -> SummaryCache:
+    """Return the process-wide summary cache, creating it on first use."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = SummaryCache()
+        return _cache
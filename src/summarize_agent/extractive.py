@@ -0,0 +1,132 @@
+import math
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# BM25 parameters (term frequency saturation and line length normalization)
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Identifiers and words, split further into their camelCase / snake_case parts
+WORD = re.compile(r"[A-Za-z0-9]+")
+SUB_WORD = re.compile(r"[A-Z]?[a-z]+|[A-Z]+(?![a-z])|\d+")
+# Words of an intention that say what to do rather than what to look for
+STOPWORDS = {
+    "a", "an", "the", "and", "or", "of", "in", "on", "at", "to", "for", "from", "with", "by", "is", "are", "be",
+    "it", "its", "this", "that", "these", "those", "what", "where", "which", "who", "how", "why", "when", "all",
+    "any", "some", "do", "does", "find", "show", "list", "look", "see", "check", "understand", "identify",
+    "get", "read", "search", "locate", "file", "files", "code", "line", "lines", "content", "contents",
+    "project", "there", "if", "into", "about", "used", "use", "uses", "using", "me", "i", "we", "them",
+}
+# Lines that give the selected lines their context: definitions and file / hunk headers
+ANCHOR = re.compile(
+    r"^\s*(?:(?:export\s+|pub\s+|public\s+|private\s+|static\s+|async\s+)*"
+    r"(?:def|class|function|func|fn|struct|interface|impl|enum|trait|module|namespace)\b"
+    r"|diff --git |\+\+\+ |@@ |==> .* <==)"
+)
+
+
+def _stem(word: str) -> str:
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    if len(word) > 5 and word.endswith("ing"):
+        return word[:-3]
+    if len(word) > 4 and word.endswith("ed"):
+        return word[:-2]
+    return word
+
+
+def terms(text: str) -> List[str]:
+    """Lowercased, stemmed words of text: each identifier and its camelCase / snake_case parts."""
+    result = []
+    for word in WORD.findall(text):
+        lower = word.lower()
+        result.append(_stem(lower))
+        parts = SUB_WORD.findall(word)
+        if len(parts) > 1:
+            result.extend(_stem(part.lower()) for part in parts)
+    return result
+
+
+def query_terms(intention: str) -> List[str]:
+    return list(dict.fromkeys(term for term in terms(intention) if term not in STOPWORDS and len(term) > 1))
+
+
+def bm25_scores(lines: Sequence[str], query: Sequence[str]) -> Tuple[Dict[int, float], Dict[str, float], List[bool]]:
+    """
+    BM25 score of every line that contains a query term (lines as documents), the idf of every
+    query term and which lines are anchors. One pass builds the postings of the query terms
+    only; scores are then accumulated per term over its postings, so lines without a query term
+    cost one tokenization and are never scored.
+    """
+    wanted = set(query)
+    postings: Dict[str, Dict[int, int]] = {term: {} for term in query}
+    lengths = []
+    anchors = []
+    for i, line in enumerate(lines):
+        line_terms = terms(line)
+        lengths.append(len(line_terms))
+        anchors.append(ANCHOR.match(line) is not None)
+        for term in wanted.intersection(line_terms):
+            postings[term][i] = line_terms.count(term)
+    count = len(lines)
+    average_length = (sum(lengths) / count) if count else 0.0
+    idf = {term: math.log(1 + (count - len(found) + 0.5) / (len(found) + 0.5)) for term, found in postings.items()}
+    scores: Dict[int, float] = {}
+    for term, found in postings.items():
+        for i, tf in found.items():
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[i] / average_length) if average_length else BM25_K1
+            scores[i] = scores.get(i, 0.0) + idf[term] * tf * (BM25_K1 + 1) / (tf + norm)
+    # Anchors are what the selected lines are located by, they win ties
+    for i in scores:
+        if anchors[i]:
+            scores[i] *= 1.5
+    return scores, {term: idf[term] for term, found in postings.items() if found}, anchors
+
+
+def extractive_summary(lines: Sequence[str], intention: str, max_lines: int,
+                       total_count: Optional[int] = None) -> Tuple[List[str], float]:
+    """
+    Summary of lines without a model call: the lines that score best against the intention
+    (BM25), each with the nearest anchor (definition or file header) above it, in their original
+    order, within max_lines including a header line. Remaining room is filled with anchors.
+
+    The confidence (0-1) is the share of the intention's terms (weighted by idf, terms missing from
+    the output count fully) times the share of the matching lines that fit into the summary: low
+    when the intention does not name what it is looking for, or when too much of it matches.
+    """
+    query = query_terms(intention)
+    scores, found_idf, anchors = bm25_scores(lines, query)
+    budget = max(max_lines - 1, 1)
+    selected = set()
+    anchor_above: Dict[int, Optional[int]] = {}
+    last_anchor = None
+    for i, is_anchor in enumerate(anchors):
+        if i in scores:
+            anchor_above[i] = last_anchor
+        if is_anchor:
+            last_anchor = i
+
+    for i in sorted(scores, key=lambda i: (-scores[i], i)):
+        wanted = {i}
+        if anchor_above[i] is not None:
+            wanted.add(anchor_above[i])
+        if len(selected) + len(wanted - selected) > budget:
+            continue
+        selected |= wanted
+    kept = sum(1 for i in scores if i in selected)
+    for i, is_anchor in enumerate(anchors):
+        if len(selected) >= budget:
+            break
+        if is_anchor:
+            selected.add(i)
+
+    missing_weight = math.log(1 + (len(lines) + 0.5) / 0.5)  # the idf of a term found on no line
+    query_weight = sum(found_idf.get(term, missing_weight) for term in query)
+    coverage = sum(found_idf.values()) / query_weight if query_weight else 0.0
+    recall = kept / len(scores) if scores else 0.0
+
+    original_length = max(total_count or 0, len(lines))
+    header = (f"The tool result output was too long ({original_length} lines), here are the {len(selected)} lines "
+              f"most relevant to the intention, in their original order:")
+    return [header] + [lines[i] for i in sorted(selected)], coverage * recall
@@ -1,17 +1,32 @@
 from __future__ import annotations
 
+import asyncio
 import logging
-from typing import List
+import time
+from typing import List, Optional
 
 from pydantic_ai import Agent, RunContext
 from pydantic_ai.models.anthropic import AnthropicModel
 
-from .prompts import SYSTEM_PROMPT, USER_PROMPT
+from .cache import get_summary_cache
+from .extractive import extractive_summary
+from .prompts import REDUCE_PROMPT, SYSTEM_PROMPT, USER_PROMPT
 from .schemas import SummarizerDeps, SummarizerOutput
-from ..config.settings import API_KEY, MODEL
+from ..config.settings import (API_KEY, MODEL, SUMMARIZER_CHUNK_TOKENS, SUMMARIZER_CONCURRENCY, SUMMARIZER_MAP_REDUCE,
+                               SUMMARIZER_MAX_CHUNKS, SUMMARIZER_MIN_CONFIDENCE, SUMMARIZER_MODE)
 
 logger = logging.getLogger(__name__)
 
+# Tool output beyond this number of lines is cut before it is sent to the summarizer (without map-reduce)
+MAX_SUMMARIZER_INPUT_LINES = 1000
+# Rough size of a token, to bound the chunks of map-reduce summarization without a tokenizer
+CHARS_PER_TOKEN = 4
+# Most tool output the summarizer takes in, where the tools stop collecting output: with map-reduce
+# SUMMARIZER_MAX_CHUNKS full chunks (every line takes at least one character of a chunk, so they
+# bound the lines as well), else the first MAX_SUMMARIZER_INPUT_LINES lines (no byte cap)
+MAX_TOOL_OUTPUT_BYTES = SUMMARIZER_MAX_CHUNKS * SUMMARIZER_CHUNK_TOKENS * CHARS_PER_TOKEN if SUMMARIZER_MAP_REDUCE else None
+MAX_TOOL_OUTPUT_LINES = MAX_TOOL_OUTPUT_BYTES if SUMMARIZER_MAP_REDUCE else MAX_SUMMARIZER_INPUT_LINES
+
 summarizer = Agent(
     model=AnthropicModel(
         MODEL,
@@ -27,47 +42,143 @@ async def summarize_tool_output(
     tool_output: List[str],
     intention: str,
     max_lines: int = 200,
-    verbose: bool = False
+    verbose: bool = False,
+    total_count: Optional[int] = None,
+    mode: str = SUMMARIZER_MODE,
+    map_reduce: bool = SUMMARIZER_MAP_REDUCE,
+    chunk_tokens: int = SUMMARIZER_CHUNK_TOKENS,
+    concurrency: int = SUMMARIZER_CONCURRENCY
 ) -> List[str]:
     """
-    Summarize tool output based on the original intention.
+    Summarize tool output based on the original intention. Unless mode is "llm", the lines most
+    relevant to the intention are extracted locally first; in "auto" mode the summarizer agent is
+    only asked if the confidence of that extract is below SUMMARIZER_MIN_CONFIDENCE. Summaries of
+    the agent are kept in the summary cache (see cache.SummaryCache). With map_reduce, output longer
+    than one chunk is summarized chunk by chunk (concurrency chunks at a time) and the partial
+    summaries are merged, instead of cutting it at MAX_SUMMARIZER_INPUT_LINES.
 
     Args:
         tool_output: The raw output from a tool execution
         intention: The original intention why the tool was called
         max_lines: Maximum number of lines for the summary
         verbose: Enable verbose output
+        total_count: Number of lines of the complete output, if the tool only returned a prefix of it
+        mode: "llm", "local" or "auto"
+        map_reduce: Summarize all of the output in chunks instead of its first MAX_SUMMARIZER_INPUT_LINES lines
+        chunk_tokens: Estimated size (tokens) of a map-reduce chunk
+        concurrency: Number of chunks summarized at the same time
 
     Returns:
         List of strings containing the summarized tool output
     """
+    if mode != "llm":
+        start = time.perf_counter()
+        summary, confidence = extractive_summary(tool_output, intention, max_lines, total_count)
+        logger.info(f"Local summary of {len(tool_output)} lines: {len(summary)} lines, confidence {confidence:.2f}, "
+                    f"{(time.perf_counter() - start) * 1000:.1f}ms")
+        if mode == "local" or confidence >= SUMMARIZER_MIN_CONFIDENCE:
+            return summary
+
+    cache = get_summary_cache()
+    cache_key = cache.key(tool_output, intention, max_lines, total_count,
+                          map_reduce=map_reduce, chunk_tokens=chunk_tokens)
+    if cache_key is not None:
+        summary = cache.get(cache_key)
+        if summary is not None:
+            return summary
+
     deps = SummarizerDeps(max_lines=max_lines, verbose=verbose)
+    original_length = max(total_count or 0, len(tool_output))
+    chunks = chunk_lines(tool_output, chunk_tokens) if map_reduce else [tool_output]
+
+    try:
+        prefix = f"The tool result output was too long ({original_length} lines), here is a summarization: \n"
+        start = time.perf_counter()
+        if len(chunks) > 1:
+            text = await _map_reduce(chunks, intention, max_lines, deps, original_length, chunk_tokens, concurrency)
+        else:
+            text = await _summarize_part(chunks[0], intention, max_lines, deps, original_length,
+                                         truncate=not map_reduce)
+        logger.info(f"Summarizer agent summary of {len(tool_output)} lines in {len(chunks)} chunks: "
+                    f"{(time.perf_counter() - start) * 1000:.0f}ms")
+        summary = (prefix + text).splitlines()
+        if cache_key is not None:
+            cache.put(cache_key, summary)
+        return summary
+    except Exception as e:
+        logger.error(f"Error in summarizer agent: {str(e)}")
+        return f"Error summarizing output: {str(e)}"
 
-    # Truncate if more than 1000 lines
-    was_truncated = False
-    original_length = len(tool_output)
-    if original_length > 1000:
-        tool_output = tool_output[:1000]
-        was_truncated = True
-        if verbose:
-            logger.info(f"Tool output truncated from {original_length} to 1000 lines")
 
-    # Convert list of lines to single string
-    output_text = "\n".join(tool_output)
+def chunk_lines(lines: List[str], max_tokens: int) -> List[List[str]]:
+    """
+    Split lines into consecutive chunks of at most max_tokens (estimated) each, cutting single
+    lines that are longer than a chunk. Lines beyond SUMMARIZER_MAX_CHUNKS chunks are dropped.
+    """
+    max_chars = max(max_tokens, 1) * CHARS_PER_TOKEN
+    chunks: List[List[str]] = [[]]
+    size = 0
+    for line in lines:
+        line = line[:max_chars]
+        if chunks[-1] and size + len(line) + 1 > max_chars:
+            if len(chunks) == SUMMARIZER_MAX_CHUNKS:
+                logger.info(f"Tool output cut after {SUMMARIZER_MAX_CHUNKS} chunks of {max_tokens} tokens")
+                break
+            chunks.append([])
+            size = 0
+        chunks[-1].append(line)
+        size += len(line) + 1
+    return chunks
 
-    # Prepare prompt with actual content
+
+async def _summarize_part(lines: List[str], intention: str, max_lines: int, deps: SummarizerDeps,
+                          original_length: int, part: str = "", truncate: bool = False) -> str:
+    notice = part
+    if truncate and original_length > MAX_SUMMARIZER_INPUT_LINES:
+        lines = lines[:MAX_SUMMARIZER_INPUT_LINES]
+        notice = f"(Note: Output was truncated from {original_length} to {MAX_SUMMARIZER_INPUT_LINES} lines)"
+        if deps.verbose:
+            logger.info(f"Tool output truncated from {original_length} to {MAX_SUMMARIZER_INPUT_LINES} lines")
     prompt = USER_PROMPT.format(
-        tool_output=output_text,
+        tool_output="\n".join(lines),
         intention=intention,
         max_lines=max_lines,
-        truncation_notice=f"(Note: Output was truncated from {original_length} to 1000 lines)" if was_truncated else ""
+        truncation_notice=notice
     )
+    result = await summarizer.run(prompt, deps=deps)
+    return result.data.summary
 
-    try:
-        prefix = f"The tool result output was too long ({original_length} lines), here is a summarization: \n"
-        result = await summarizer.run(prompt, deps=deps)
-        result.data.summary = prefix + result.data.summary
-        return result.data.summary.splitlines()
-    except Exception as e:
-        logger.error(f"Error in summarizer agent: {str(e)}")
-        return f"Error summarizing output: {str(e)}"
+
+async def _map_reduce(chunks: List[List[str]], intention: str, max_lines: int, deps: SummarizerDeps,
+                      original_length: int, chunk_tokens: int, concurrency: int) -> str:
+    """Summarize the chunks concurrently, then merge the partial summaries (in rounds, while they do not fit one prompt)."""
+    slots = asyncio.Semaphore(max(concurrency, 1))
+
+    async def limited(coroutine):
+        async with slots:
+            return await coroutine
+
+    first_line = 1
+    parts = []
+    for i, chunk in enumerate(chunks, 1):
+        label = f"part {i} of {len(chunks)}: lines {first_line}-{first_line + len(chunk) - 1} of {original_length}"
+        parts.append(_summarize_part(chunk, intention, max_lines, deps, original_length, part=label))
+        first_line += len(chunk)
+    partials = await asyncio.gather(*(limited(part) for part in parts))
+
+    while True:
+        labelled = [f"Part {i}:\n{partial}" for i, partial in enumerate(partials, 1)]
+        groups = chunk_lines(labelled, chunk_tokens)
+        if len(groups) == len(partials):
+            # Partial summaries too long to merge two at a time: merge them all at once
+            groups = [labelled]
+        reduces = [summarizer.run(REDUCE_PROMPT.format(
+            original_length=original_length,
+            partial_summaries="\n\n".join(group),
+            intention=intention,
+            max_lines=max_lines
+        ), deps=deps) for group in groups]
+        results = await asyncio.gather(*(limited(reduce) for reduce in reduces))
+        partials = [result.data.summary for result in results]
+        if len(partials) == 1:
+            return partials[0]
@@ -36,3 +36,13 @@ Original intention of the tool call:
 
 Please extract/distill the relevant parts in {max_lines} lines or less.
 '''
+
+REDUCE_PROMPT = '''
+Summaries of the consecutive parts of one tool output ({original_length} lines), each distilled for the same intention:
+{partial_summaries}
+
+Original intention of the tool call:
+{intention}
+
+Please merge them into one summary of the whole output in {max_lines} lines or less. Keep the paths and line numbers the parts mention.
+'''
@@ -1,7 +1,40 @@
-from src.tools.base import BaseTool
-from src.tools.directory import DirectoryTool
+from src.tools import base
+from src.tools import directory
+from src.tools.approval_policy import ApprovalPolicy, set_approval_policy
+from src.tools.base import BaseTool, ToolAbortedException, parse_approval
+from src.tools.directory import DEFAULT_EXCLUDE_DIRS, DirectoryEntries, DirectoryTool, entry_to_json
+from src.summarize_agent import main_agent as summarizer_agent
+from src.summarize_agent import cache as summary_cache
+from src.summarize_agent.cache import SummaryCache
+from src.summarize_agent.extractive import extractive_summary
+from src.summarize_agent.main_agent import MAX_SUMMARIZER_INPUT_LINES, summarize_tool_output
+from src.tools.ignore import DirectoryIgnore, ExcludeMatcher
+from src.tools.snapshot import INDEX_DIR, SNAPSHOT_FILE, DirectorySnapshot
+from src.tools.watcher import ChangeLog, FileWatcher, start_watcher, stop_watchers
+from src.tools.ctags import CtagsTool, list_source_files, merge_tags_files, shard_files, splice_tags
+from src.tools.tags_index import TagsIndex
+from src.tools.terminal import TerminalTool
+from src.tools import search
+from src.tools.search import SearchTool, required_literal
+from src.tools.trigram import TRIGRAMS_VERSION, TrigramIndex, regex_query
+from src.tools.command_cache import CommandCache, is_read_only
+from src.tools.shell_session import ShellSession, stop_shell_sessions
+from src.tools.file_reader import FileReaderTool
+from src.tools.file_cache import FileCache, get_line_index
+from src.tools.file_kind import classify_content, classify_name
+from src.tools.read_history import ReadHistory
+from src.tools.references import ReferenceIndex, decode_blocks, encode_block, read_index, tokenize
+from datetime import datetime
+import asyncio
+import pytest
+import json
+import pickle
+import shutil
+import subprocess
 import tempfile
+import time
 import os
+import re
 
 class MockTool(BaseTool):
     def run(self, **kwargs):
@@ -20,3 +53,1015 @@ def test_directory_tool():
         assert "files" in result and "dirs" in result
         assert "file.txt" in result["files"]
         assert len(result["dirs"]) == 1
+
+def _make_tree(root):
+    for rel_dir in ["a/b/c", "a/empty", "node_modules/pkg", "d"]:
+        os.makedirs(os.path.join(root, rel_dir))
+    for rel_file in ["top.py", "a/one.py", "a/b/two.txt", "a/b/c/three.py", "node_modules/pkg/index.js", "d/four.md"]:
+        with open(os.path.join(root, rel_file), "w") as f:
+            f.write(rel_file)
+
+def test_directory_tool_parallel_matches_recursive():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        _make_tree(tmpdir)
+        dt = DirectoryTool()
+        for options in [
+            dict(max_depth=None),
+            dict(max_depth=1),
+            dict(max_depth=0),
+            dict(max_depth=None, file_filter="*.py"),
+            dict(max_depth=None, file_filter="*.py", hide_empty_folder=True),
+            dict(max_depth=2, hide_empty_folder=True),
+        ]:
+            recursive = dt._run("test", path=tmpdir, exclude_dirs=["node_modules"], workers=1, **options)
+            parallel = dt._run("test", path=tmpdir, exclude_dirs=["node_modules"], workers=4, **options)
+            assert parallel == recursive
+            assert not any("node_modules" in item for item in parallel["items"])
+
+def test_directory_tool_snapshot_refresh():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        tmpdir = os.path.realpath(tmpdir)
+        _make_tree(tmpdir)
+        dt = DirectoryTool()
+        exclude_dirs = DEFAULT_EXCLUDE_DIRS + ["d"]
+
+        cached = dt._run("test", path=tmpdir, exclude_dirs=exclude_dirs, project_root=tmpdir, use_ignore_files=True)
+        live = dt._run("test", path=tmpdir, exclude_dirs=exclude_dirs, workers=1)
+        assert cached == live
+        assert os.path.exists(os.path.join(tmpdir, INDEX_DIR, SNAPSHOT_FILE))
+
+        # A new file and a removed directory are picked up by the incremental refresh
+        with open(os.path.join(tmpdir, "a", "b", "new.py"), "w") as f:
+            f.write("new")
+        os.remove(os.path.join(tmpdir, "a", "b", "c", "three.py"))
+        os.rmdir(os.path.join(tmpdir, "a", "b", "c"))
+        live = dt._run("test", path=tmpdir, exclude_dirs=exclude_dirs, workers=1)
+        cached = dt._run("test", path=tmpdir, exclude_dirs=exclude_dirs, project_root=tmpdir, use_ignore_files=True, file_filter="*.py")
+        assert cached["items"] == dt._run("test", path=tmpdir, exclude_dirs=exclude_dirs, workers=1, file_filter="*.py")["items"]
+        assert any("new.py" in item for item in cached["items"])
+
+        # A fresh snapshot instance answers from the file written to disk
+        snapshot = DirectorySnapshot(tmpdir, DEFAULT_EXCLUDE_DIRS)
+        snapshot.refresh()
+        assert os.path.join(tmpdir, "a", "b") in snapshot.listings
+        assert os.path.join(tmpdir, "a", "b", "c") not in snapshot.listings
+
+        rebuilt = dt._run("test", path=tmpdir, exclude_dirs=exclude_dirs, project_root=tmpdir, use_ignore_files=True, rebuild_snapshot=True)
+        assert rebuilt == live
+
+def test_directory_entries_serialize_lazily():
+    entries = DirectoryEntries()
+    entries.append("/repo/src/main.py", "file", 42, 0.0)
+    entries.append("/repo/src", "directory", 0, 0.0)
+
+    assert len(entries) == 2
+    assert entries[0] == entry_to_json("/repo/src/main.py", "file", 42, datetime.fromtimestamp(0.0).isoformat())
+    assert json.loads(entries[-1])["type"] == "directory"
+    assert entries[:1] == [entries[0]]
+    assert list(entries) == [entries[0], entries[1]]
+
+def test_directory_tool_stream_stops_early(monkeypatch):
+    # The line cap of the summarizer without map-reduce
+    monkeypatch.setattr(directory, "MAX_TOOL_OUTPUT_LINES", MAX_SUMMARIZER_INPUT_LINES)
+    monkeypatch.setattr(directory, "MAX_TOOL_OUTPUT_BYTES", None)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        tmpdir = os.path.realpath(tmpdir)
+        for i in range(30):
+            os.makedirs(os.path.join(tmpdir, f"pkg_{i}"))
+            for j in range(50):
+                open(os.path.join(tmpdir, f"pkg_{i}", f"mod_{j}.py"), "w").close()
+        dt = DirectoryTool()
+        exclude_dirs = list(DEFAULT_EXCLUDE_DIRS)
+
+        streamed_snapshot = dt._run("test", path=tmpdir, limit=10, exclude_dirs=exclude_dirs, project_root=tmpdir, use_ignore_files=True, stream=True)
+        full = dt._run("test", path=tmpdir, exclude_dirs=exclude_dirs, workers=1)
+        streamed = dt._run("test", path=tmpdir, limit=10, exclude_dirs=exclude_dirs, stream=True)
+
+        assert full["total_count"] == 30 * 51 + 1
+        for result in (streamed, streamed_snapshot):
+            assert len(result["items"]) == MAX_SUMMARIZER_INPUT_LINES
+            assert list(result["items"]) == list(full["items"])[:MAX_SUMMARIZER_INPUT_LINES]
+            assert result["total_count"] == full["total_count"]
+            assert not result["is_total_estimated"]
+
+        small = dt._run("test", path=os.path.join(tmpdir, "pkg_0"), limit=100, exclude_dirs=exclude_dirs, stream=True)
+        assert small["total_count"] == len(small["items"]) == 51
+
+        # With map-reduce the walk stops after as much JSON as the summarizer chunks take
+        monkeypatch.setattr(directory, "MAX_TOOL_OUTPUT_LINES", 10 ** 6)
+        monkeypatch.setattr(directory, "MAX_TOOL_OUTPUT_BYTES", 20000)
+        streamed = dt._run("test", path=tmpdir, limit=10, exclude_dirs=exclude_dirs, stream=True)
+        items = list(streamed["items"])
+        assert 10 < len(items) < full["total_count"]
+        assert sum(len(item) + 1 for item in items[:-1]) < 20000
+        assert items == list(full["items"])[:len(items)]
+        assert streamed["total_count"] == full["total_count"]
+
+def test_directory_tool_stream_count_skips_generated_files(monkeypatch):
+    monkeypatch.setattr(directory, "MAX_TOOL_OUTPUT_LINES", 20)
+    monkeypatch.setattr(directory, "MAX_TOOL_OUTPUT_BYTES", None)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for i in range(10):
+            os.makedirs(os.path.join(tmpdir, f"pkg_{i}"))
+            for name in ("mod.py", "util.py", "package-lock.json", "app.min.js"):
+                open(os.path.join(tmpdir, f"pkg_{i}", name), "w").close()
+        dt = DirectoryTool()
+        full = dt._run("test", path=tmpdir, exclude_dirs=[], workers=1)
+        streamed = dt._run("test", path=tmpdir, limit=5, exclude_dirs=[], stream=True)
+
+        assert full["total_count"] == 10 * 3 + 1
+        assert len(streamed["items"]) == 20
+        assert streamed["total_count"] == full["total_count"] and not streamed["is_total_estimated"]
+
+def test_exclude_matcher_supports_globs():
+    exclude = ExcludeMatcher(["node_modules", "*nuget*"])
+    assert exclude.matches("node_modules")
+    assert exclude.matches("my.nuget.cache")
+    assert not exclude.matches("src")
+
+def test_ignore_rules_with_negation_and_anchoring():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with open(os.path.join(tmpdir, ".gitignore"), "w") as f:
+            f.write("# comment\n*.log\n!keep.log\n/generated/\ndocs/**/*.tmp\n")
+        os.makedirs(os.path.join(tmpdir, "pkg"))
+        with open(os.path.join(tmpdir, "pkg", ".ignore"), "w") as f:
+            f.write("fixtures/\n")
+
+        root_ignore = DirectoryIgnore().child(tmpdir, [".gitignore"])
+        is_ignored = root_ignore.matcher(tmpdir)
+        assert is_ignored("debug.log", False)
+        assert not is_ignored("keep.log", False)
+        assert is_ignored("generated", True)
+        assert not is_ignored("generated", False)
+
+        pkg = os.path.join(tmpdir, "pkg")
+        is_ignored = root_ignore.child(pkg, [".ignore"]).matcher(pkg)
+        assert is_ignored("generated", True) is False  # anchored to the root .gitignore
+        assert is_ignored("fixtures", True)
+        assert is_ignored("trace.log", False)
+
+        docs = os.path.join(tmpdir, "docs", "api")
+        assert DirectoryIgnore.for_parent_of(os.path.join(docs, "x"), tmpdir).matcher(docs)("page.tmp", False)
+
+def test_directory_tool_prunes_ignored_directories():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        tmpdir = os.path.realpath(tmpdir)
+        _make_tree(tmpdir)
+        os.makedirs(os.path.join(tmpdir, "generated", "deep"))
+        open(os.path.join(tmpdir, "generated", "deep", "huge.txt"), "w").close()
+        open(os.path.join(tmpdir, "a", "debug.log"), "w").close()
+        with open(os.path.join(tmpdir, ".gitignore"), "w") as f:
+            f.write("generated/\n*.log\n")
+
+        dt = DirectoryTool()
+        exclude_dirs = DEFAULT_EXCLUDE_DIRS
+        results = [
+            dt._run("test", path=tmpdir, exclude_dirs=exclude_dirs, use_ignore_files=True, workers=workers)
+            for workers in (1, 4)
+        ]
+        assert results[0] == results[1]
+        paths = [json.loads(item)["path"] for item in results[0]["items"]]
+        assert not any("generated" in p or p.endswith(".log") for p in paths)
+        assert os.path.join(tmpdir, "a", "one.py") in paths
+
+        cached = dt._run("test", path=tmpdir, exclude_dirs=exclude_dirs, use_ignore_files=True, project_root=tmpdir)
+        assert [json.loads(item)["path"] for item in cached["items"]] == paths
+
+        # Editing .gitignore brings the previously ignored subtree into the snapshot
+        with open(os.path.join(tmpdir, ".gitignore"), "w") as f:
+            f.write("*.log\n")
+        cached = dt._run("test", path=tmpdir, exclude_dirs=exclude_dirs, use_ignore_files=True, project_root=tmpdir)
+        assert os.path.join(tmpdir, "generated", "deep", "huge.txt") in list(cached["items"].paths)
+
+def test_change_log_cursors_and_overflow():
+    log = ChangeLog(max_entries=3)
+    start = log.cursor()
+    log.record(["/a", "/b"])
+    cursor, paths = log.changes_since(start)
+    assert paths == {"/a", "/b"}
+    assert log.changes_since(cursor) == (cursor, set())
+
+    log.record_overflow()
+    assert log.changes_since(cursor)[1] is None
+    cursor = log.cursor()
+    log.record(["/c", "/d", "/e", "/f"])
+    # Older entries were dropped, so a consumer that is behind has to do a full refresh
+    assert log.changes_since(cursor)[1] is None
+    assert log.changes_since(cursor + 1)[1] == {"/d", "/e", "/f"}
+
+def _wait_for_changes(watcher, cursor, expected):
+    deadline = time.monotonic() + 5
+    paths = set()
+    while time.monotonic() < deadline:
+        watcher.flush()
+        cursor, new = watcher.change_log.changes_since(cursor)
+        paths |= new or set()
+        if expected <= paths:
+            break
+        time.sleep(0.05)
+    return paths
+
+def test_file_watcher_reports_changes():
+    for use_inotify in (True, False):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir = os.path.realpath(tmpdir)
+            _make_tree(tmpdir)
+            watcher = FileWatcher(tmpdir, DEFAULT_EXCLUDE_DIRS, debounce=0.05, poll_interval=0.05, use_inotify=use_inotify).start()
+            try:
+                cursor = watcher.change_log.cursor()
+                with open(os.path.join(tmpdir, "a", "one.py"), "a") as f:
+                    f.write("changed")
+                os.makedirs(os.path.join(tmpdir, "new", "sub"))
+                open(os.path.join(tmpdir, "new", "sub", "five.py"), "w").close()
+                open(os.path.join(tmpdir, "node_modules", "pkg", "ignored.js"), "w").close()
+                expected = {os.path.join(tmpdir, "a", "one.py"), os.path.join(tmpdir, "new", "sub", "five.py")}
+                paths = _wait_for_changes(watcher, cursor, expected)
+                assert expected <= paths, watcher.backend
+                assert not any("node_modules" in path for path in paths)
+            finally:
+                watcher.stop()
+
+def test_file_watcher_collapses_event_storms():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        watcher = FileWatcher(tmpdir, DEFAULT_EXCLUDE_DIRS, max_batch=10, use_inotify=False)
+        cursor = watcher.change_log.cursor()
+        watcher._add_events(os.path.join(tmpdir, f"f{i}") for i in range(50))
+        watcher.flush()
+        assert watcher.change_log.changes_since(cursor)[1] is None
+
+def test_snapshot_applies_watcher_changes():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        tmpdir = os.path.realpath(tmpdir)
+        _make_tree(tmpdir)
+        snapshot = DirectorySnapshot(tmpdir, DEFAULT_EXCLUDE_DIRS, workers=1)
+        watcher = start_watcher(tmpdir, DEFAULT_EXCLUDE_DIRS, debounce=0.05, poll_interval=0.05)
+        try:
+            snapshot.refresh()
+            os.makedirs(os.path.join(tmpdir, "d", "added"))
+            open(os.path.join(tmpdir, "d", "added", "six.py"), "w").close()
+            os.remove(os.path.join(tmpdir, "top.py"))
+            _wait_for_changes(watcher, watcher.change_log.cursor() - 1000, {os.path.join(tmpdir, "d", "added", "six.py")})
+            snapshot.refresh()
+        finally:
+            stop_watchers()
+        expected = DirectorySnapshot(tmpdir, DEFAULT_EXCLUDE_DIRS, workers=1)
+        expected.refresh(force_rebuild=True)
+        assert snapshot.listings == expected.listings
+
+def test_splice_tags_replaces_entries_of_changed_files():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        tags_file = os.path.join(tmpdir, "tags")
+        with open(tags_file, "w") as f:
+            f.write("!_TAG_FILE_SORTED\t1\t/0=unsorted, 1=sorted, 2=foldcase/\n")
+            f.write("alpha\ta.py\t/^def alpha():$/;\"\tf\n")
+            f.write("beta\tgone/b.py\t/^def beta():$/;\"\tf\n")
+            f.write("gamma\tc.py\t/^def gamma():$/;\"\tf\n")
+        # Only deletions, so ctags itself is not needed
+        splice_tags(tags_file, tmpdir, ["gone", "c.py"])
+        with open(tags_file) as f:
+            lines = f.read().splitlines()
+        assert lines[0].startswith("!_TAG_FILE_SORTED")
+        assert [line.split("\t")[0] for line in lines[1:]] == ["alpha"]
+
+_TAGS = [
+    "!_TAG_FILE_FORMAT\t2\t/extended format/",
+    "!_TAG_FILE_SORTED\t1\t/0=unsorted, 1=sorted, 2=foldcase/",
+    "Parser\tsrc/parser.py\t/^class Parser:$/;\"\tc",
+    "parse\tsrc/parser.py\t/^    def parse(self, text):$/;\"\tm\tline:12\tclass:Parser",
+    "parse_args\tsrc/cli.py\t/^def parse_args():$/;\"\tkind:f\tfile:",
+    "tokenize\tsrc/lexer.py\t42;\"\tf",
+]
+
+def test_tags_index_queries_and_readtags_format():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        tags_file = os.path.join(tmpdir, "tags")
+        with open(tags_file, "w") as f:
+            f.write("\n".join(_TAGS) + "\n")
+        index = TagsIndex(tags_file)
+        assert len(index) == 4
+        assert index.lookup("parse") == [1]
+        assert index.lookup("PARSE", ignore_case=True) == [1]
+        assert index.lookup("pars", prefix=True, ignore_case=True) == [0, 1, 2]
+        assert index.lookup("parse", prefix=True) == [1, 2]
+        assert index.search("^parse") == [1, 2]
+        assert index.search("e$", kind="f") == [3]
+        assert list(index.of_kind("f")) == [2, 3]
+        assert index.format([1, 2, 3]) == [
+            "parse\tsrc/parser.py\t/^    def parse(self, text):$/;\"\tkind:m\tline:12\tclass:Parser",
+            "parse_args\tsrc/cli.py\t/^def parse_args():$/;\"\tkind:f\tfile:",
+            "tokenize\tsrc/lexer.py\t42;\"\tkind:f\tline:42",
+        ]
+
+        # CtagsTool filter queries are answered from the index
+        tool = CtagsTool()
+        result = tool._run("test", action="filter", input_path=tmpdir, symbol="parser", kind="c")
+        assert result["items"] == ["Parser\tsrc/parser.py\t/^class Parser:$/;\"\tkind:c"]
+        result = tool._run("test", action="filter", input_path=tmpdir, symbol="[", is_symbol_regex=True)
+        assert result["items"] == []
+
+@pytest.mark.skipif(shutil.which("ctags") is None or shutil.which("git") is None, reason="needs ctags and git")
+def test_generate_tags_is_incremental():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        sources = {"a.py": "def alpha():\n    pass\n", "b.py": "def beta():\n    pass\n", "c.py": "class Gamma:\n    pass\n"}
+        for name, text in sources.items():
+            with open(os.path.join(tmpdir, name), "w") as f:
+                f.write(text)
+        subprocess.run(["git", "init", "-q"], cwd=tmpdir, check=True)
+        subprocess.run(["git", "add", "."], cwd=tmpdir, check=True)
+
+        tool = CtagsTool()
+        tool._run("test", action="generate_tags", input_path=tmpdir)
+        with open(os.path.join(tmpdir, "b.py"), "a") as f:
+            f.write("def beta_two():\n    pass\n")
+        os.remove(os.path.join(tmpdir, "a.py"))
+        tool._run("test", action="generate_tags", input_path=tmpdir)
+
+        names = [line.split("\t")[0] for line in tool._run("test", action="filter", input_path=tmpdir)["items"]]
+        assert names == ["Gamma", "beta", "beta_two"]
+        with open(os.path.join(tmpdir, "tags")) as f:
+            incremental = [line for line in f if not line.startswith("!_")]
+        tool._run("test", action="generate_tags", input_path=tmpdir, full_rebuild=True)
+        with open(os.path.join(tmpdir, "tags")) as f:
+            assert incremental == [line for line in f if not line.startswith("!_")]
+
+def test_ctags_shards_are_balanced_and_merged_sorted():
+    sizes = {f"f{i}.py": size for i, size in enumerate([900, 500, 400, 300, 300, 200, 100, 100])}
+    shards = shard_files(sizes, 3)
+    assert sorted(path for shard in shards for path in shard) == sorted(sizes)
+    totals = [sum(sizes[path] for path in shard) for shard in shards]
+    assert max(totals) - min(totals) <= 100
+    assert shard_files({"only.py": 10}, 4) == [["only.py"]]
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        shard_lines = [
+            ["!_TAG_FILE_SORTED\t1\t//", "!_TAG_KIND_DESCRIPTION!Python\tf,function\t//", "alpha\ta.py\t1;\"\tf", "gamma\tc.py\t3;\"\tf"],
+            ["!_TAG_FILE_SORTED\t1\t//", "!_TAG_KIND_DESCRIPTION!C\tf,function\t//", "Zeta\tz.c\t9;\"\tf", "beta\tb.c\t2;\"\tf"],
+        ]
+        paths = []
+        for i, lines in enumerate(shard_lines):
+            paths.append(os.path.join(tmpdir, f"shard_{i}"))
+            with open(paths[-1], "w") as f:
+                f.write("\n".join(lines) + "\n")
+        merge_tags_files(paths, os.path.join(tmpdir, "tags"))
+        with open(os.path.join(tmpdir, "tags")) as f:
+            merged = f.read().splitlines()
+        assert merged == [
+            "!_TAG_FILE_SORTED\t1\t//", "!_TAG_KIND_DESCRIPTION!C\tf,function\t//",
+            "!_TAG_KIND_DESCRIPTION!Python\tf,function\t//",
+            "Zeta\tz.c\t9;\"\tf", "alpha\ta.py\t1;\"\tf", "beta\tb.c\t2;\"\tf", "gamma\tc.py\t3;\"\tf",
+        ]
+
+def test_list_source_files_without_git():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        _make_tree(tmpdir)
+        open(os.path.join(tmpdir, "tags"), "w").close()
+        assert list_source_files(tmpdir) == sorted(
+            os.path.join(*parts) for parts in [("top.py",), ("a", "one.py"), ("a", "b", "two.txt"), ("a", "b", "c", "three.py"), ("d", "four.md")]
+        )
+
+def test_reference_postings_roundtrip():
+    assert tokenize(b"x = load(x)\n\nprint(load, 0xff)\n") == {"x": [1], "load": [1, 3], "print": [3]}
+    encoded = bytearray()
+    encode_block(encoded, 3, [1, 200, 70000])
+    encode_block(encoded, 9, [5])
+    assert list(decode_blocks(bytes(encoded))) == [(3, [1, 200, 70000]), (9, [5])]
+
+def test_reference_index_updates_incrementally():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        tmpdir = os.path.realpath(tmpdir)
+        os.makedirs(os.path.join(tmpdir, "pkg"))
+        files = {"pkg/a.py": "def helper():\n    pass\n", "pkg/b.py": "from a import helper\n\nhelper()\n", "c.py": "helper = None\n"}
+        for rel_path, text in files.items():
+            with open(os.path.join(tmpdir, rel_path), "w") as f:
+                f.write(text)
+
+        index = ReferenceIndex(tmpdir)
+        index.refresh()
+        assert index.lookup("helper") == [("c.py", 1), ("pkg/a.py", 1), ("pkg/b.py", 1), ("pkg/b.py", 3)]
+
+        os.remove(os.path.join(tmpdir, "c.py"))
+        with open(os.path.join(tmpdir, "pkg", "b.py"), "w") as f:
+            f.write("\n\nhelper(1)\n")
+        index.refresh()
+        assert index.lookup("helper") == [("pkg/a.py", 1), ("pkg/b.py", 3)]
+        assert index.lookup("helper", path_prefix="pkg/b") == [("pkg/b.py", 3)]
+
+        # A fresh instance loads the saved index and catches up with unsaved changes
+        index.save_if_dirty()
+        reloaded = ReferenceIndex(tmpdir)
+        reloaded.refresh()
+        assert reloaded.lookup("helper") == index.lookup("helper")
+        assert reloaded.lookup("import") == []
+
+        # An index file committed to a repository must not be able to run code when it is loaded
+        class _Payload:
+            def __reduce__(self):
+                return open, (os.path.join(tmpdir, "pwned"), "w")
+
+        with open(reloaded.index_path, "wb") as f:
+            pickle.dump({"version": 1, "files": [], "postings": _Payload()}, f)
+        planted = ReferenceIndex(tmpdir)
+        planted.refresh()
+        assert not os.path.exists(os.path.join(tmpdir, "pwned"))
+        assert planted.lookup("helper") == index.lookup("helper")
+
+        result = CtagsTool()._run("test", action="references", input_path=os.path.join(tmpdir, "pkg"), symbol="helper", project_root=tmpdir)
+        assert result["items"] == ["pkg/a.py:1:def helper():", "pkg/b.py:3:helper(1)"]
+
+def test_terminal_tool_streams_with_caps_and_timeout():
+    tool = TerminalTool()
+    result = asyncio.run(tool._run("test", command="printf 'a\\nb\\nc' | sort -r"))
+    assert result["items"] == ["c", "b", "a"] and not result.get("is_truncated")
+
+    start = time.monotonic()
+    result = asyncio.run(tool._run("test", command="yes", max_lines=100))
+    assert len(result["items"]) == 100 and result["truncation_reason"] == "line_cap"
+    assert tool.get_tool_text_end(result).startswith("total_lines: at least 100,")
+    result = asyncio.run(tool._run("test", command="yes | tr -d '\\n'", max_bytes=100_000))
+    assert result["truncation_reason"] == "byte_cap"
+    result = asyncio.run(tool._run("test", command="echo started && sleep 30", timeout=0.5))
+    assert result["items"] == ["started"] and result["truncation_reason"] == "timeout"
+    assert time.monotonic() - start < 10
+
+def test_required_literal_for_prefiltering():
+    assert required_literal(r"def \w+_handler\(") == "_handler("
+    assert required_literal(r"foo|barbaz") is None
+    assert required_literal(r"a.b") is None
+    assert required_literal(r"(?i)handler", re.MULTILINE) is None
+    assert required_literal(r"(?i:handler)_\w+") is None
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with open(os.path.join(tmpdir, "upper.py"), "w") as f:
+            f.write("HANDLER = 1\n")
+        result = SearchTool()._run("test", pattern=r"(?i)handler", path=tmpdir, is_regex=True)
+        assert [json.loads(item)["file"] for item in result["items"]] == ["upper.py"]
+
+def test_search_tool_returns_structured_records(monkeypatch):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        tmpdir = os.path.realpath(tmpdir)
+        _make_tree(tmpdir)
+        with open(os.path.join(tmpdir, "a", "one.py"), "w") as f:
+            f.write("import os\n\ndef load_config(path):\n    return load_config_file(path)\n# TODO: load_config\n")
+        with open(os.path.join(tmpdir, "a", "blob.bin"), "wb") as f:
+            f.write(b"\0load_config")
+        with open(os.path.join(tmpdir, ".gitignore"), "w") as f:
+            f.write("d/\n")
+        with open(os.path.join(tmpdir, "d", "notes.py"), "w") as f:
+            f.write("load_config\n")
+
+        tool = SearchTool()
+        result = tool._run("test", pattern="load_config", path=tmpdir, context_lines=1, max_matches_per_file=2)
+        records = [json.loads(item) for item in result["items"]]
+        assert [(r["file"], r["line"], r["column"]) for r in records] == [("a/one.py", 3, 5), ("a/one.py", 4, 12)]
+        assert records[0]["context_before"] == [""] and records[0]["context_after"] == ["    return load_config_file(path)"]
+        assert records[1]["file_match_cap_reached"]
+
+        # Same results when the files are split over the worker processes
+        monkeypatch.setattr(search, "PARALLEL_SEARCH_MIN_BYTES", 0)
+        sharded = tool._run("test", pattern=r"^def \w+", path=os.path.join(tmpdir, "a"), project_root=tmpdir, is_regex=True, workers=2)
+        assert [json.loads(item)["text"] for item in sharded["items"]] == ["def load_config(path):"]
+        result = tool._run("test", pattern="TODO", path=tmpdir, ignore_case=True, file_glob="*.md")
+        assert result["items"] == []
+
+def test_trigram_query_from_regex():
+    assert regex_query(rb"load_config") == ("and", [b"loa", b"oad", b"ad_", b"d_c", b"_co", b"con", b"onf", b"nfi", b"fig"])
+    assert regex_query(rb"(?i)Hello") == ("and", [b"hel", b"ell", b"llo"])
+    assert regex_query(rb"ab[cd]e") == ("or", [("and", [b"abc", b"bce"]), ("and", [b"abd", b"bde"])])
+    assert regex_query(rb"def \w+_handler") == ("and", [b"def", b"ef ", b"_ha", b"han", b"and", b"ndl", b"dle", b"ler"])
+    assert regex_query(rb"foo|ba") is None
+    assert regex_query(rb"a.b\d+") is None
+
+def test_trigram_index_narrows_candidates():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        tmpdir = os.path.realpath(tmpdir)
+        os.makedirs(os.path.join(tmpdir, "pkg"))
+        files = {"pkg/a.py": "def open_handler():\n    pass\n", "pkg/b.py": "def close_handler():\n    pass\n", "c.txt": "Handler notes\n"}
+        for rel_path, text in files.items():
+            with open(os.path.join(tmpdir, rel_path), "w") as f:
+                f.write(text)
+
+        index = TrigramIndex(tmpdir)
+        index.refresh()
+        assert index.candidates(rb"def \w+_handler") == ["pkg/a.py", "pkg/b.py"]
+        assert index.candidates(rb"handler", re.IGNORECASE) == ["c.txt", "pkg/a.py", "pkg/b.py"]
+        assert index.candidates(rb"open_handler|notes") == ["c.txt", "pkg/a.py"]
+        assert index.candidates(rb".*") is None
+
+        os.remove(os.path.join(tmpdir, "pkg", "a.py"))
+        with open(os.path.join(tmpdir, "c.txt"), "w") as f:
+            f.write("def print_handler(): pass\n")
+        index.refresh()
+        assert index.candidates(rb"def \w+_handler") == ["c.txt", "pkg/b.py"]
+
+        # The compressed postings are saved and loaded again
+        index._compact()
+        index.save_if_dirty()
+        index._save()
+        reloaded = TrigramIndex(tmpdir)
+        reloaded.refresh()
+        assert reloaded.candidates(rb"def \w+_handler") == ["c.txt", "pkg/b.py"]
+        assert reloaded.candidates(rb"close_handler") == ["pkg/b.py"]
+        with open(reloaded.index_path, "rb") as f:
+            assert read_index(f.read())["version"] == TRIGRAMS_VERSION
+
+        # A pickled index shipped with the repository is ignored, not loaded
+        with open(reloaded.index_path, "wb") as f:
+            pickle.dump({"version": TRIGRAMS_VERSION, "files": [], "postings": b"", "unindexed": []}, f)
+        planted = TrigramIndex(tmpdir)
+        planted.refresh()
+        assert planted.candidates(rb"close_handler") == ["pkg/b.py"]
+
+def test_command_read_only_classification():
+    assert is_read_only("rg -n 'def \\w+$' src | head -20")
+    assert is_read_only("git log --oneline -5 && sed -n 1,20p README.md")
+    assert not is_read_only("find . -name '*.pyc' -delete")
+    assert not is_read_only("ls > files.txt")
+    assert not is_read_only("cat $(git ls-files)")
+    assert not is_read_only("git checkout main")
+    assert not is_read_only("sed -i s/a/b/ setup.py")
+    assert not is_read_only("python setup.py build")
+    assert is_read_only("git log --oneline -5 -- src") and is_read_only("sort -k2 -n sizes.txt")
+    assert is_read_only("rg -o 'def \\w+' src") and is_read_only("git -C src grep -n foo")
+    for command in ("git diff --output=out.txt", "git log --out=out.txt", "git grep --open-files-in-pager=sh foo",
+                    "git grep -O foo", "git grep -nO foo", "git -c core.pager=sh log", "sort -o/tmp/x a.txt",
+                    "sort --out=x a.txt", "tree -o out.txt", "tree -ao out.txt", "rg --pre=sh foo",
+                    "fd -e py -x rm", "fd --exec rm", "fd -X touch", "fd --exec-batch=touch", "uniq a.txt b.txt",
+                    "uniq -c -- a.txt b.txt", "ctags foo.c", "ctags -f tags foo.c", "ctags -f - -o tags foo.c",
+                    "sort --compress-program=sh f", "file -C -m x", "file --compile -m x", "rg --hostname-bin=touch x"):
+        assert not is_read_only(command), command
+    for command in ("fd -e py", "uniq -c a.txt", "uniq -f 2 a.txt", "sort a.txt | uniq", "ctags -f - foo.c",
+                    "ctags -x --kinds-python=f foo.py", "file -m x a.bin", "rg --hidden x"):
+        assert is_read_only(command), command
+
+def test_terminal_results_cached_per_tree_state(monkeypatch):
+    monkeypatch.setattr("builtins.input", lambda: "y")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        tmpdir = os.path.realpath(tmpdir)
+        subprocess.run(["git", "init", "-q"], cwd=tmpdir, check=True)
+        with open(os.path.join(tmpdir, "a.txt"), "w") as f:
+            f.write("one\n")
+        subprocess.run(["git", "add", "a.txt"], cwd=tmpdir, check=True)
+        subprocess.run(["git", "-c", "user.name=t", "-c", "user.email=t@t", "commit", "-qm", "init"], cwd=tmpdir, check=True)
+
+        def run(command):
+            return asyncio.run(TerminalTool().run("test", command=command, root_dir=tmpdir))
+
+        assert not run("cat a.txt").get("is_cached")
+        cached = run("cat   a.txt")
+        assert cached["is_cached"] and cached["items"] == ["one"]
+        assert not run("echo hi").get("is_cached") and not run("echo hi").get("is_cached")
+
+        # Editing a file changes the fingerprint
+        with open(os.path.join(tmpdir, "a.txt"), "w") as f:
+            f.write("two\n")
+        result = run("cat a.txt")
+        assert not result.get("is_cached") and result["items"] == ["two"]
+
+        # A file in a new untracked directory is in the fingerprint, not only the directory
+        os.mkdir(os.path.join(tmpdir, "nd"))
+        with open(os.path.join(tmpdir, "nd", "x.py"), "w") as f:
+            f.write("old\n")
+        assert run("cat nd/x.py")["items"] == ["old"] and run("cat nd/x.py")["is_cached"]
+        with open(os.path.join(tmpdir, "nd", "x.py"), "w") as f:
+            f.write("edited\n")
+        result = run("cat nd/x.py")
+        assert not result.get("is_cached") and result["items"] == ["edited"]
+
+        # Files the fingerprint does not cover are not cached: ignored ones and those outside root
+        with open(os.path.join(tmpdir, ".gitignore"), "w") as f:
+            f.write("*.log\n")
+        with open(os.path.join(tmpdir, "run.log"), "w") as f:
+            f.write("log\n")
+        cache = CommandCache(tmpdir)
+        assert cache.key("cat run.log") is None
+        assert cache.key("cat ../other/x") is None and cache.key("cat /etc/hostname") is None
+        assert cache.key("cat nd/x.py") is not None
+
+        # Concurrent calls of one tool instance store each output under the key of its own command
+        tool = TerminalTool()
+
+        async def concurrently(*commands):
+            return await asyncio.gather(*(tool.run("test", command=command, root_dir=tmpdir) for command in commands))
+
+        asyncio.run(concurrently("head -1 a.txt", "tail -1 nd/x.py"))
+        for command, items in (("head -1 a.txt", ["two"]), ("tail -1 nd/x.py", ["edited"])):
+            result = run(command)
+            assert result["is_cached"] and result["items"] == items and "cache_key" not in result
+
+        # Only the raw output is stored (as JSON): a hit is summarized for the intention of its call
+        async def summarize(items, intention, **kwargs):
+            return [f"summary for {intention}"]
+
+        monkeypatch.setattr(base, "summarize_tool_output", summarize)
+        summarized = lambda intention: asyncio.run(TerminalTool().run(intention, command="cat a.txt", root_dir=tmpdir, limit=0))
+        assert summarized("first")["summary"] == ["summary for first"]
+        second = summarized("second")
+        assert second["is_cached"] and second["summary"] == ["summary for second"]
+        cache_dir = CommandCache(tmpdir).cache_dir
+        for name in os.listdir(cache_dir):
+            with open(os.path.join(cache_dir, name), encoding="utf-8") as f:
+                assert "summary" not in json.load(f)
+
+        # Least recently used entries are evicted beyond max_bytes
+        cache = CommandCache(tmpdir, max_bytes=400)
+        for i in range(5):
+            cache.put(f"key{i}", {"items": ["x" * 100], "total_count": 1})
+        assert cache.get("key0") is None and cache.get("key4") is not None
+        assert (cache.hits, cache.misses) == (1, 1)
+
+def test_persistent_shell_session():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        session = ShellSession(tmpdir)
+
+        async def scenario():
+            tool = TerminalTool()
+            run = lambda command, **kwargs: tool._run("test", command=command, root_dir=tmpdir, persistent_shell=True, **kwargs)
+            assert (await run("printf 'a\\nb\\nc' | sort -r"))["items"] == ["c", "b", "a"]
+            assert (await run("printf 'x\\n\\n'"))["items"] == ["x", ""]
+
+            assert await session.run("mkdir sub && cd sub && export FOO=1 && exit 3", 5, 100, 10_000) == ([], None, 3)
+            pid = session._process.pid
+            assert await session.run("pwd; echo ${FOO:-unset}", 5, 100, 10_000) == ([os.path.realpath(tmpdir), "unset"], None, 0)
+            lines, reason, status = await session.run("ls (", 5, 100, 10_000)
+            assert status != 0 and session._process.pid == pid
+
+            assert await session.run("yes", 5, 50, 10_000) == (["y"] * 50, "line_cap", None)
+            assert await session.run("echo started && sleep 30", 0.5, 100, 10_000) == (["started"], "timeout", None)
+            assert await session.run("cat", 5, 100, 10_000) == ([], None, 0)  # stdin is not the command pipe
+            assert session._process.pid != pid
+            await session.aclose()
+            await stop_shell_sessions()
+
+        asyncio.run(scenario())
+
+def test_line_index_ranges():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "big.txt")
+        with open(path, "w", newline="") as f:
+            f.write("".join(f"line {i}\r\n" for i in range(1, 50001)) + "last")
+        index = get_line_index(path)
+        assert len(index) == 50001
+        assert index.lines(40000, 40002) == ["line 40000", "line 40001", "line 40002"]
+        assert index.lines(50000, 60000) == ["line 50000", "last"]
+        assert index.find(b"line 123\r") == 123 and index.find(b"ine 7", line_start=False) == 7
+        assert get_line_index(path) is index
+
+        with open(path, "w") as f:
+            f.write("a\n\nb\n")
+        assert get_line_index(path) is not index and get_line_index(path).lines(1, 10) == ["a", "", "b"]
+        open(path, "w").close()
+        assert len(get_line_index(path)) == 0 and get_line_index(path).lines(1, 1) == []
+
+def test_file_cache_hits_and_eviction():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        paths = []
+        for i in range(10):
+            paths.append(os.path.join(tmpdir, f"f{i}.txt"))
+            with open(paths[-1], "wb") as f:
+                f.write(b"x" * 120 + b"\n")
+        cache = FileCache(max_bytes=1000)
+        assert cache.read(paths[0]) == cache.read(paths[0]) and (cache.hits, cache.misses) == (1, 1)
+        assert cache.lines(paths[0]) == ["x" * 120] and cache.hits == 2
+
+        # a bulk read does not populate, a changed file (size, mtime or inode) is re-read
+        cache.read(paths[1], populate=False)
+        cache.read(paths[1], populate=False)
+        assert cache.misses == 3
+        with open(paths[0], "ab") as f:
+            f.write(b"y\n")
+        assert cache.lines(paths[0]) == ["x" * 120, "y"] and cache.misses == 4
+
+        # least recently used files are evicted once the budget is exceeded, large files are mapped
+        for path in paths[1:9]:
+            cache.read(path)
+        cache.read(paths[8])
+        assert cache.misses == 12
+        cache.read(paths[0])
+        cache.read(paths[1])
+        assert cache.misses == 14
+        with open(paths[9], "ab") as f:
+            f.write(b"z" * 100)
+        assert cache.read(paths[9])[-3:] == b"zzz" and "15 misses" in cache.stats()[0]
+
+def test_file_reader_ranges_and_symbols():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        source = os.path.join(tmpdir, "mod.py")
+        with open(source, "w") as f:
+            f.write(
+                "import os\n\n"
+                "class Parser:\n"
+                "    @property\n"
+                "    def run(self):\n"
+                "        return [\n"
+                "            1,\n"
+                "        ]\n\n"
+                "    def close(self):\n"
+                "        pass\n\n"
+                "def run():\n"
+                "    pass\n"
+            )
+        with open(os.path.join(tmpdir, "tags"), "w") as f:
+            f.write(
+                "!_TAG_FILE_SORTED\t1\t/0=unsorted, 1=sorted, 2=foldcase/\n"
+                "Parser\tmod.py\t/^class Parser:$/;\"\tkind:c\tend:11\n"
+                "close\tmod.py\t/^    def close(self):$/;\"\tkind:m\tclass:Parser\n"
+                "run\tmod.py\t/^    def run(self):$/;\"\tkind:m\tclass:Parser\n"
+                "run\tmod.py\t/^def run():$/;\"\tkind:f\n"
+            )
+
+        tool = FileReaderTool()
+        assert tool._run("test", file_path=source)["total_count"] == 14
+        result = tool._run("test", file_path=source, start_line=13, end_line=20)
+        assert result["items"] == ["def run():", "    pass"]
+        assert (result["start_line"], result["end_line"], result["file_line_count"]) == (13, 14, 14)
+
+        result = tool._run("test", file_path=source, symbol="Parser.run", project_root=tmpdir)
+        assert result["start_line"] == 4 and result["items"][-1] == "        ]"
+        assert tool._run("test", file_path=source, symbol="run", project_root=tmpdir)["start_line"] == 4
+        assert tool._run("test", file_path=source, symbol="Parser", project_root=tmpdir)["end_line"] == 11
+        assert tool._run("test", file_path=source, symbol="close", project_root=tmpdir)["items"] == ["    def close(self):", "        pass"]
+        with pytest.raises(ToolAbortedException):
+            tool._run("test", file_path=source, symbol="missing", project_root=tmpdir)
+
+def test_file_reader_outline():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        source = os.path.join(tmpdir, "mod.py")
+        with open(source, "w") as f:
+            f.write(
+                '"""Parsing helpers.\n\nMore text."""\n'
+                "class Parser(Base, metaclass=Meta):\n"
+                '    """Parse things."""\n'
+                "    @property\n"
+                "    def run(self, limit: int = 5) -> list:\n"
+                "        def inner():\n"
+                "            pass\n"
+                "        return []\n\n"
+                "async def main(*args, **kwargs):\n"
+                "    pass\n"
+            )
+        assert FileReaderTool()._run("test", file_path=source, outline=True)["items"] == [
+            "Parsing helpers.",
+            "class Parser(Base, metaclass=Meta)  [4-10]  Parse things.",
+            "  @property def run(self, limit: int=5) -> list  [6-10]",
+            "async def main(*args, **kwargs)  [12-13]",
+        ]
+
+def test_generated_files_are_skipped_or_collapsed():
+    assert classify_name("package-lock.json") == "lockfile" and classify_name("app.min.js") == "minified"
+    assert classify_name("api_pb2.py") == "generated" and classify_name("main.py") is None
+    assert classify_content(b"\x89PNG\r\n\x1a\n\0\0") == "binary"
+    assert classify_content(b"var a=1;" * 200) == "minified"
+    assert classify_content(b"// Code generated by protoc-gen-go. DO NOT EDIT.\npackage api\n") == "generated"
+    assert classify_content(b"import os\n\n# do the work\n" + b"x = 1\n" * 10 + b"# generated later, do not edit\n") is None
+    for header in (b"# This file is automatically generated by Sphinx.\n", b"/* DO NOT EDIT: generated by bindgen */\n",
+                   b"# @generated by pants\n", b"<?php\n// Automatically generated, DO NOT EDIT!\n"):
+        assert classify_content(header + b"x = 1\n") == "generated", header
+    for header in (b'"""Parse auto-generated reports."""\n', b'"""\nPlease do not edit the constants below.\n"""\n',
+                   b"# Parse auto-generated reports\n", b'"""Files that are automatically generated are skipped."""\n',
+                   b"// Code generated by hand, then edited\n"):
+        assert classify_content(header + b"x = 1\n") is None, header
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        tmpdir = os.path.realpath(tmpdir)
+        with open(os.path.join(tmpdir, "app.py"), "w") as f:
+            f.write("def load_config():\n    pass\n")
+        with open(os.path.join(tmpdir, "bundle.js"), "w") as f:
+            f.write("function load_config(){return 1};" * 100)
+        with open(os.path.join(tmpdir, "package-lock.json"), "w") as f:
+            f.write('{"load_config": 1}\n')
+
+        listed = DirectoryTool()._run("test", path=tmpdir, workers=1)["items"].paths
+        assert os.path.join(tmpdir, "package-lock.json") not in listed and os.path.join(tmpdir, "bundle.js") in listed
+        assert os.path.join(tmpdir, "package-lock.json") in DirectoryTool()._run("test", path=tmpdir, include_generated=True)["items"].paths
+
+        records = [json.loads(item) for item in SearchTool()._run("test", pattern="load_config", path=tmpdir)["items"]]
+        assert [(r["file"], r["text"]) for r in records] == [
+            ("app.py", "def load_config():"),
+            ("bundle.js", "[minified file, matches not shown]"),
+            ("package-lock.json", "[lockfile file, matches not shown]"),
+        ]
+        reader = FileReaderTool()
+        assert reader._run("test", file_path=os.path.join(tmpdir, "bundle.js"))["items"][0].startswith("[minified file, 3300 bytes")
+        assert reader._run("test", file_path=os.path.join(tmpdir, "bundle.js"), include_generated=True)["total_count"] == 1
+        assert reader._run("test", file_path=os.path.join(tmpdir, "app.py"))["total_count"] == 2
+
+def test_file_reader_sends_changes_of_repeat_reads():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        source = os.path.join(tmpdir, "mod.py")
+        lines = [f"value_{i} = {i}" for i in range(40)]
+        with open(source, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        history = ReadHistory()
+        reader = FileReaderTool()
+
+        history.next_turn()
+        result = reader._run("test", file_path=source, read_history=history)
+        assert result["items"] == lines and not result.get("is_repeat_read")
+        history.record(result["read_key"], result["read_lines"])
+
+        history.next_turn()
+        result = reader._run("test", file_path=source, read_history=history)
+        assert result["items"] == ["[unchanged since it was read in turn 1]"] and result["is_repeat_read"]
+        history.record(result["read_key"], result["read_lines"])
+
+        history.next_turn()
+        with open(source, "w") as f:
+            f.write("\n".join(lines[:20] + ["value_20 = 'changed'"] + lines[21:]) + "\n")
+        result = reader._run("test", file_path=source, read_history=history)
+        assert result["items"][0] == "[changed since it was read in turn 1, diff against that version:]"
+        assert "-value_20 = 20" in result["items"] and "+value_20 = 'changed'" in result["items"]
+        history.record(result["read_key"], result["read_lines"])
+        assert reader._run("test", file_path=source, read_history=history)["items"] == ["[unchanged since it was read in turn 3]"]
+
+        # ranges are tracked on their own, a rewritten file is sent again
+        assert reader._run("test", file_path=source, start_line=1, end_line=2, read_history=history)["items"] == lines[:2]
+        with open(source, "w") as f:
+            f.write("completely = 'different'\n")
+        assert reader._run("test", file_path=source, read_history=history)["items"] == ["completely = 'different'"]
+
+class _SleepTool(BaseTool):
+    def get_tool_text_start(self, name: str, **kwargs):
+        return [f"Sleep {name}"]
+
+    def print_verbose_output(self, result):
+        pass
+
+    def _run(self, intention_of_this_call: str, name: str, seconds: float, **kwargs):
+        time.sleep(seconds)
+        return {"total_count": 1, "items": [name]}
+
+def test_tool_calls_are_approved_together_and_run_concurrently(monkeypatch, capsys):
+    asked = []
+
+    async def ask(calls):
+        asked.append([call.tool_text for call in calls])
+        return parse_approval("1 3", len(calls))
+
+    monkeypatch.setattr(base, "ask_in_terminal", ask)
+
+    async def response():
+        tool = _SleepTool()
+        calls = [tool.run("test", name=name, seconds=seconds) for name, seconds in (("a", 0.3), ("b", 0.3), ("c", 0.1))]
+        return await asyncio.gather(*calls, return_exceptions=True)
+
+    start = time.monotonic()
+    results = asyncio.run(response())
+    assert time.monotonic() - start < 0.55
+    assert asked == [["Sleep a", "Sleep b", "Sleep c"]]
+    assert results[0]["items"] == ["a"] and isinstance(results[1], ToolAbortedException) and results[2]["items"] == ["c"]
+    output = capsys.readouterr().out
+    assert output.index("[Sleep b - aborted]") < output.index("[Sleep a]") < output.index("[Sleep c]")
+    assert parse_approval("", 2) == {0, 1} and parse_approval("n", 2) == set() and parse_approval("1", 1) == set()
+
+def test_approval_policy_decides_read_only_calls_without_asking(monkeypatch, tmp_path):
+    policy_file = tmp_path / "policy.json"
+    policy_file.write_text(json.dumps({"rules": [
+        {"decision": "deny", "tool": "terminal", "command": "git push*"},
+        {"decision": "deny", "path": "secrets"},
+    ]}))
+    policy = ApprovalPolicy.load(str(policy_file), str(tmp_path), read_only=True)
+    allowed = lambda tool, **arguments: (lambda decision: decision and decision.allow)(policy.decide(tool, arguments))
+    assert allowed("directory", path=str(tmp_path / "src"))
+    assert allowed("terminal", command="rg -n 'def main' src | head -5", root_dir=str(tmp_path))
+    assert allowed("terminal", command="git log --oneline -5", root_dir=str(tmp_path))
+    assert policy.decide("terminal", {"command": "cat ../../etc/passwd", "root_dir": str(tmp_path)}) is None
+    assert policy.decide("terminal", {"command": "python setup.py build", "root_dir": str(tmp_path)}) is None
+    assert policy.decide("terminal", {"command": "ls | cat\ntouch pwned", "root_dir": str(tmp_path)}) is None
+    assert policy.decide("terminal", {"command": "git  push\torigin main"}).allow is False
+    assert policy.decide("file_writer", {"file_path": str(tmp_path / "a.py")}) is None
+    assert policy.decide("terminal", {"command": "git push origin main"}).allow is False
+    assert policy.decide("file_reader", {"file_path": str(tmp_path / "secrets" / "key")}).allow is False
+
+    asked = []
+
+    async def ask(calls):
+        asked.append([call.tool_text for call in calls])
+        return set()
+
+    monkeypatch.setattr(base, "ask_in_terminal", ask)
+    set_approval_policy(policy)
+    try:
+        (tmp_path / "a.txt").write_text("hello\n")
+        reader = FileReaderTool()
+        result = asyncio.run(reader.run("test", file_path=str(tmp_path / "a.txt")))
+        assert result["items"] == ["hello"] and asked == []
+        with pytest.raises(ToolAbortedException, match="approval policy"):
+            asyncio.run(reader.run("test", file_path=str(tmp_path / "secrets" / "key")))
+    finally:
+        set_approval_policy(None)
+
+def test_local_summary_keeps_relevant_lines_with_their_anchors(monkeypatch, tmp_path):
+    lines = []
+    for i in range(300):
+        lines += [f"def handler_{i}(request):", f"    value = request.args[{i}]", "    return value", ""]
+    lines[4 * 123 + 1] = "    token = refresh_access_token(request)"
+    summary, confidence = extractive_summary(lines, "Where is the access token refreshed?", 10)
+    assert len(summary) <= 10 and confidence >= 0.5
+    # The match with the definition above it, the rest of the budget goes to the first definitions
+    assert summary[-2:] == ["def handler_123(request):", "    token = refresh_access_token(request)"]
+    assert summary[1:-2] == lines[0:28:4]
+
+    calls = []
+
+    class _Result:
+        def __init__(self, summary):
+            self.data = type("Output", (), {"summary": summary})()
+
+    async def run(prompt, deps):
+        calls.append(prompt)
+        return _Result("model summary")
+
+    monkeypatch.setattr(summarizer_agent.summarizer, "run", run)
+    monkeypatch.setattr(summary_cache, "_cache", SummaryCache(str(tmp_path)))
+    local = asyncio.run(summarize_tool_output(lines, "Where is the access token refreshed?", max_lines=10, mode="auto"))
+    assert local == summary and calls == []
+    vague = asyncio.run(summarize_tool_output(lines, "Give an overview", max_lines=10, mode="auto"))
+    assert vague[-1] == "model summary" and len(calls) == 1
+    asyncio.run(summarize_tool_output(lines, "Give an overview", max_lines=10, mode="local"))
+    assert len(calls) == 1
+
+def test_summary_cache_answers_repeated_summarizations_without_the_model(monkeypatch, tmp_path):
+    calls = []
+
+    class _Result:
+        def __init__(self, summary):
+            self.data = type("Output", (), {"summary": summary})()
+
+    async def run(prompt, deps):
+        calls.append(prompt)
+        return _Result(f"summary {len(calls)}")
+
+    monkeypatch.setattr(summarizer_agent.summarizer, "run", run)
+    monkeypatch.setattr(summary_cache, "_cache", SummaryCache(str(tmp_path)))
+    output = [f"src/module_{i}.py" for i in range(500)]
+    summarize = lambda intention, max_lines=50: asyncio.run(
+        summarize_tool_output(output, intention, max_lines=max_lines, mode="llm"))
+
+    first = summarize("List the modules")
+    assert summarize("  list the modules. ") == first and len(calls) == 1
+    assert summarize("List the modules", max_lines=20) != first and len(calls) == 2
+    assert summary_cache._cache.hits == 1 and summary_cache._cache.misses == 2
+
+    # A new process finds the entries on disk, until they expire
+    monkeypatch.setattr(summary_cache, "_cache", SummaryCache(str(tmp_path)))
+    assert summarize("List the modules") == first and len(calls) == 2
+    monkeypatch.setattr(summary_cache, "_cache", SummaryCache(str(tmp_path), ttl=0))
+    assert summarize("List the modules") != first and len(calls) == 3
+
+    small = SummaryCache(str(tmp_path / "small"), max_bytes=150)
+    for i in range(5):
+        small.put(f"key{i}", [f"summary line {i}"] * 3)
+    assert small.get("key0") is None and small.get("key4") == ["summary line 4"] * 3
+
+    # A summary made with another strategy is not reused
+    cache = SummaryCache(str(tmp_path / "strategy"))
+    keys = {cache.key(output, "List the modules", 50),
+            cache.key(output, "List the modules", 50, map_reduce=True, chunk_tokens=8000),
+            cache.key(output, "List the modules", 50, map_reduce=True, chunk_tokens=2000)}
+    assert len(keys) == 3
+
+    # Entries are JSON: a planted pickle is ignored, never loaded
+    cache = SummaryCache(str(tmp_path / "planted"))
+    key = cache.key(output, "List the modules", 50)
+    os.makedirs(cache.cache_dir, exist_ok=True)
+    with open(os.path.join(cache.cache_dir, key), "wb") as f:
+        f.write(pickle.dumps((time.time(), ["planted"])))
+    assert cache.get(key) is None
+    cache.put(key, ["stored"])
+    with open(os.path.join(cache.cache_dir, key), encoding="utf-8") as f:
+        assert json.load(f)["summary"] == ["stored"]
+    assert cache.get(key) == ["stored"]
+
+def test_map_reduce_summary_covers_all_of_the_output(monkeypatch, tmp_path):
+    prompts = []
+    running = [0, 0]
+
+    class _Result:
+        def __init__(self, summary):
+            self.data = type("Output", (), {"summary": summary})()
+
+    async def run(prompt, deps):
+        # Stand-in model: keeps the lines mentioning the needle
+        prompts.append(prompt)
+        running[0] += 1
+        running[1] = max(running)
+        await asyncio.sleep(0.01)
+        running[0] -= 1
+        return _Result("\n".join(line for line in prompt.splitlines() if "needle" in line and "=" in line))
+
+    monkeypatch.setattr(summarizer_agent.summarizer, "run", run)
+    monkeypatch.setattr(summary_cache, "_cache", SummaryCache(str(tmp_path)))
+    output = [f"src/module_{i}.py:{i}: value = {i}" for i in range(3000)]
+    output[2500] = "src/module_2500.py:2500: needle = find_me()"
+
+    truncated = asyncio.run(summarize_tool_output(output, "Where is the needle set", mode="llm", map_reduce=False))
+    assert len(prompts) == 1 and not any("needle =" in line for line in truncated)
+
+    prompts.clear()
+    monkeypatch.setattr(summary_cache, "_cache", SummaryCache(str(tmp_path / "map_reduce")))
+    summary = asyncio.run(summarize_tool_output(output, "Where is the needle set", mode="llm", map_reduce=True,
+                                                chunk_tokens=2000, concurrency=4))
+    assert summary[-1] == "src/module_2500.py:2500: needle = find_me()"
+    map_prompts = [prompt for prompt in prompts if "part " in prompt]
+    assert len(map_prompts) == len(prompts) - 1 > 4 and running[1] == 4
+    assert "part 1 of" in map_prompts[0] and "lines 1-" in map_prompts[0]
@@ -0,0 +1,134 @@
+import fnmatch
+import json
+import logging
+import os
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from .command_cache import command_paths, is_read_only, is_under
+
+logger = logging.getLogger(__name__)
+
+DECISIONS = ("allow", "deny")
+# Tool arguments holding the path a call works on
+PATH_ARGUMENTS = ("path", "file_path", "input_path")
+# Rules of --yes-read-only, after the rules of the policy file: tools that only read the project,
+# and terminal commands classified read-only, are run without asking
+READ_ONLY_RULES = [
+    {"decision": "allow", "tool": ["directory", "file_reader", "search", "ctags_readtags_tool"], "path": "."},
+    {"decision": "allow", "tool": "terminal", "read_only": True, "path": "."},
+]
+
+
+class PolicyError(ValueError):
+    """Raised for an unreadable or invalid policy file"""
+    pass
+
+
+class ApprovalDecision:
+    __slots__ = ("allow", "reason")
+
+    def __init__(self, allow: bool, reason: str):
+        self.allow = allow
+        self.reason = reason
+
+
+class ApprovalRule:
+    """
+    One allow or deny rule. Every field given must match: tool (a name or a list of names, glob
+    characters allowed), path (a prefix relative to the project root: an allow rule needs all
+    paths of the call under it, a deny rule any of them), command (a glob on the terminal command
+    with its whitespace collapsed; an allow rule never matches a command of several lines) and
+    read_only (whether the command is classified read-only, see command_cache.is_read_only).
+    """
+    __slots__ = ("decision", "tools", "path", "command", "read_only", "description")
+
+    def __init__(self, rule: Dict[str, Any], description: str):
+        unknown = set(rule) - {"decision", "tool", "path", "command", "read_only"} if isinstance(rule, dict) else set()
+        if not isinstance(rule, dict) or rule.get("decision") not in DECISIONS or unknown:
+            raise PolicyError(f"{description}: needs a decision ({' or '.join(DECISIONS)}), "
+                              f"unknown fields: {sorted(unknown) or 'none'}")
+        tools = rule.get("tool", "*")
+        self.decision: str = rule["decision"]
+        self.tools: List[str] = [tools] if isinstance(tools, str) else list(tools)
+        self.path: Optional[str] = rule.get("path")
+        self.command: Optional[str] = rule.get("command")
+        self.read_only: Optional[bool] = rule.get("read_only")
+        self.description = description
+
+    def matches(self, tool: str, paths: Sequence[str], command: Optional[str], root: str) -> bool:
+        if not any(fnmatch.fnmatchcase(tool, pattern) for pattern in self.tools):
+            return False
+        if self.command is not None:
+            if command is None or (self.decision == "allow" and "\n" in command):
+                return False
+            if not fnmatch.fnmatchcase(" ".join(command.split()), self.command):
+                return False
+        if self.read_only is not None and (command is None or is_read_only(command) != self.read_only):
+            return False
+        if self.path is not None:
+            prefix = os.path.realpath(os.path.join(root, self.path))
+            under = [is_under(path, prefix) for path in paths]
+            if not (any(under) if self.decision == "deny" else under and all(under)):
+                return False
+        return True
+
+
+class ApprovalPolicy:
+    """
+    Ordered allow/deny rules that decide tool calls without asking: the first matching rule
+    wins, calls no rule matches are asked for as before. Every decision is logged.
+    """
+
+    def __init__(self, rules: Iterable[ApprovalRule], project_root: str = "."):
+        self.rules = list(rules)
+        self.project_root = os.path.realpath(project_root)
+
+    @classmethod
+    def load(cls, policy_file: Optional[str], project_root: str = ".", read_only: bool = False) -> "ApprovalPolicy":
+        """
+        Policy of a JSON file ({"rules": [{"decision": "allow", "tool": "terminal", ...}, ...]}),
+        followed by READ_ONLY_RULES with read_only (the --yes-read-only mode).
+        """
+        rules = []
+        if policy_file:
+            try:
+                with open(policy_file, encoding="utf-8") as f:
+                    document = json.load(f)
+            except (OSError, ValueError) as e:
+                raise PolicyError(f"Cannot read approval policy {policy_file}: {e}")
+            if not isinstance(document, dict) or not isinstance(document.get("rules"), list):
+                raise PolicyError(f"Approval policy {policy_file} needs a list of rules")
+            rules = [ApprovalRule(rule, f"{policy_file} rule {i}") for i, rule in enumerate(document["rules"], 1)]
+        if read_only:
+            rules += [ApprovalRule(rule, f"read-only rule {i}") for i, rule in enumerate(READ_ONLY_RULES, 1)]
+        return cls(rules, project_root)
+
+    def decide(self, tool: str, arguments: Dict[str, Any]) -> Optional[ApprovalDecision]:
+        """The decision of the first rule matching the call, None if it has to be asked for."""
+        # Rules see the command as it is run: collapsing its whitespace would hide newlines,
+        # which separate commands in a shell
+        command = arguments.get("command")
+        if command is not None:
+            paths = command_paths(command, os.path.realpath(arguments.get("root_dir") or self.project_root))
+        else:
+            paths = [os.path.realpath(os.path.join(self.project_root, arguments[name]))
+                     for name in PATH_ARGUMENTS if arguments.get(name)]
+        subject = repr(command) if command is not None else ", ".join(paths)
+        for rule in self.rules:
+            if rule.matches(tool, paths, command, self.project_root):
+                logger.info(f"Approval policy: {rule.decision} {tool} {subject} ({rule.description})")
+                return ApprovalDecision(rule.decision == "allow", rule.description)
+        logger.info(f"Approval policy: no rule for {tool} {subject}, asking")
+        return None
+
+
+_policy: Optional[ApprovalPolicy] = None
+
+
+def get_approval_policy() -> Optional[ApprovalPolicy]:
+    return _policy
+
+
+def set_approval_policy(policy: Optional[ApprovalPolicy]) -> None:
+    global _policy
+    _policy = policy
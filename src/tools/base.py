@@ -1,81 +1,243 @@
-import threading
 import asyncio
+import inspect
+import logging
+import re
+import sys
 from abc import ABC, abstractmethod
-from typing import List
+from typing import List, Optional, Sequence, Set
 
+from colorama import Fore, Style
+
+from .approval_policy import ApprovalDecision, get_approval_policy
 from .types import BaseToolResult
+from ..config.settings import TOOL_CONCURRENCY
 from ..shared import colored_print
+from ..summarize_agent.cache import get_summary_cache
 from ..summarize_agent.main_agent import summarize_tool_output
 
-io_lock = threading.Lock()
+logger = logging.getLogger(__name__)
 
 
 class ToolAbortedException(Exception):
     """Raised when a tool operation is aborted by the user"""
     pass
 
+
+class ToolCall:
+    """A tool call waiting for approval (unless the policy decided it), then for its turn to print its result."""
+
+    def __init__(self, intention: str, tool_text: str, params: List[str], previous: Optional["ToolCall"],
+                 decision: Optional[ApprovalDecision] = None):
+        self.intention = intention
+        self.tool_text = tool_text
+        self.params = params
+        self.decision = decision
+        self.approved = False
+        self.decided = asyncio.Event()
+        self.rendered = asyncio.Event()
+        self._previous = previous
+
+    async def turn(self) -> None:
+        """Wait until the calls started before this one have printed their results."""
+        if self._previous is not None:
+            await self._previous.rendered.wait()
+
+    def done(self) -> None:
+        """Mark this call rendered (failed or aborted calls too), but never before the calls started before it."""
+        if self._previous is not None and not self._previous.rendered.is_set():
+            asyncio.get_running_loop().create_task(self._done_after_previous())
+            return
+        self._previous = None
+        self.rendered.set()
+
+    async def _done_after_previous(self) -> None:
+        await self.turn()
+        self.done()
+
+
+def parse_approval(response: str, count: int) -> Set[int]:
+    """Indexes of the approved calls: all for "" / "y", none for "n", else the 1-based numbers listed."""
+    response = response.strip().lower()
+    if response in ("", "y", "yes"):
+        return set(range(count))
+    if count > 1:
+        return {int(number) - 1 for number in re.findall(r"\d+", response) if 0 < int(number) <= count}
+    return set()
+
+
+async def _read_line(question: str) -> str:
+    if not sys.stdin.isatty():
+        colored_print(question, color="CYAN", linebreak=False, colorize_all=True)
+        return await asyncio.to_thread(input)
+    from prompt_toolkit import PromptSession
+    from prompt_toolkit.formatted_text import ANSI
+    return await PromptSession().prompt_async(ANSI(f"{Fore.CYAN}codesearch> {question}{Style.RESET_ALL}"))
+
+
+def print_call(call: ToolCall, label: str) -> None:
+    colored_print(call.intention, color="GREEN", colorize_all=True)
+    colored_print(label, color="CYAN", colorize_all=True)
+    for param in call.params:
+        colored_print(param, prefix="            ", color="YELLOW", colorize_all=True)
+
+
+async def ask_in_terminal(calls: Sequence[ToolCall]) -> Set[int]:
+    """Show the calls and ask for their approval with one (async) prompt."""
+    for number, call in enumerate(calls, 1):
+        print_call(call, f"[{call.tool_text}]" if len(calls) == 1 else f"{number}. [{call.tool_text}]")
+    if len(calls) == 1:
+        question = "Accept? (y/n) [y]: "
+    else:
+        question = f"Accept all {len(calls)} calls? (y/n, or the numbers of the calls to run, e.g. 1 3) [y]: "
+    return parse_approval(await _read_line(question), len(calls))
+
+
+class ApprovalBatcher:
+    """
+    Approval and ordering of the tool calls of one event loop. The calls started together (all
+    tool calls of one model response) are approved with one prompt, except those the approval
+    policy decided; the approved ones then run concurrently, at most `concurrency` at a time, and
+    print their results in call order.
+    """
+
+    def __init__(self, concurrency: int = TOOL_CONCURRENCY):
+        self.loop = asyncio.get_running_loop()
+        self.slots = asyncio.Semaphore(max(concurrency, 1))
+        self._pending: List[ToolCall] = []
+        self._last: Optional[ToolCall] = None
+        self._prompt_lock = asyncio.Lock()
+
+    async def submit(self, intention: str, tool_text: str, params: List[str],
+                     decision: Optional[ApprovalDecision] = None) -> ToolCall:
+        """Queue a call for approval and wait for the decision (call.approved)."""
+        call = ToolCall(intention, tool_text, params, self._last, decision)
+        self._last = call
+        self._pending.append(call)
+        if len(self._pending) == 1:
+            self.loop.create_task(self._decide())
+        await call.decided.wait()
+        return call
+
+    async def _decide(self) -> None:
+        await asyncio.sleep(0)  # let the other calls of the same model response queue up
+        async with self._prompt_lock:
+            batch, self._pending = self._pending, []
+            for call in batch:
+                if call.decision is not None:
+                    call.approved = call.decision.allow
+                    result = "approved" if call.approved else "denied"
+                    print_call(call, f"[{call.tool_text} - {result} by {call.decision.reason}]")
+            asked = [call for call in batch if call.decision is None]
+            approved: Set[int] = set()
+            try:
+                if asked:
+                    approved = await ask_in_terminal(asked)
+            except (EOFError, KeyboardInterrupt):
+                pass
+            finally:
+                for i, call in enumerate(asked):
+                    call.approved = i in approved
+                    logger.info(f"Tool call {call.tool_text}: {'approved' if call.approved else 'denied'} by the user")
+                for call in batch:
+                    if not call.approved:
+                        colored_print(f"[{call.tool_text} - aborted]", color="RED", colorize_all=True)
+                        print()
+                    call.decided.set()
+
+
+_batcher: Optional[ApprovalBatcher] = None
+
+
+def get_approval_batcher() -> ApprovalBatcher:
+    global _batcher
+    if _batcher is None or _batcher.loop is not asyncio.get_running_loop():
+        _batcher = ApprovalBatcher()
+    return _batcher
+
+
 class BaseTool(ABC):
+    # Name of the tool in the approval policy (the name of its agent tool)
+    name: str = ""
+
     async def run(self, intention_of_this_call: str, **kwargs) -> BaseToolResult:
-        """Base run method that handles user approval and messaging"""
-        with io_lock:
-            result = self.get_tool_text_start(**kwargs)
-            tool_text = result[0]
-            params = result[1:] if len(result) > 1 else []
-
-            colored_print(intention_of_this_call, color="GREEN", colorize_all=True)
-            colored_print(f"[{tool_text}]", color="CYAN", colorize_all=True)
-            if params:
-                for param in params:
-                    colored_print(param, prefix="            ", color="YELLOW", colorize_all=True)
-            else:
-                print()  # Just newline if no params
-
-            colored_print("Accept? (y/n) [y]: ", color="CYAN", linebreak=False, colorize_all=True)
-            response = input().lower()
-            if response != 'y' and response != '':
-                colored_print(f"[{tool_text} - aborted]", color="RED", colorize_all=True, linebreak=False)
-                print()  # new line
-                print()  # new line
+        """
+        Base run method that handles user approval and messaging. Approval is asked for together
+        with the other calls started at the same time (see ApprovalBatcher); synchronous tools
+        run in a worker thread so approved calls run concurrently.
+        """
+        text = self.get_tool_text_start(**kwargs)
+        tool_text, params = text[0], text[1:]
+        policy = get_approval_policy()
+        decision = policy.decide(self.name, kwargs) if policy is not None else None
+        batcher = get_approval_batcher()
+        call = await batcher.submit(intention_of_this_call, tool_text, params, decision)
+        try:
+            if not call.approved:
+                if call.decision is not None:
+                    raise ToolAbortedException(f"Operation denied by the approval policy ({call.decision.reason})")
                 raise ToolAbortedException("Operation aborted by user")
-
-            result = self._run(intention_of_this_call, **kwargs)
-
-            # Handle summarization if needed
-            limit = kwargs.get('limit', 50)
-            if len(result['items']) > limit:
-                summary = await summarize_tool_output(
-                    result['items'],
-                    intention_of_this_call,
-                    max_lines=limit,
-                    verbose=kwargs.get('verbose', False)
-                )
-                result['summary'] = summary
-                result['is_summarized'] = True
-            else:
-                result['summary'] = None
-                result['is_summarized'] = False
-
-            if kwargs.get('verbose') and result:
-                # Print original output first
-                self.print_verbose_output(result)
-
-                # Print summary if it exists
-                if result.get('is_summarized'):
-                    print()
-                    colored_print("Summarized output:", color="YELLOW", colorize_all=True)
-                    for line in result['summary']:
-                        colored_print(line, color="YELLOW")
-
-            if result:
-                end_text = self.get_tool_text_end(result, **kwargs)
-                colored_print(f"[{tool_text}]", color="CYAN", colorize_all=True, linebreak=False)
-                print(" " + end_text)
-                print()  # new line
+            async with batcher.slots:
+                result = await self._execute(intention_of_this_call, **kwargs)
+            await call.turn()
+            self._render(tool_text, result, **kwargs)
             return result
+        finally:
+            call.done()
+
+    async def _execute(self, intention_of_this_call: str, **kwargs) -> BaseToolResult:
+        # A cached result is the raw output: it is summarized for this call's intention (which the
+        # summary cache makes cheap when it is the same as before)
+        result = self.get_cached_result(**kwargs)
+        cached = result is not None
+        if cached:
+            result['is_cached'] = True
+        elif inspect.iscoroutinefunction(self._run):
+            result = await self._run(intention_of_this_call, **kwargs)
+        else:
+            result = await asyncio.to_thread(self._run, intention_of_this_call, **kwargs)
+
+        # Handle summarization if needed
+        limit = kwargs.get('limit', 50)
+        if len(result['items']) > limit:
+            summary = await summarize_tool_output(
+                result['items'],
+                intention_of_this_call,
+                max_lines=limit,
+                verbose=kwargs.get('verbose', False),
+                total_count=result.get('total_count')
+            )
+            result['summary'] = summary
+            result['is_summarized'] = True
+        else:
+            result['summary'] = None
+            result['is_summarized'] = False
+        if not cached:
+            self.cache_result(result, **kwargs)
+        return result
+
+    def _render(self, tool_text: str, result: BaseToolResult, **kwargs) -> None:
+        if kwargs.get('verbose') and result:
+            # Print original output first
+            self.print_verbose_output(result)
+
+            # Print summary if it exists
+            if result.get('is_summarized'):
+                print()
+                colored_print("Summarized output:", color="YELLOW", colorize_all=True)
+                for line in result['summary']:
+                    colored_print(line, color="YELLOW")
+                for line in get_summary_cache().stats():
+                    colored_print(line, color="CYAN", colorize_all=True)
+
+        if result:
+            end_text = self.get_tool_text_end(result, **kwargs)
+            colored_print(f"[{tool_text}]", color="CYAN", colorize_all=True, linebreak=False)
+            print(" " + end_text)
+            print()  # new line
 
     @abstractmethod
     def _run(self, intention_of_this_call: str, **kwargs) -> BaseToolResult:
-        """Implement the actual tool logic here"""
+        """Implement the actual tool logic here (may be a coroutine function for I/O bound tools)"""
         pass
 
     @abstractmethod
@@ -83,6 +245,14 @@ class BaseTool(ABC):
         """Return the tool description text to show before approval"""
         pass
 
+    def get_cached_result(self, **kwargs) -> Optional[BaseToolResult]:
+        """Return a stored result (without summary) for these arguments to skip running the tool"""
+        return None
+
+    def cache_result(self, result: BaseToolResult, **kwargs) -> None:
+        """Store a fresh result for get_cached_result (its summary belongs to this call's intention)"""
+        pass
+
     def get_tool_text_end(self, result: BaseToolResult, **kwargs) -> str:
         if result.get('is_summarized'):
             return f"summarized (original total_lines: {result['total_count']})"
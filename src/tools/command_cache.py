@@ -0,0 +1,353 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import shlex
+import subprocess
+import threading
+from typing import Dict, List, Optional, Set
+
+from .snapshot import INDEX_DIR, ensure_index_dir
+from .types import BaseToolResult
+from .watcher import get_watcher
+from ..config.settings import TERMINAL_CACHE_MAX_BYTES
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = "command_cache"
+CACHE_VERSION = 2
+# Result fields written for this call only, not stored: the summary is made for the intention of the call
+UNCACHED_FIELDS = ("summary", "is_summarized", "is_cached", "cache_key")
+
+# Programs whose output only depends on their arguments and the working tree
+READ_ONLY_PROGRAMS = {
+    "rg", "grep", "egrep", "fgrep", "find", "fd", "ls", "tree", "cat", "head", "tail", "wc", "sort", "uniq",
+    "cut", "tr", "nl", "file", "stat", "du", "basename", "dirname", "realpath", "readlink", "ctags", "readtags",
+}
+READ_ONLY_GIT_COMMANDS = {
+    "log", "show", "diff", "status", "ls-files", "ls-tree", "grep", "blame", "rev-parse", "cat-file", "shortlog",
+}
+# Options that make an otherwise read-only program write or run other programs. Long options also
+# match their abbreviations (--out for --output), one-letter options also match when grouped with
+# others or given their value attached (-o/tmp/x); find's one-dash words only match as they are.
+WRITING_OPTIONS = {
+    "find": {"-delete", "-exec", "-execdir", "-ok", "-okdir", "-fprint", "-fprint0", "-fprintf", "-fls"},
+    "sort": {"-o", "--output", "--compress-program"},
+    "rg": {"--pre", "--hostname-bin"},
+    "fd": {"-x", "--exec", "-X", "--exec-batch"},
+    "file": {"-C", "--compile"},
+    "ctags": {"-R", "--recurse"},
+    "tree": {"-o"},
+    "git": {"--output", "-O", "--open-files-in-pager"},
+}
+# git options before the subcommand that set configuration (a pager, an alias, ...) run programs
+GIT_CONFIG_OPTIONS = ("-c", "--config-env", "--exec-path")
+# git options before the subcommand whose value is the next word
+GIT_VALUE_OPTIONS = {"-C", "-c", "--git-dir", "--work-tree", "--namespace", "--config-env"}
+# Shell syntax (outside single quotes) the classifier does not look into: redirections,
+# substitutions, background jobs, command lists, ...
+UNSAFE_SHELL = re.compile(r"[<>`$&;(){}\n]")
+SINGLE_QUOTED = re.compile(r"'[^']*'")
+SED_PRINT_RANGE = re.compile(r"^(\d+|\$)(,(\d+|\$))?p$")
+# uniq options whose value is the next word
+UNIQ_VALUE_OPTIONS = {"-f", "-s", "-w"}
+
+
+def normalize_command(command: str) -> str:
+    """Command with the quoting and whitespace of its words normalized."""
+    try:
+        return shlex.join(shlex.split(command))
+    except ValueError:
+        return command.strip()
+
+
+def is_read_only(command: str) -> bool:
+    """
+    True if command is a pipeline (commands joined with |, && or ||) of known read-only
+    programs, so its output can be reused as long as the working tree did not change.
+    """
+    if UNSAFE_SHELL.search(SINGLE_QUOTED.sub("''", command).replace("&&", " ")):
+        return False
+    for part in re.split(r"\|\||&&|\|", command):
+        try:
+            words = shlex.split(part)
+        except ValueError:
+            return False
+        if not words:
+            return False
+        program = os.path.basename(words[0])
+        if program == "git":
+            position = 1
+            while position < len(words) and words[position].startswith("-"):
+                position += 2 if words[position] in GIT_VALUE_OPTIONS else 1
+            if position == len(words) or words[position] not in READ_ONLY_GIT_COMMANDS:
+                return False
+            if any(word.startswith(GIT_CONFIG_OPTIONS) for word in words[1:position]):
+                return False
+        elif program == "sed":
+            # Only printing line ranges, sed scripts can write files (w) or run commands (e)
+            if words[1:2] != ["-n"] or len(words) < 3 or not SED_PRINT_RANGE.match(words[2]):
+                return False
+        elif program == "uniq":
+            # A second operand is the output file
+            if len(_operands(words, UNIQ_VALUE_OPTIONS)) > 1:
+                return False
+        elif program == "ctags":
+            if not _ctags_prints(words):
+                return False
+        elif program not in READ_ONLY_PROGRAMS:
+            return False
+        writing = WRITING_OPTIONS.get(program, set())
+        if any(_is_writing_option(word, writing) for word in words[1:]):
+            return False
+    return True
+
+
+def _is_writing_option(word: str, writing: Set[str]) -> bool:
+    if word.startswith("--"):
+        name = word.split("=", 1)[0]
+        return len(name) > 2 and any(option.startswith(name) for option in writing if option.startswith("--"))
+    if word.startswith("-") and len(word) > 1:
+        if word in writing:
+            return True
+        return any(f"-{letter}" in writing for letter in word[1:])
+    return False
+
+
+def _operands(words: List[str], value_options: Set[str]) -> List[str]:
+    operands = []
+    position = 1
+    while position < len(words):
+        word = words[position]
+        if word == "--":
+            return operands + words[position + 1:]
+        if word == "-" or not word.startswith("-"):
+            operands.append(word)
+        elif word in value_options:
+            position += 1
+        position += 1
+    return operands
+
+
+def _ctags_prints(words: List[str]) -> bool:
+    """ctags writes a tags file (./tags by default) unless it prints a cross reference (-x) or its tags (-f -)."""
+    to_stdout = False
+    for word, following in zip(words[1:], words[2:] + [""]):
+        if word.startswith("--") or len(word) < 2 or not word.startswith("-"):
+            continue
+        if "f" in word or "o" in word:
+            # -f and -o name the tags file; in any other spelling they could name a real one
+            if (word in ("-f", "-o") and following == "-") or word in ("-f-", "-o-"):
+                to_stdout = True
+            else:
+                return False
+    return to_stdout or "-x" in words
+
+
+def is_under(path: str, prefix: str) -> bool:
+    return path == prefix or path.startswith(prefix.rstrip(os.sep) + os.sep)
+
+
+def command_paths(command: str, root: str) -> List[str]:
+    """
+    The paths a terminal command works on: its working directory (root) plus every word that
+    looks like a path (contains a '/', or starts with '~' or '..'), resolved against root.
+    Patterns that merely look like paths stay inside root, so they never widen what a path rule allows.
+    """
+    try:
+        words = shlex.split(command)
+    except ValueError:
+        words = command.split()
+    paths = [root]
+    for word in words[1:]:
+        value = word.split("=", 1)[1] if word.startswith("-") and "=" in word else word
+        if value.startswith("-") or not ("/" in value or value.startswith(("~", ".."))):
+            continue
+        paths.append(os.path.join(root, os.path.expanduser(value)))
+    return [os.path.realpath(path) for path in paths]
+
+
+def names_ignored_file(command: str, root: str) -> bool:
+    """Whether an argument of command names a file (or directory) git ignores below root."""
+    words = [word for part in re.split(r"\|\||&&|\|", command) for word in shlex.split(part)[1:]
+             if not word.startswith("-")]
+    if not words:
+        return False
+    try:
+        # Exits with 0 if any of the paths is ignored, 1 if none is, 128 outside git repositories
+        return subprocess.run(["git", "check-ignore", "--", *words], stdout=subprocess.DEVNULL,
+                              stderr=subprocess.DEVNULL, cwd=root).returncode == 0
+    except (FileNotFoundError, NotADirectoryError):
+        return False
+
+
+def tree_fingerprint(root: str) -> Optional[str]:
+    """
+    Cheap fingerprint of the working tree below root: the git HEAD plus the status, size and
+    mtime of every modified or untracked file (each file of an untracked directory, whose own
+    mtime does not change when a file in it is edited). Ignored files are not covered. Outside
+    git repositories the change log cursor of a running FileWatcher is used (valid for this
+    session only); otherwise None (not cacheable).
+    """
+    try:
+        head = subprocess.run(["git", "rev-parse", "HEAD"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                              check=True, cwd=root).stdout
+        status = subprocess.run(["git", "status", "--porcelain", "-z", "--untracked-files=all"], stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL, check=True, cwd=root).stdout
+    except (subprocess.CalledProcessError, FileNotFoundError, NotADirectoryError):
+        watcher = get_watcher(root)
+        if watcher is None:
+            return None
+        watcher.flush()
+        return f"watch:{id(watcher)}:{watcher.change_log.cursor()}"
+
+    digest = hashlib.sha1(head)
+    digest.update(status)
+    for entry in status.split(b"\0"):
+        path = entry[3:]
+        if not path:
+            continue
+        try:
+            stat = os.stat(os.path.join(root, os.fsdecode(path)))
+            digest.update(f"{stat.st_size}:{stat.st_mtime_ns}".encode())
+        except OSError:
+            digest.update(b"-")
+    return digest.hexdigest()
+
+
+class CommandCache:
+    """
+    On-disk cache of read-only terminal command results (the raw output, without the summary),
+    stored as JSON in <root>/.codesearch/command_cache with one file per key. The key covers the normalized
+    command, root and tree_fingerprint(root), plus the tool arguments that shape the result.
+    Commands naming paths outside root or ignored by git are not cached, the fingerprint does
+    not cover them.
+    The least recently used entries (by file mtime, which is bumped on every hit) are evicted
+    once the cache grows beyond max_bytes.
+    """
+
+    def __init__(self, root: str, max_bytes: int = TERMINAL_CACHE_MAX_BYTES):
+        self.root = os.path.realpath(root)
+        self.cache_dir = os.path.join(self.root, INDEX_DIR, CACHE_DIR)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._sizes: Optional[Dict[str, int]] = None
+        self._lock = threading.Lock()
+
+    def key(self, command: str, **arguments) -> Optional[str]:
+        """Cache key of command, or None if its result may not be cached."""
+        if self.max_bytes <= 0 or not is_read_only(command):
+            return None
+        # The fingerprint only covers the files below root that git does not ignore
+        if not all(is_under(path, self.root) for path in command_paths(command, self.root)):
+            return None
+        if names_ignored_file(command, self.root):
+            return None
+        fingerprint = tree_fingerprint(self.root)
+        if fingerprint is None:
+            return None
+        parts = [str(CACHE_VERSION), normalize_command(command), self.root, fingerprint]
+        parts.extend(f"{name}={value!r}" for name, value in sorted(arguments.items()))
+        return hashlib.sha256("\0".join(parts).encode("utf-8", errors="surrogateescape")).hexdigest()
+
+    def get(self, key: str) -> Optional[BaseToolResult]:
+        path = os.path.join(self.cache_dir, key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                result = json.load(f)
+            if not isinstance(result, dict) or not isinstance(result.get("items"), list):
+                raise ValueError("not a result")
+            os.utime(path)
+        except FileNotFoundError:
+            result = None
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable command cache entry {path}: {e}")
+            result = None
+        with self._lock:
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        logger.debug(f"Command cache {'hit' if result is not None else 'miss'} {key} ({self.hits} hits, {self.misses} misses)")
+        return result
+
+    def put(self, key: str, result: BaseToolResult) -> None:
+        stored = {name: value for name, value in result.items() if name not in UNCACHED_FIELDS}
+        stored["items"] = list(stored["items"])
+        data = json.dumps(stored, separators=(",", ":")).encode("utf-8")
+        if len(data) > self.max_bytes:
+            return
+        path = os.path.join(self.cache_dir, key)
+        try:
+            ensure_index_dir(self.root)
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(f"{path}.tmp", "wb") as f:
+                f.write(data)
+            os.replace(f"{path}.tmp", path)
+        except OSError as e:
+            logger.warning(f"Could not write command cache entry {path}: {e}")
+            return
+        with self._lock:
+            sizes = self._entry_sizes()
+            sizes[key] = len(data)
+            if sum(sizes.values()) > self.max_bytes:
+                self._evict(sizes)
+
+    def _entry_sizes(self) -> Dict[str, int]:
+        if self._sizes is None:
+            self._sizes = {}
+            try:
+                with os.scandir(self.cache_dir) as entries:
+                    for entry in entries:
+                        if entry.is_file() and not entry.name.endswith(".tmp"):
+                            self._sizes[entry.name] = entry.stat().st_size
+            except OSError:
+                pass
+        return self._sizes
+
+    def _evict(self, sizes: Dict[str, int]) -> None:
+        recency = []
+        for key in sizes:
+            try:
+                recency.append((os.stat(os.path.join(self.cache_dir, key)).st_mtime_ns, key))
+            except OSError:
+                recency.append((0, key))
+        total = sum(sizes.values())
+        for _, key in sorted(recency):
+            if total <= self.max_bytes:
+                break
+            total -= sizes.pop(key)
+            try:
+                os.remove(os.path.join(self.cache_dir, key))
+            except OSError:
+                pass
+
+    def stats(self) -> List[str]:
+        with self._lock:
+            sizes = self._entry_sizes()
+            return [
+                f"{self.root}: {self.hits} hits, {self.misses} misses, "
+                f"{len(sizes)} entries, {sum(sizes.values()) / 1024:.0f}KiB of {self.max_bytes / 1024:.0f}KiB"
+            ]
+
+
+_caches: Dict[str, CommandCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_command_cache(root: str) -> CommandCache:
+    """Return the process-wide command cache for root, creating it on first use."""
+    key = os.path.realpath(root)
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            cache = _caches[key] = CommandCache(key)
+        return cache
+
+
+def command_cache_stats() -> List[str]:
+    with _caches_lock:
+        caches = list(_caches.values())
+    return [line for cache in caches for line in cache.stats()]
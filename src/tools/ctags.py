@@ -1,26 +1,156 @@
+import heapq
+import json
 import logging
 import os
+import re
 import subprocess
-from typing import List
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional
 
 from .base import BaseTool, ToolAbortedException
+from .directory import DEFAULT_EXCLUDE_DIRS
+from .file_cache import get_line_index
+from .ignore import DirectoryIgnore, ExcludeMatcher
+from .references import get_reference_index
+from .scanner import scan_tree
+from .snapshot import INDEX_DIR, ensure_index_dir
+from .tags_index import get_tags_index
+from .watcher import get_watcher
+from ..config.settings import CTAGS_WORKERS
 from ..shared import colored_print
 
 logger = logging.getLogger(__name__)
 
 from .types import BaseToolResult
 
+# Change log cursor of the watcher at the time each tags file was last brought up to date
+_tags_cursors: Dict[str, int] = {}
+# Tool calls may run concurrently: one writer of tags files (and their state) at a time
+_generate_lock = threading.Lock()
+
+# Size and mtime of every tagged file, stored in <dir>/.codesearch/ for incremental generate_tags
+TAGS_STATE_FILE = "tags_state.json"
+TAGS_STATE_VERSION = 1
+# Above this share of changed files a full ctags run is cheaper than splicing
+FULL_REBUILD_RATIO = 0.5
+# Below this many files per shard the extra ctags processes are not worth it
+MIN_FILES_PER_SHARD = 200
+
+
+def shard_files(sizes: Dict[str, int], shards: int) -> List[List[str]]:
+    """Split files into at most `shards` groups of similar total byte size, largest files first."""
+    totals = [(0, i) for i in range(shards)]
+    groups: List[List[str]] = [[] for _ in range(shards)]
+    for path, size in sorted(sizes.items(), key=lambda item: (-item[1], item[0])):
+        total, i = heapq.heappop(totals)
+        groups[i].append(path)
+        heapq.heappush(totals, (total + size, i))
+    return [sorted(group) for group in groups if group]
+
+
+def _tag_lines(tags_file: str) -> Iterator[str]:
+    with open(tags_file, "r", encoding="utf-8", errors="surrogateescape") as f:
+        for line in f:
+            if not line.startswith("!_"):
+                yield line.rstrip("\n")
+
+
+def merge_tags_files(shard_tags_files: List[str], tags_file: str) -> None:
+    """Merge sorted tags files into tags_file; pseudo tags of all shards are kept once."""
+    header = set()
+    for shard_tags_file in shard_tags_files:
+        with open(shard_tags_file, "r", encoding="utf-8", errors="surrogateescape") as f:
+            header.update(line.rstrip("\n") for line in f if line.startswith("!_"))
+    tmp_path = f"{tags_file}.tmp"
+    with open(tmp_path, "w", encoding="utf-8", errors="surrogateescape") as f:
+        for line in sorted(header):
+            f.write(line + "\n")
+        for line in heapq.merge(*(_tag_lines(path) for path in shard_tags_files)):
+            f.write(line + "\n")
+    os.replace(tmp_path, tags_file)
+
+
+def list_source_files(cwd: str) -> List[str]:
+    """Files to tag below cwd: `git ls-files`, or for other directories every file not excluded or ignored."""
+    try:
+        git_ls_files = subprocess.run(
+            ["git", "ls-files"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True, text=True, cwd=cwd
+        )
+        return [path for path in git_ls_files.stdout.splitlines() if path]
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        logger.info(f"{cwd} is not a git repository, tagging all files that are not excluded or ignored")
+    root = os.path.realpath(cwd)
+    listings = scan_tree(root, ExcludeMatcher(DEFAULT_EXCLUDE_DIRS), ignore=DirectoryIgnore.for_parent_of(root, root))
+    tags_file = os.path.join(root, "tags")
+    prefix = len(os.path.join(root, ""))  # scan_tree paths are joined onto root, cheaper than relpath
+    return sorted(
+        path[prefix:]
+        for listing in listings.values() if listing is not None
+        for path, _, _ in listing.files if path != tags_file
+    )
+
+
+def splice_tags(tags_file: str, cwd: str, rel_paths: Iterable[str]) -> None:
+    """
+    Re-tag rel_paths (relative to cwd) and replace their entries in tags_file, keeping it sorted.
+    Entries of paths that no longer exist are only removed, including everything below a removed
+    or renamed directory.
+    """
+    rel_paths = sorted(set(rel_paths))
+    existing = [path for path in rel_paths if os.path.isfile(os.path.join(cwd, path))]
+    new_lines = []
+    if existing:
+        output = subprocess.run(
+            ["ctags", "-f", "-", "-L", "-"], input="\n".join(existing), stdout=subprocess.PIPE,
+            check=True, text=True, errors="surrogateescape", cwd=cwd
+        ).stdout
+        new_lines = sorted(line for line in output.splitlines() if line and not line.startswith("!_"))
+
+    dropped = set(rel_paths)
+    removed_dirs = tuple(path + "/" for path in rel_paths if not os.path.exists(os.path.join(cwd, path)))
+    header, kept = [], []
+    with open(tags_file, "r", encoding="utf-8", errors="surrogateescape") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if line.startswith("!_"):
+                header.append(line)
+                continue
+            fields = line.split("\t", 2)
+            if len(fields) > 1 and (fields[1] in dropped or fields[1].startswith(removed_dirs)):
+                continue
+            kept.append(line)
+
+    tmp_path = f"{tags_file}.tmp"
+    with open(tmp_path, "w", encoding="utf-8", errors="surrogateescape") as f:
+        for line in header:
+            f.write(line + "\n")
+        for line in heapq.merge(kept, new_lines):
+            f.write(line + "\n")
+    os.replace(tmp_path, tags_file)
+
 class CtagsTool(BaseTool):
+    name = "ctags_readtags_tool"
+
     def print_verbose_output(self, result: BaseToolResult):
         for line in result["items"]:
             colored_print(line, color="YELLOW")
 
-    def get_tool_text_start(self, action: str, input_path: str = "", symbol: str = "", kind: str = "", limit: int = 50, is_symbol_regex: bool = False, **kwargs) -> List[str]:
+    def get_tool_text_start(self, action: str, input_path: str = "", symbol: str = "", kind: str = "", limit: int = 50, is_symbol_regex: bool = False, full_rebuild: bool = False, **kwargs) -> List[str]:
         if action == 'generate_tags':
             return [
                 "Query ctags",
                 f"action: {action}",
-                f"input_path: {input_path}"
+                f"input_path: {input_path}",
+                f"full_rebuild: {full_rebuild}"
+            ]
+        if action == 'references':
+            return [
+                "Query references",
+                f"input_path: {input_path}",
+                f"symbol: {symbol}",
+                f"limit: {limit} lines (it summarizes output if above)"
             ]
         return [
             "Query ctags",
@@ -42,7 +172,7 @@ class CtagsTool(BaseTool):
 
 
 
-    def _run(self, intention_of_this_call: str, action: str, input_path: str = "", symbol: str = "", kind: str = "", limit: int = 50, exclude_dirs: List[str] = None, is_symbol_regex: bool = False, **kwargs) -> BaseToolResult:
+    def _run(self, intention_of_this_call: str, action: str, input_path: str = "", symbol: str = "", kind: str = "", limit: int = 50, exclude_dirs: List[str] = None, is_symbol_regex: bool = False, full_rebuild: bool = False, project_root: str = None, **kwargs) -> BaseToolResult:
         """Run ctags/readtags actions."""
         # Run actions based on provided parameters
         if os.path.isdir(input_path):
@@ -51,62 +181,58 @@ class CtagsTool(BaseTool):
             tags_file = f"{input_path}_tags"
 
         if action == 'generate_tags':
-            if os.path.isdir(input_path):
-                cwd = input_path
-                git_ls_files = subprocess.run(["git", "ls-files"], stdout=subprocess.PIPE, check=True, text=True, cwd=cwd)
-                ctags_cmd = ["ctags", "-f", "tags", "-L", "-"]
-                subprocess.run(ctags_cmd, input=git_ls_files.stdout, text=True, check=True, cwd=cwd)
-            else:
-                cmd = ["ctags", "-R", "-f", tags_file]
-                cmd.append(input_path)
-                self._run_command(cmd)
+            with _generate_lock:
+                watcher = get_watcher(input_path)
+                if watcher is not None:
+                    _tags_cursors[os.path.realpath(tags_file)] = watcher.change_log.cursor()
+                if os.path.isdir(input_path):
+                    self._generate_directory_tags(input_path, full_rebuild)
+                else:
+                    cmd = ["ctags", "-R", "-f", tags_file]
+                    cmd.append(input_path)
+                    self._run_command(cmd)
             # After generation, no entries returned
             return BaseToolResult(total_count=0, returned_count=0, items=[])
 
-        # For readtags-based queries, ensure tags file exists
+        if action == 'references':
+            if not symbol:
+                raise ToolAbortedException("The references action needs a symbol.")
+            return self._references(input_path, symbol, project_root)
+
+        # For tag queries, ensure tags file exists
         if not os.path.exists(tags_file):
             logger.error("No tags file found. Run 'generate_tags' first.")
             #return BaseToolResult(total_count=0, returned_count=0, items=[])
             raise ToolAbortedException("No tags file found. Run 'generate_tags' first.")
-
-        # Base command with extension fields and line numbers
-        base_cmd = ["readtags", "-t", tags_file, "-e", "-n"]
+        if os.path.isdir(input_path):
+            with _generate_lock:
+                self._update_from_watcher(input_path, tags_file)
 
         symbol = None if symbol == "" else symbol
         symbol = None if symbol == "." else symbol
 
         kind = None if kind == "" else kind
-        if action == 'filter':
-            # Unified logic
-            if is_symbol_regex:
-                if symbol and kind:
-                    cmd = base_cmd + ["-Q", f'(and (#/{symbol}/ $name) (eq? $kind "{kind}"))', "-l"]
-                elif symbol:
-                    cmd = base_cmd + ["-Q", f'(#/{symbol}/ $name)', "-l"]
-                elif kind:
-                    cmd = base_cmd + ["-Q", f'(eq? $kind "{kind}")', "-l"]
-                else:
-                    cmd = base_cmd + ["-l"]
-            else:
-                if not symbol and not kind:
-                    cmd = base_cmd + ["-l"]
-                elif symbol and kind:
-                    cmd = base_cmd + ["-i", symbol, "-Q", f'(eq? $kind "{kind}")']
-                elif symbol:
-                    cmd = base_cmd + ["-i", symbol]
-                elif kind:
-                    cmd = base_cmd + ["-Q", f'(eq? $kind "{kind}")', "-l"]
-                else:
-                    logger.error(f"Unknown action: {action}")
-                    return BaseToolResult(total_count=0, returned_count=0, items=[])
-
-        else:
+        if action != 'filter':
             logger.error(f"Unknown action: {action}")
             raise ToolAbortedException("Unknown action")
 
-        # Run readtags command and get output lines
-        output = self._run_command(cmd)
-        lines = [line.strip() for line in output.splitlines() if line.strip()]
+        # Same selection as `readtags -e -n` with -i NAME, -Q '(#/re/ $name)' and -Q '(eq? $kind ...)'
+        index = get_tags_index(tags_file)
+        if is_symbol_regex and symbol:
+            try:
+                indices = index.search(symbol, kind)
+            except re.error as e:
+                logger.error(f"Invalid symbol regex {symbol!r}: {e}")
+                indices = []
+        elif symbol:
+            indices = index.lookup(symbol, ignore_case=True)
+            if kind:
+                indices = [i for i in indices if index.entry(i).kind == kind]
+        elif kind:
+            indices = index.of_kind(kind)
+        else:
+            indices = index.all()
+        lines = [line.strip() for line in index.format(indices) if line.strip()]
 
         # Truncate results if needed
         return BaseToolResult(
@@ -114,6 +240,125 @@ class CtagsTool(BaseTool):
             items=lines
         )
 
+    def _generate_directory_tags(self, cwd: str, full_rebuild: bool = False, workers: int = CTAGS_WORKERS) -> None:
+        """
+        Tag the files below cwd (see list_source_files). Files whose size and mtime did not change
+        since the last run keep their tags; changed files are re-tagged and the tags of deleted
+        files are removed (see splice_tags). Without a previous state, or when most files changed,
+        all files are tagged again, by up to `workers` ctags processes.
+        """
+        stats = {}
+        for path in list_source_files(cwd):
+            try:
+                stat = os.stat(os.path.join(cwd, path))
+                stats[path] = [stat.st_mtime_ns, stat.st_size]
+            except OSError:
+                pass  # deleted but not yet committed
+
+        state_path = os.path.join(cwd, INDEX_DIR, TAGS_STATE_FILE)
+        previous = None if full_rebuild else self._load_tags_state(state_path)
+        if previous is not None and os.path.exists(os.path.join(cwd, "tags")):
+            changed = [path for path, stat in stats.items() if previous.get(path) != stat]
+            changed.extend(path for path in previous if path not in stats)
+            if len(changed) <= FULL_REBUILD_RATIO * max(len(stats), 1):
+                if changed:
+                    logger.info(f"Re-tagging {len(changed)} of {len(stats)} files")
+                    splice_tags(os.path.join(cwd, "tags"), cwd, changed)
+                self._save_tags_state(cwd, state_path, stats)
+                return
+
+        self._tag_all(cwd, {path: stat[1] for path, stat in stats.items()}, workers)
+        self._save_tags_state(cwd, state_path, stats)
+
+    @staticmethod
+    def _tag_all(cwd: str, sizes: Dict[str, int], workers: int) -> None:
+        """
+        Write cwd/tags for all files in sizes. With several workers the files are split into shards
+        of similar byte size, each shard is tagged (and sorted) by its own ctags process, and the
+        sorted shard files are merged.
+        """
+        shards = shard_files(sizes, max(1, min(workers, len(sizes) // MIN_FILES_PER_SHARD)))
+        if len(shards) <= 1:
+            logger.info(f"Tagging all {len(sizes)} files")
+            ctags_cmd = ["ctags", "-f", "tags", "-L", "-"]
+            subprocess.run(ctags_cmd, input="\n".join(sorted(sizes)), text=True, check=True, cwd=cwd)
+            return
+
+        logger.info(f"Tagging all {len(sizes)} files with {len(shards)} ctags processes")
+        with tempfile.TemporaryDirectory(dir=ensure_index_dir(cwd)) as tmp_dir:
+            shard_tags_files = [os.path.join(tmp_dir, f"shard_{i}.tags") for i in range(len(shards))]
+
+            def tag_shard(i: int) -> None:
+                ctags_cmd = ["ctags", "--tag-relative=no", "-f", shard_tags_files[i], "-L", "-"]
+                subprocess.run(ctags_cmd, input="\n".join(shards[i]), text=True, check=True, cwd=cwd)
+
+            # The work happens in the ctags processes, threads only wait for them
+            with ThreadPoolExecutor(max_workers=len(shards)) as pool:
+                list(pool.map(tag_shard, range(len(shards))))
+            merge_tags_files(shard_tags_files, os.path.join(cwd, "tags"))
+
+    @staticmethod
+    def _load_tags_state(state_path: str) -> Optional[Dict[str, List[int]]]:
+        try:
+            with open(state_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return data.get("files") if data.get("version") == TAGS_STATE_VERSION else None
+
+    @staticmethod
+    def _save_tags_state(cwd: str, state_path: str, stats: Dict[str, List[int]]) -> None:
+        ensure_index_dir(cwd)
+        try:
+            tmp_path = f"{state_path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({"version": TAGS_STATE_VERSION, "files": stats}, f, separators=(",", ":"))
+            os.replace(tmp_path, state_path)
+        except OSError as e:
+            logger.warning(f"Could not write tags state {state_path}: {e}")
+
+    def _references(self, input_path: str, symbol: str, project_root: str = None) -> BaseToolResult:
+        """Lines containing the identifier symbol below input_path, as "path:line:text"."""
+        root = os.path.realpath(project_root or (input_path if os.path.isdir(input_path) else os.path.dirname(input_path)))
+        index = get_reference_index(root)
+        index.refresh()
+        prefix = os.path.relpath(os.path.realpath(input_path), root)
+        prefix = "" if prefix == "." else prefix
+        items = []
+        for rel_path, line in index.lookup(symbol):
+            if prefix and rel_path != prefix and not rel_path.startswith(prefix + os.sep):
+                continue
+            try:
+                lines = get_line_index(os.path.join(root, rel_path)).lines(line, line)
+            except OSError:
+                lines = []
+            text = lines[0].strip() if lines else ""
+            items.append(f"{rel_path}:{line}:{text}")
+        return BaseToolResult(total_count=len(items), items=items)
+
+    def _update_from_watcher(self, input_path: str, tags_file: str) -> None:
+        """Re-tag the files the watcher saw changing since the tags file was generated."""
+        watcher = get_watcher(input_path)
+        key = os.path.realpath(tags_file)
+        if watcher is None or key not in _tags_cursors:
+            return
+        watcher.flush()
+        cursor, paths = watcher.change_log.changes_since(_tags_cursors[key])
+        root = os.path.realpath(input_path)
+        if paths is None:
+            logger.info("Watcher lost events, checking all files for changes")
+            self._generate_directory_tags(root)
+        else:
+            rel_paths = [
+                os.path.relpath(path, root) for path in paths
+                if path.startswith(root + os.sep) and path != key and not path.startswith(key + ".")
+                and not os.path.isdir(path)
+            ]
+            if rel_paths:
+                logger.info(f"Re-tagging {len(rel_paths)} changed files")
+                splice_tags(tags_file, root, rel_paths)
+        _tags_cursors[key] = cursor
+
     def _run_command(self, cmd: List[str]) -> str:
         import subprocess
         logger.info(f"Running command: {' '.join(cmd)}")
@@ -4,14 +4,34 @@ import fnmatch
 import json
 import logging
 import os
+from array import array
+from collections.abc import Sequence
+from dataclasses import dataclass
 from datetime import datetime
-from typing import List, Optional
+from typing import Callable, Dict, Generator, Iterator, List, Optional, Tuple, Union
 
 from .base import BaseTool
+from .file_kind import classify_name
+from .ignore import IGNORE_FILES, DirectoryIgnore, ExcludeMatcher
+from .scanner import DirListing, scan_directory, scan_tree
+from .snapshot import INDEX_DIR, get_snapshot
+from ..config.settings import DIRECTORY_WORKERS
 from ..shared import colored_print
+from ..summarize_agent.main_agent import MAX_TOOL_OUTPUT_BYTES, MAX_TOOL_OUTPUT_LINES
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_EXCLUDE_DIRS = [
+    ".git", ".hg", ".svn", ".DS_Store", "node_modules", "bower_components",
+    "dist", "build", "env", "venv", ".venv", "__pycache__", ".pytest_cache",
+    ".mypy_cache", ".cache", ".idea", ".vscode", "vendor", "out", "target",
+    ".bundle", "coverage", "bin", "nuget", "*nuget*",  ".nuget", "obj", "debug", "release",
+    INDEX_DIR
+]
+
+# Directories counted with plain scandir after a streaming walk stopped early (then extrapolated)
+STREAM_COUNT_BUDGET_DIRS = 10000
+
 def entry_to_json(
     path: str,
     entry_type: str,
@@ -29,21 +49,97 @@ def entry_to_json(
     return json.dumps(entry_dict)
 
 
+ENTRY_TYPES = ("file", "directory")
+# Upper bound of the JSON length of an entry (with its newline) apart from its name and path,
+# to tell the size of streamed entries without serializing them
+ENTRY_JSON_BYTES = len(entry_to_json("", "directory", 10 ** 12, datetime(2000, 1, 1, microsecond=1).isoformat())) + 1
+
+
+def _is_listed(name: str, file_filter: Optional[str], skip_generated: bool) -> bool:
+    """Whether a file name matches file_filter; with skip_generated lock, minified, generated and binary files do not."""
+    if file_filter is not None and not fnmatch.fnmatch(name, file_filter):
+        return False
+    return not skip_generated or classify_name(name) is None
+
+
+class DirectoryEntries(Sequence):
+    """
+    Directory entries stored column-wise (struct of arrays) instead of one JSON string each.
+
+    Sizes and mtimes live in typed arrays and the entry type in a bytearray, so an entry costs
+    little more than its path string. It behaves like a read-only list of JSON strings: an entry
+    is serialized with entry_to_json only when it is accessed, i.e. when the result crosses the
+    tool boundary (summarizer input or agent response).
+    """
+    __slots__ = ("paths", "types", "sizes", "mtimes")
+
+    def __init__(self):
+        self.paths: List[str] = []
+        self.types = bytearray()
+        self.sizes = array('q')
+        self.mtimes = array('d')
+
+    def append(self, path: str, entry_type: str, size: int, mtime: float):
+        self.paths.append(path)
+        self.types.append(ENTRY_TYPES.index(entry_type))
+        self.sizes.append(size)
+        self.mtimes.append(mtime)
+
+    def entry_type(self, index: int) -> str:
+        return ENTRY_TYPES[self.types[index]]
+
+    def modified(self, index: int) -> str:
+        return datetime.fromtimestamp(self.mtimes[index]).isoformat()
+
+    def to_json(self, index: int) -> str:
+        return entry_to_json(
+            path=self.paths[index],
+            entry_type=self.entry_type(index),
+            size=self.sizes[index],
+            modified=self.modified(index)
+        )
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[str, List[str]]:
+        if isinstance(index, slice):
+            return [self.to_json(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("DirectoryEntries index out of range")
+        return self.to_json(index)
+
+    def __iter__(self) -> Iterator[str]:
+        return (self.to_json(i) for i in range(len(self)))
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, DirectoryEntries):
+            return (self.paths == other.paths and self.types == other.types
+                    and self.sizes == other.sizes and self.mtimes == other.mtimes)
+        return NotImplemented
+
+
 from .types import BaseToolResult
 
 class DirectoryTool(BaseTool):
+    name = "directory"
+
     def print_verbose_output(self, result: BaseToolResult):
         """Print detailed directory scan results in yellow color"""
-        for entry_json in result['items']:
-            try:
-                entry = json.loads(entry_json)
-                entry_type = entry['type'].ljust(10)
-                path = entry['path']
-                size = f"size={entry['size']}"
-                modified = f"modified={entry['modified']}"
-                colored_print(f"{entry_type} {path} ({size}, {modified})", color="YELLOW")
-            except json.JSONDecodeError:
-                logger.error(f"Failed to parse entry JSON: {entry_json}")
+        entries: DirectoryEntries = result['items']
+        for i in range(len(entries)):
+            entry_type = entries.entry_type(i).ljust(10)
+            size = f"size={entries.sizes[i]}"
+            modified = f"modified={entries.modified(i)}"
+            colored_print(f"{entry_type} {entries.paths[i]} ({size}, {modified})", color="YELLOW")
+
+    def get_tool_text_end(self, result: BaseToolResult, **kwargs) -> str:
+        end_text = super().get_tool_text_end(result, **kwargs)
+        if result.get('is_total_estimated'):
+            return end_text.replace("total_lines: ", "total_lines: ~")
+        return end_text
 
     def get_tool_text_start(
         self, path: str, limit: int, max_depth: Optional[int], exclude_dirs: List[str],
@@ -70,6 +166,12 @@ class DirectoryTool(BaseTool):
         exclude_dirs: List[str] = None,
         file_filter: Optional[str] = None,
         hide_empty_folder: bool = False,
+        workers: Optional[int] = None,
+        project_root: Optional[str] = None,
+        rebuild_snapshot: bool = False,
+        stream: bool = False,
+        use_ignore_files: bool = False,
+        include_generated: bool = False,
         **kwargs
     ) -> BaseToolResult:
         """
@@ -80,28 +182,109 @@ class DirectoryTool(BaseTool):
         :param limit: The maximum number of entries to return.
         :param max_depth: The maximum depth of directories to recurse into.
                           If None, there is no depth limit.
-        :param exclude_dirs: A list of directory names to exclude.
+        :param exclude_dirs: A list of directory names or glob patterns (e.g. "*nuget*") to exclude.
+        :param workers: Number of scandir worker threads. 1 uses the single-threaded
+                        recursive walker. Defaults to DIRECTORY_WORKERS.
+        :param project_root: If given, the query is answered from the persistent directory
+                             snapshot of project_root (refreshed incrementally) whenever
+                             exclude_dirs contains all DEFAULT_EXCLUDE_DIRS and
+                             use_ignore_files is set.
+        :param rebuild_snapshot: Force a full rebuild of the directory snapshot.
+        :param stream: Stop the traversal once enough entries are collected for the summarizer
+                       (more than limit, at least MAX_TOOL_OUTPUT_LINES entries or
+                       MAX_TOOL_OUTPUT_BYTES of JSON). total_count is then counted from the
+                       snapshot or estimated (is_total_estimated).
+        :param use_ignore_files: Skip entries ignored by .gitignore/.ignore files (including those
+                                 of the parent directories up to project_root). Ignored
+                                 directories are pruned before they are listed.
+        :param include_generated: Also list lock files, minified bundles, generated sources and
+                                  binaries (recognized by their names), left out by default.
         """
 
         if max_depth is None or max_depth == -1:
             # If not specified, treat as unlimited depth.
             max_depth = 999999  # effectively no limit
 
+        exclude_dirs = exclude_dirs or []
+        exclude = ExcludeMatcher(exclude_dirs)
+        ignore = DirectoryIgnore.for_parent_of(path, project_root) if use_ignore_files else None
+        workers = DIRECTORY_WORKERS if workers is None else workers
+        skip_generated = not include_generated
+
         logger.info(
             f"Running directory tool with path: {path}, "
-            f"limit: {limit}, max_depth: {max_depth}"
+            f"limit: {limit}, max_depth: {max_depth}, workers: {workers}"
         )
 
-        all_entries = []
-        self._flatten_helper(
-            path,
-            exclude_dirs,
-            all_entries,
-            current_depth=0,
-            max_depth=max_depth,
-            file_filter=file_filter,
-            hide_empty_folder=hide_empty_folder
-        )
+        all_entries = DirectoryEntries()
+        snapshot = None
+        if project_root is not None:
+            snapshot = get_snapshot(project_root, DEFAULT_EXCLUDE_DIRS)
+            snapshot.refresh(force_rebuild=rebuild_snapshot)
+
+        use_snapshot = snapshot is not None and use_ignore_files and snapshot.covers(path, exclude_dirs)
+        if stream:
+            if use_snapshot:
+                list_dir = lambda dir_path, parent: snapshot.listings.get(dir_path)
+            else:
+                list_dir = lambda dir_path, parent: scan_directory(
+                    dir_path, exclude, file_filter, ignore=parent.ignore if parent is not None else ignore
+                )
+            total_count, is_estimate = self._stream_entries(
+                path,
+                list_dir,
+                all_entries,
+                max_entries=max(limit + 1, MAX_TOOL_OUTPUT_LINES),
+                max_bytes=MAX_TOOL_OUTPUT_BYTES,
+                exact_count=use_snapshot,
+                hide_empty_folder=hide_empty_folder,
+                file_filter=file_filter,
+                skip_generated=skip_generated,
+                exclude=exclude,
+                max_depth=max_depth
+            )
+            return BaseToolResult(
+                total_count=total_count,
+                returned_count=len(all_entries),
+                items=all_entries,
+                is_total_estimated=is_estimate
+            )
+
+        if use_snapshot:
+            self._emit_listing(
+                path,
+                snapshot.listings,
+                all_entries,
+                hide_empty_folder,
+                file_filter=file_filter,
+                skip_generated=skip_generated,
+                exclude=exclude,
+                max_depth=max_depth
+            )
+        elif workers > 1:
+            self._flatten_parallel(
+                path,
+                exclude,
+                all_entries,
+                max_depth=max_depth,
+                file_filter=file_filter,
+                skip_generated=skip_generated,
+                hide_empty_folder=hide_empty_folder,
+                workers=workers,
+                ignore=ignore
+            )
+        else:
+            self._flatten_helper(
+                path,
+                exclude,
+                all_entries,
+                current_depth=0,
+                max_depth=max_depth,
+                file_filter=file_filter,
+                skip_generated=skip_generated,
+                hide_empty_folder=hide_empty_folder,
+                ignore=ignore
+            )
 
         result = BaseToolResult(
             total_count=len(all_entries),
@@ -112,12 +295,14 @@ class DirectoryTool(BaseTool):
     def _flatten_helper(
         self,
         path: str,
-        exclude_dirs: List[str],
-        flattened: List[str],
+        exclude: ExcludeMatcher,
+        flattened: DirectoryEntries,
         current_depth: int,
         max_depth: int,
         file_filter: Optional[str] = None,
-        hide_empty_folder: bool = False
+        skip_generated: bool = False,
+        hide_empty_folder: bool = False,
+        ignore: Optional[DirectoryIgnore] = None
     ) -> bool:
         """
         Recursively traverse the directory structure up to max_depth, adding entries to flattened list.
@@ -140,27 +325,31 @@ class DirectoryTool(BaseTool):
             logger.error(f"Error accessing {path}: {e}")
             return
 
-        # Filter out excluded directories
+        # Load the ignore files of this directory once, then check every entry against them
+        is_ignored = None
+        if ignore is not None:
+            ignore = ignore.child(path, [entry.name for entry in entries if entry.name in IGNORE_FILES])
+            is_ignored = ignore.matcher(path)
+
+        # Filter out excluded directories and ignored entries
         dirs = []
         files = []
         for entry in entries:
-            if entry.is_dir(follow_symlinks=False):
-                if entry.name not in exclude_dirs:
+            is_dir = entry.is_dir(follow_symlinks=False)
+            if is_ignored is not None and is_ignored(entry.name, is_dir):
+                continue
+            if is_dir:
+                if not exclude.matches(entry.name):
                     dirs.append(entry)
             else:
                 files.append(entry)
 
         # Add file entries
         for file_entry in files:
-            if file_filter is None or fnmatch.fnmatch(file_entry.name, file_filter):
+            if _is_listed(file_entry.name, file_filter, skip_generated):
                 try:
                     stat = file_entry.stat()
-                    flattened.append(entry_to_json(
-                        path=file_entry.path,
-                        entry_type="file",
-                        size=stat.st_size,
-                        modified=datetime.fromtimestamp(stat.st_mtime).isoformat()
-                    ))
+                    flattened.append(file_entry.path, "file", stat.st_size, stat.st_mtime)
                     has_content = True
                 except (PermissionError, OSError) as e:
                     logger.warning(f"Error accessing {file_entry.path}: {e}")
@@ -169,12 +358,14 @@ class DirectoryTool(BaseTool):
         for dir_entry in dirs:
             has_subdir_content = self._flatten_helper(
                 dir_entry.path,
-                exclude_dirs,
+                exclude,
                 flattened,
                 current_depth=current_depth+1,
                 max_depth=max_depth,
                 file_filter=file_filter,
-                hide_empty_folder=hide_empty_folder
+                skip_generated=skip_generated,
+                hide_empty_folder=hide_empty_folder,
+                ignore=ignore
             )
             has_content = has_content or has_subdir_content
 
@@ -182,14 +373,209 @@ class DirectoryTool(BaseTool):
         if not hide_empty_folder or has_content:
             try:
                 dir_stat = os.stat(path)
-                flattened.append(entry_to_json(
-                    path=path,
-                    entry_type="directory",
-                    size=0,
-                    modified=datetime.fromtimestamp(dir_stat.st_mtime).isoformat()
-                ))
+                flattened.append(path, "directory", 0, dir_stat.st_mtime)
             except (PermissionError, OSError) as e:
                 logger.warning(f"Error accessing {path}: {e}")
                 return has_content
 
         return has_content
+
+    def _flatten_parallel(
+        self,
+        path: str,
+        exclude: ExcludeMatcher,
+        flattened: DirectoryEntries,
+        max_depth: int,
+        file_filter: Optional[str] = None,
+        skip_generated: bool = False,
+        hide_empty_folder: bool = False,
+        workers: int = DIRECTORY_WORKERS,
+        ignore: Optional[DirectoryIgnore] = None
+    ) -> bool:
+        """
+        Same output as _flatten_helper, but directories are listed by a pool of scandir
+        worker threads fed from a work queue. Once every directory is listed, the entries
+        are emitted in the same (post-order) sequence as the recursive walker.
+        """
+        listings = scan_tree(path, exclude, file_filter, max_depth=max_depth, workers=workers, ignore=ignore)
+        return self._emit_listing(path, listings, flattened, hide_empty_folder, skip_generated=skip_generated)
+
+    def _emit_listing(
+        self,
+        path: str,
+        listings: Dict[str, Optional[DirListing]],
+        flattened: DirectoryEntries,
+        hide_empty_folder: bool,
+        file_filter: Optional[str] = None,
+        skip_generated: bool = False,
+        exclude: Optional[ExcludeMatcher] = None,
+        max_depth: int = 999999
+    ) -> bool:
+        """
+        Append the entries of an already scanned directory tree to flattened.
+        file_filter and exclude only need to be passed if the listings were
+        scanned without them (e.g. when they come from the directory snapshot).
+        """
+        entries = self._iter_listing(
+            path, lambda dir_path, parent: listings.get(dir_path), hide_empty_folder,
+            file_filter=file_filter, skip_generated=skip_generated, exclude=exclude, max_depth=max_depth
+        )
+        while True:
+            try:
+                flattened.append(*next(entries))
+            except StopIteration as stop:
+                return bool(stop.value)
+
+    def _iter_listing(
+        self,
+        path: str,
+        list_dir: Callable[[str, Optional[DirListing]], Optional[DirListing]],
+        hide_empty_folder: bool,
+        file_filter: Optional[str] = None,
+        skip_generated: bool = False,
+        exclude: Optional[ExcludeMatcher] = None,
+        max_depth: int = 999999,
+        stack: Optional[List["_WalkFrame"]] = None
+    ) -> Generator[Tuple[str, str, int, float], None, bool]:
+        """
+        Yield (path, type, size, mtime) in the same post-order as _flatten_helper, listing each
+        directory with list_dir(path, parent_listing) only when the traversal reaches it. The
+        caller can stop at any point; the directories still to be visited are then described by
+        stack. Returns True if any content was yielded.
+        """
+        stack = [] if stack is None else stack
+        if max_depth < 0:
+            return False
+        listing = list_dir(path, None)
+        if listing is None:
+            return False
+        stack.append(_WalkFrame(path, 0, listing))
+
+        has_content = False
+        while stack:
+            frame = stack[-1]
+            files = frame.listing.files
+            while frame.next_file < len(files):
+                file_path, size, mtime = files[frame.next_file]
+                frame.next_file += 1
+                if not _is_listed(os.path.basename(file_path), file_filter, skip_generated):
+                    continue
+                frame.has_content = True
+                yield file_path, "file", size, mtime
+
+            sub_dirs = frame.listing.dirs
+            if frame.next_dir < len(sub_dirs):
+                sub_dir = sub_dirs[frame.next_dir]
+                frame.next_dir += 1
+                if frame.depth + 1 > max_depth or (exclude is not None and exclude.matches(os.path.basename(sub_dir))):
+                    continue
+                listing = list_dir(sub_dir, frame.listing)
+                if listing is not None:
+                    stack.append(_WalkFrame(sub_dir, frame.depth + 1, listing))
+                continue
+
+            stack.pop()
+            if (not hide_empty_folder or frame.has_content) and frame.listing.mtime is not None:
+                yield frame.path, "directory", 0, frame.listing.mtime
+            if stack:
+                stack[-1].has_content = stack[-1].has_content or frame.has_content
+            else:
+                has_content = frame.has_content
+        return has_content
+
+    def _stream_entries(
+        self,
+        path: str,
+        list_dir: Callable[[str, Optional[DirListing]], Optional[DirListing]],
+        flattened: DirectoryEntries,
+        max_entries: int,
+        exact_count: bool,
+        hide_empty_folder: bool,
+        file_filter: Optional[str] = None,
+        skip_generated: bool = False,
+        exclude: Optional[ExcludeMatcher] = None,
+        max_depth: int = 999999,
+        max_bytes: Optional[int] = None
+    ) -> Tuple[int, bool]:
+        """
+        Collect at most max_entries entries, or about max_bytes of their JSON, and stop walking.
+        Returns (total_count, is_estimate).
+        With exact_count (in-memory listings) the rest of the tree is only counted; otherwise the
+        rest is estimated from cheap per-directory counts of the directories not visited yet.
+        """
+        stack: List[_WalkFrame] = []
+        entries = self._iter_listing(
+            path, list_dir, hide_empty_folder,
+            file_filter=file_filter, skip_generated=skip_generated, exclude=exclude, max_depth=max_depth, stack=stack
+        )
+        entry_bytes = 0
+        for entry in entries:
+            flattened.append(*entry)
+            if len(flattened) >= max_entries:
+                break
+            if max_bytes is not None:
+                entry_bytes += ENTRY_JSON_BYTES + len(entry[0]) + len(os.path.basename(entry[0]))
+                if entry_bytes >= max_bytes:
+                    break
+        else:
+            return len(flattened), False
+
+        if exact_count:
+            return len(flattened) + sum(1 for _ in entries), False
+
+        remaining, is_estimate = self._count_unvisited(stack, file_filter, exclude, max_depth, skip_generated=skip_generated)
+        return len(flattened) + remaining, is_estimate or hide_empty_folder
+
+    def _count_unvisited(
+        self,
+        stack: List["_WalkFrame"],
+        file_filter: Optional[str],
+        exclude: Optional[ExcludeMatcher],
+        max_depth: int,
+        budget: int = STREAM_COUNT_BUDGET_DIRS,
+        skip_generated: bool = False
+    ) -> Tuple[int, bool]:
+        """
+        Count the entries the traversal did not reach. Unvisited directories are listed without
+        stat calls. After budget directories the remaining directories are extrapolated from the
+        average entry count per directory. Returns (count, is_estimate).
+        """
+        exclude = exclude or ExcludeMatcher([])
+        count = 0
+        pending: List[Tuple[str, int, DirListing]] = []
+        for frame in stack:
+            count += 1  # the directory entry itself is emitted after its children
+            for file_path, _, _ in frame.listing.files[frame.next_file:]:
+                if _is_listed(os.path.basename(file_path), file_filter, skip_generated):
+                    count += 1
+            pending.extend((sub_dir, frame.depth + 1, frame.listing) for sub_dir in frame.listing.dirs[frame.next_dir:])
+
+        scanned_dirs = 0
+        scanned_entries = 0
+        while pending:
+            if scanned_dirs >= budget:
+                average = scanned_entries / scanned_dirs
+                return count + scanned_entries + int(average * len(pending)), True
+            dir_path, depth, parent = pending.pop()
+            if depth > max_depth or exclude.matches(os.path.basename(dir_path)):
+                continue
+            listing = scan_directory(dir_path, exclude, file_filter, ignore=parent.ignore, stat_files=False)
+            if listing is None:
+                continue
+            scanned_dirs += 1
+            scanned_entries += 1 + sum(
+                1 for file_path, _, _ in listing.files if _is_listed(os.path.basename(file_path), file_filter, skip_generated)
+            )
+            pending.extend((sub_dir, depth + 1, listing) for sub_dir in listing.dirs)
+        return count + scanned_entries, False
+
+
+@dataclass
+class _WalkFrame:
+    """A directory on the traversal stack of DirectoryTool._iter_listing."""
+    path: str
+    depth: int
+    listing: DirListing
+    next_file: int = 0
+    next_dir: int = 0
+    has_content: bool = False
@@ -0,0 +1,160 @@
+import mmap
+import os
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from .line_index import LineIndex, split_lines
+from ..config.settings import FILE_CACHE_MAX_BYTES
+
+# Files larger than this share of the budget are memory-mapped instead of read into the cache
+MMAP_FILE_RATIO = 8
+# Rough per-line cost of a decoded line (str object) and of a line offset, for the byte budget
+DECODED_LINE_OVERHEAD = 56
+LINE_OFFSET_BYTES = 8
+
+
+class _Entry:
+    __slots__ = ("stat_key", "data", "charged", "line_index", "lines")
+
+    def __init__(self, stat_key: Tuple[int, int, int], data, charged: int):
+        self.stat_key = stat_key
+        self.data = data
+        self.charged = charged
+        self.line_index: Optional[LineIndex] = None
+        self.lines: Optional[List[str]] = None
+
+
+class FileCache:
+    """
+    Process-wide cache of file contents shared by the tools, keyed by absolute path and validated by
+    (mtime, size, inode) on every access. Besides the bytes it keeps the line index and,
+    when asked for, the decoded lines of a file. Entries are evicted least recently used first
+    once their (approximate) memory exceeds max_bytes. Files larger than max_bytes / 8 are
+    memory-mapped; only their line index counts against the budget.
+
+    Bulk passes over the tree (indexing, searching) read with populate=False: they get cached
+    content for free but do not push the files the agent works with out of the cache.
+    """
+
+    def __init__(self, max_bytes: int = FILE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.bytes_read = 0
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._charged = 0
+        self._lock = threading.Lock()
+
+    def _entry(self, path: str, populate: bool = True) -> Tuple[str, _Entry]:
+        key = os.path.abspath(path)
+        stat = os.stat(key)
+        stat_key = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.stat_key == stat_key:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return key, entry
+            self.misses += 1
+
+        with open(key, "rb") as f:
+            stat = os.fstat(f.fileno())
+            stat_key = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+            if stat.st_size and stat.st_size > self.max_bytes // MMAP_FILE_RATIO:
+                entry = _Entry(stat_key, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ), 0)
+            else:
+                data = f.read()
+                entry = _Entry(stat_key, data, len(data))
+        with self._lock:
+            self.bytes_read += stat.st_size
+            if populate or key in self._entries:
+                self._discard(key)
+                self._entries[key] = entry
+                self._charged += entry.charged
+                self._evict(key)
+        return key, entry
+
+    def _discard(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._charged -= entry.charged
+
+    def _charge(self, key: str, entry: _Entry, amount: int) -> None:
+        """Add amount to the cost of entry if it is (still) cached."""
+        if self._entries.get(key) is entry:
+            entry.charged += amount
+            self._charged += amount
+            self._evict(key)
+
+    def _evict(self, keep: str) -> None:
+        """Evict least recently used entries, except keep, until the cache fits its budget."""
+        while self._charged > self.max_bytes and len(self._entries) > 1:
+            key = next(iter(self._entries))
+            if key == keep:
+                break
+            self._discard(key)
+
+    def read(self, path: str, populate: bool = True):
+        """Content of path: bytes, or a read-only mmap for large files (bytes-like, slice it to copy)."""
+        return self._entry(path, populate)[1].data
+
+    def line_index(self, path: str, populate: bool = True) -> LineIndex:
+        key, entry = self._entry(path, populate)
+        if entry.line_index is None:
+            index = LineIndex(entry.data)
+            with self._lock:
+                entry.line_index = index
+                self._charge(key, entry, LINE_OFFSET_BYTES * len(index))
+        return entry.line_index
+
+    def lines(self, path: str, populate: bool = True) -> List[str]:
+        """Decoded lines of path (see LineIndex.lines), kept with the cached content."""
+        key, entry = self._entry(path, populate)
+        if entry.lines is None:
+            lines = split_lines(entry.data)
+            with self._lock:
+                entry.lines = lines
+                self._charge(key, entry, sum(len(line) + DECODED_LINE_OVERHEAD for line in lines))
+        return entry.lines
+
+    def invalidate(self, path: str) -> None:
+        """Forget path, e.g. after writing it (a write in the same mtime tick keeps the stat key)."""
+        with self._lock:
+            self._discard(os.path.abspath(path))
+
+    def stats(self) -> List[str]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return [
+                f"file cache: {self.hits} hits, {self.misses} misses"
+                f" ({100 * self.hits / lookups if lookups else 0:.0f}% hit rate),"
+                f" {len(self._entries)} files, {self._charged / 2**20:.1f}MiB of {self.max_bytes / 2**20:.0f}MiB,"
+                f" {self.bytes_read / 2**20:.1f}MiB read from disk"
+            ]
+
+
+_cache = FileCache()
+
+
+def get_file_cache() -> FileCache:
+    return _cache
+
+
+def read_file(path: str, populate: bool = True):
+    """Content of path through the shared cache (see FileCache.read)."""
+    return _cache.read(path, populate)
+
+
+def read_lines(path: str) -> List[str]:
+    """Decoded lines of path through the shared cache."""
+    return _cache.lines(path)
+
+
+def get_line_index(path: str, populate: bool = True) -> LineIndex:
+    """Line index of path through the shared cache, rebuilt only when the file changed."""
+    return _cache.line_index(path, populate)
+
+
+def invalidate_file(path: str) -> None:
+    _cache.invalidate(path)
@@ -0,0 +1,96 @@
+import os
+import re
+import threading
+from typing import Dict, Optional, Tuple
+
+# Bytes read from the start of a file to classify it
+SNIFF_BYTES = 8192
+# A sniffed head whose longest line and average line length reach these is minified
+MINIFIED_LINE_LENGTH = 1000
+MINIFIED_AVERAGE_LINE_LENGTH = 300
+# Share of control bytes (besides whitespace, backspace and escape) above which a file is binary
+BINARY_CONTROL_RATIO = 0.1
+# Classification results kept per path (mtime_ns, size, kind); the cache is cleared beyond this
+MAX_CACHED_KINDS = 200_000
+
+LOCK_FILES = {
+    "package-lock.json", "npm-shrinkwrap.json", "yarn.lock", "pnpm-lock.yaml", "bun.lockb", "poetry.lock",
+    "Pipfile.lock", "pdm.lock", "uv.lock", "Cargo.lock", "Gemfile.lock", "composer.lock", "go.sum",
+    "packages.lock.json", "mix.lock", "pubspec.lock", "Podfile.lock", "flake.lock",
+}
+MINIFIED_SUFFIXES = (".min.js", ".min.mjs", ".min.css", ".bundle.js", ".chunk.js")
+GENERATED_SUFFIXES = (
+    ".map", "_pb2.py", "_pb2_grpc.py", ".pb.go", ".pb.cc", ".pb.h", ".pb.swift", ".g.dart", ".freezed.dart",
+    ".Designer.cs", ".generated.cs", ".g.cs",
+)
+BINARY_SUFFIXES = (
+    ".png", ".jpg", ".jpeg", ".gif", ".bmp", ".ico", ".webp", ".tiff", ".psd", ".pdf", ".zip", ".gz", ".tgz",
+    ".bz2", ".xz", ".7z", ".rar", ".jar", ".war", ".whl", ".egg", ".so", ".dylib", ".dll", ".exe", ".o", ".a",
+    ".lib", ".obj", ".class", ".pyc", ".pyo", ".wasm", ".woff", ".woff2", ".ttf", ".otf", ".eot", ".mp3", ".mp4",
+    ".wav", ".ogg", ".mov", ".avi", ".webm", ".sqlite", ".db", ".bin", ".dat", ".npy", ".npz", ".pkl", ".parquet",
+)
+# Headers tools put into the files they generate (searched in the first lines only): @generated,
+# Go's "// Code generated ... DO NOT EDIT." and the usual phrases on a comment line, not in prose
+GENERATED_MARKER = re.compile(
+    rb"@generated\b"
+    rb"|^// Code generated .* DO NOT EDIT\.\r?$"
+    rb"|^[ \t]*(?:#|//|/\*|\*|--|;|<!--)[^\n]*(?:\bDO NOT EDIT\b|\b(?i:automatically generated)\b)",
+    re.MULTILINE
+)
+GENERATED_MARKER_LINES = 5
+_CONTROL_BYTES = bytes(set(range(32)) - {8, 9, 10, 12, 13, 27})
+
+_kinds: Dict[str, Tuple[int, int, Optional[str]]] = {}
+_kinds_lock = threading.Lock()
+
+
+def classify_name(name: str) -> Optional[str]:
+    """"lockfile", "minified", "generated" or "binary" if the file name alone tells, else None."""
+    if name in LOCK_FILES:
+        return "lockfile"
+    lower = name.lower()
+    if lower.endswith(MINIFIED_SUFFIXES):
+        return "minified"
+    if name.endswith(GENERATED_SUFFIXES):
+        return "generated"
+    if lower.endswith(BINARY_SUFFIXES):
+        return "binary"
+    return None
+
+
+def classify_content(head: bytes) -> Optional[str]:
+    """"binary", "minified" or "generated" from the first SNIFF_BYTES of a file, else None."""
+    if not head:
+        return None
+    if b"\0" in head or len(head.translate(None, _CONTROL_BYTES)) < len(head) * (1 - BINARY_CONTROL_RATIO):
+        return "binary"
+    lines = head.count(b"\n") + 1
+    if len(head) / lines >= MINIFIED_AVERAGE_LINE_LENGTH and max(map(len, head.split(b"\n"))) >= MINIFIED_LINE_LENGTH:
+        return "minified"
+    header = b"\n".join(head.split(b"\n", GENERATED_MARKER_LINES)[:GENERATED_MARKER_LINES])
+    if GENERATED_MARKER.search(header):
+        return "generated"
+    return None
+
+
+def classify_file(path: str) -> Optional[str]:
+    """
+    Kind of the file at path: "binary", "minified", "generated" or "lockfile", or None for a
+    regular text file. Decided from the name, else from the first SNIFF_BYTES of the content;
+    content results are cached per (path, mtime, size).
+    """
+    kind = classify_name(os.path.basename(path))
+    if kind is not None:
+        return kind
+    stat = os.stat(path)
+    with _kinds_lock:
+        cached = _kinds.get(path)
+    if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+        return cached[2]
+    with open(path, "rb") as f:
+        kind = classify_content(f.read(SNIFF_BYTES))
+    with _kinds_lock:
+        if len(_kinds) >= MAX_CACHED_KINDS:
+            _kinds.clear()
+        _kinds[path] = (stat.st_mtime_ns, stat.st_size, kind)
+    return kind
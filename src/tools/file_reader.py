@@ -1,25 +1,128 @@
-from typing import List
-from .base import BaseTool
+import os
+from typing import List, Optional, Tuple
+from .base import BaseTool, ToolAbortedException
+from .file_cache import get_line_index, read_lines
+from .file_kind import classify_file
+from .line_index import block_end, block_start, pattern_text
+from .outline import file_outline
+from .read_history import ReadHistory, read_key
+from .tags_index import get_tags_index
 from .types import BaseToolResult
 from ..shared import colored_print
 
+
 class FileReaderTool(BaseTool):
-    def get_tool_text_start(self, file_path: str, limit: int = 50, **kwargs) -> List[str]:
-        return [
-            "Read file",
+    name = "file_reader"
+
+    def get_tool_text_start(self, file_path: str, limit: int = 50, start_line: int = None, end_line: int = None,
+                            symbol: str = None, outline: bool = False, **kwargs) -> List[str]:
+        params = [
+            "Read file outline" if outline else "Read file",
             f"file_path: {file_path}",
-            f"limit: {limit} lines (it summarizes output if above)"
         ]
+        if symbol:
+            params.append(f"symbol: {symbol}")
+        if start_line or end_line:
+            params.append(f"lines: {start_line or 1}-{end_line or 'end'}")
+        params.append(f"limit: {limit} lines (it summarizes output if above)")
+        return params
 
     def print_verbose_output(self, result: BaseToolResult):
         for line in result['items']:
             colored_print(line, color="YELLOW")
 
-    def _run(self, intention_of_this_call: str, file_path: str, **kwargs) -> BaseToolResult:
-        """Read a file and return its contents as a BaseToolResult."""
-        with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
-            lines = f.read().splitlines()
-        return BaseToolResult(
+    def get_tool_text_end(self, result: BaseToolResult, **kwargs) -> str:
+        text = super().get_tool_text_end(result, **kwargs)
+        if 'start_line' in result:
+            text += f", lines {result['start_line']}-{result['end_line']} of {result['file_line_count']}"
+        if result.get('is_repeat_read'):
+            text += ", sent as changes since an earlier read"
+        return text
+
+    def _run(self, intention_of_this_call: str, file_path: str, start_line: int = None, end_line: int = None,
+             symbol: str = None, project_root: str = None, outline: bool = False, include_generated: bool = False,
+             read_history: Optional[ReadHistory] = None, **kwargs) -> BaseToolResult:
+        """
+        Read a file and return its contents as a BaseToolResult.
+
+        With start_line / end_line (1-based, inclusive) only that range is returned; with symbol
+        the definition of the symbol in this file, located through the tags file of project_root
+        ("Class.method" selects a member). Ranges are read through the cached line index of the
+        file, so they do not cost a read of the whole file. With outline the classes and functions
+        of the file are listed instead, with their signatures, line spans and docstring first lines.
+        A whole binary, lock, minified or generated file is replaced by a one-line stub unless
+        include_generated. With read_history a repeat read of the same file or range only returns
+        that it is unchanged, or a diff against the version read before.
+        """
+        if outline:
+            items = file_outline(file_path)
+            return BaseToolResult(total_count=len(items), items=items)
+        if not symbol and start_line is None and end_line is None:
+            kind = None if include_generated else classify_file(file_path)
+            if kind is not None:
+                stub = f"[{kind} file, {os.path.getsize(file_path)} bytes, not shown: read a line range or include_generated]"
+                return BaseToolResult(total_count=1, items=[stub])
+            lines = list(read_lines(file_path))
+            result = BaseToolResult(total_count=len(lines), items=lines)
+            return self._repeat_read(result, read_key(file_path), lines, read_history)
+        index = get_line_index(file_path)
+        if symbol:
+            start_line, end_line = self._symbol_span(file_path, symbol, project_root, index)
+
+        start_line = max(start_line or 1, 1)
+        end_line = min(end_line or len(index), len(index))
+        lines = index.lines(start_line, end_line)
+        result = BaseToolResult(
             total_count=len(lines),
-            items=lines
+            items=lines,
+            start_line=start_line,
+            end_line=start_line + len(lines) - 1,
+            file_line_count=len(index)
         )
+        return self._repeat_read(result, read_key(file_path, start_line, end_line), lines, read_history)
+
+    @staticmethod
+    def _repeat_read(result: BaseToolResult, key, lines: List[str], read_history: Optional[ReadHistory]) -> BaseToolResult:
+        """Replace the lines of result by what changed since they were read, if they were read before."""
+        result['read_key'] = key
+        result['read_lines'] = lines
+        repeat = read_history.repeat_read(key, lines) if read_history is not None else None
+        if repeat is not None:
+            result['items'] = repeat
+            result['is_repeat_read'] = True
+        return result
+
+    @staticmethod
+    def _symbol_span(file_path: str, symbol: str, project_root: Optional[str], index) -> Tuple[int, int]:
+        """First and last line of the first definition of symbol in file_path, from the tags file."""
+        root = project_root or os.path.dirname(file_path)
+        tags_file = os.path.join(root, "tags")
+        if not os.path.exists(tags_file):
+            raise ToolAbortedException("No tags file found. Run 'generate_tags' first.")
+        scope, _, name = symbol.rpartition(".")
+        tags = get_tags_index(tags_file)
+        real_path = os.path.realpath(file_path)
+
+        spans = []
+        for i in tags.lookup(name):
+            entry = tags.entry(i)
+            if os.path.realpath(os.path.join(root, entry.file)) != real_path:
+                continue
+            fields = dict(entry.fields)
+            if scope and not (
+                entry.scope == scope or entry.scope.endswith(f".{scope}") or entry.scope.endswith(f"::{scope}")
+            ):
+                continue
+            line = entry.line
+            if not line:
+                text, anchored = pattern_text(entry.address)
+                line = index.find(text, line_start=anchored) if text else None
+            if not line:
+                continue
+            end = fields.get("end")
+            end = int(end) if end and end.isdigit() else block_end(index, line)
+            spans.append((block_start(index, line), end))
+
+        if not spans:
+            raise ToolAbortedException(f"No definition of {symbol} found in {file_path} (tags file: {tags_file}).")
+        return min(spans)
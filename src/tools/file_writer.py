@@ -1,11 +1,14 @@
 from typing import List
 
 from .base import BaseTool
+from .file_cache import invalidate_file
 from .types import BaseToolResult
 from ..shared.utils import colored_print
 
 
 class FileWriterTool(BaseTool):
+    name = "file_writer"
+
     def get_tool_text_start(self, file_path: str, **kwargs) -> List[str]:
         return [
             "Write file",
@@ -22,6 +25,7 @@ class FileWriterTool(BaseTool):
         """Write content to a file and return the number of bytes written."""
         with open(file_path, 'w', encoding='utf-8', errors='replace') as f:
             written_bytes = f.write(content)
+        invalidate_file(file_path)
         return BaseToolResult(
             total_count=written_bytes,
             items=[f"Wrote {written_bytes} bytes"]
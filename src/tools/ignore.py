@@ -0,0 +1,229 @@
+import fnmatch
+import logging
+import os
+import re
+from typing import Callable, Dict, Iterable, List, Optional, Pattern, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Ignore files are read in this order, so rules in .ignore take precedence over .gitignore
+IGNORE_FILES = (".gitignore", ".ignore")
+
+
+class ExcludeMatcher:
+    """
+    Compiled form of an exclude_dirs list. Plain names are looked up in a set, entries with glob
+    characters (e.g. "*nuget*") are merged into a single regular expression.
+    """
+    __slots__ = ("patterns", "names", "regex")
+
+    def __init__(self, patterns: Iterable[str]):
+        self.patterns = list(patterns)
+        self.names = set()
+        globs = []
+        for pattern in self.patterns:
+            if any(char in pattern for char in "*?["):
+                globs.append(fnmatch.translate(pattern))
+            else:
+                self.names.add(pattern)
+        self.regex: Optional[Pattern] = re.compile("|".join(globs)) if globs else None
+
+    def matches(self, name: str) -> bool:
+        return name in self.names or (self.regex is not None and self.regex.match(name) is not None)
+
+
+def _translate(pattern: str) -> str:
+    """Translate a gitignore glob into a regular expression for '/' separated relative paths."""
+    result = []
+    i, n = 0, len(pattern)
+    while i < n:
+        char = pattern[i]
+        if char == "*":
+            if pattern.startswith("**", i) and (i == 0 or pattern[i - 1] == "/"):
+                if i + 2 == n:
+                    result.append(".*")
+                    i += 2
+                    continue
+                if pattern[i + 2] == "/":
+                    result.append("(?:.*/)?")
+                    i += 3
+                    continue
+            while i < n and pattern[i] == "*":
+                i += 1
+            result.append("[^/]*")
+            continue
+        if char == "?":
+            result.append("[^/]")
+        elif char == "[":
+            # A ']' directly after '[' (or '[!') is part of the set
+            end = pattern.find("]", i + 3 if pattern.startswith(("[!", "[^"), i) else i + 2)
+            if end == -1:
+                result.append(re.escape(char))
+            else:
+                content = pattern[i + 1:end]
+                if content[0] in "!^":
+                    content = "^" + content[1:]
+                result.append("[" + content.replace("\\", "\\\\") + "]")
+                i = end
+        elif char == "\\" and i + 1 < n:
+            i += 1
+            result.append(re.escape(pattern[i]))
+        else:
+            result.append(re.escape(char))
+        i += 1
+    return "".join(result)
+
+
+class IgnoreRule:
+    __slots__ = ("pattern", "regex", "negate", "dir_only", "anchored")
+
+    def __init__(self, pattern: str, negate: bool, dir_only: bool, anchored: bool):
+        self.pattern = pattern
+        self.regex = re.compile(f"(?:{_translate(pattern)})\\Z", re.DOTALL)
+        self.negate = negate
+        self.dir_only = dir_only
+        self.anchored = anchored
+
+
+class IgnoreFile:
+    """
+    Parsed .gitignore/.ignore file. Anchored rules (containing a '/') are matched against the path
+    relative to the directory of the file, all other rules against the entry name only. Without
+    negated rules all patterns are merged into a few combined regular expressions.
+    """
+
+    def __init__(self, lines: Iterable[str]):
+        self.rules: List[IgnoreRule] = []
+        for line in lines:
+            rule = self._parse(line)
+            if rule is not None:
+                self.rules.append(rule)
+
+        self._combined: Optional[Dict[Tuple[bool, bool], Pattern]] = None
+        if not any(rule.negate for rule in self.rules):
+            groups: Dict[Tuple[bool, bool], List[str]] = {}
+            for rule in self.rules:
+                groups.setdefault((rule.anchored, rule.dir_only), []).append(rule.regex.pattern)
+            self._combined = {key: re.compile("|".join(patterns), re.DOTALL) for key, patterns in groups.items()}
+
+    @staticmethod
+    def _parse(line: str) -> Optional[IgnoreRule]:
+        line = line.rstrip("\r\n")
+        if not line or line.startswith("#"):
+            return None
+        # Trailing spaces are ignored unless they are escaped with a backslash
+        stripped = line.rstrip(" ")
+        if stripped.endswith("\\") and len(stripped) < len(line):
+            stripped += " "
+        line = stripped
+        negate = line.startswith("!")
+        if negate:
+            line = line[1:]
+        elif line.startswith("\\!") or line.startswith("\\#"):
+            line = line[1:]
+        dir_only = line.endswith("/")
+        line = line.rstrip("/")
+        if not line:
+            return None
+        anchored = "/" in line
+        return IgnoreRule(line.lstrip("/"), negate, dir_only, anchored)
+
+    def match(self, rel_path: str, name: str, is_dir: bool) -> Optional[bool]:
+        """True if ignored, False if re-included by a negated rule, None if no rule matches."""
+        if self._combined is not None:
+            for (anchored, dir_only), regex in self._combined.items():
+                if dir_only and not is_dir:
+                    continue
+                if regex.match(rel_path if anchored else name):
+                    return True
+            return None
+        for rule in reversed(self.rules):
+            if rule.dir_only and not is_dir:
+                continue
+            if rule.regex.match(rel_path if rule.anchored else name):
+                return not rule.negate
+        return None
+
+
+_ignore_file_cache: Dict[str, Tuple[int, int, IgnoreFile]] = {}
+
+
+def load_ignore_file(path: str) -> Optional[IgnoreFile]:
+    """Parse an ignore file, reusing the parsed rules as long as its mtime and size are unchanged."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    cached = _ignore_file_cache.get(path)
+    if cached is not None and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+        return cached[2]
+    try:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            ignore_file = IgnoreFile(f)
+    except OSError as e:
+        logger.warning(f"Error reading ignore file {path}: {e}")
+        return None
+    _ignore_file_cache[path] = (stat.st_mtime_ns, stat.st_size, ignore_file)
+    return ignore_file
+
+
+class DirectoryIgnore:
+    """
+    Ignore rules that apply inside one directory: the rules of all parent directories plus the
+    ignore files of the directory itself. Rules of deeper directories win over their parents.
+    """
+    __slots__ = ("levels",)
+
+    def __init__(self, levels: Tuple[Tuple[str, IgnoreFile], ...] = ()):
+        self.levels = levels
+
+    def child(self, dir_path: str, names: Iterable[str]) -> "DirectoryIgnore":
+        """Rules for dir_path, given the names of the ignore files present in it."""
+        levels = self.levels
+        for file_name in IGNORE_FILES:
+            if file_name in names:
+                ignore_file = load_ignore_file(os.path.join(dir_path, file_name))
+                if ignore_file is not None and ignore_file.rules:
+                    levels = levels + ((dir_path, ignore_file),)
+        return self if levels is self.levels else DirectoryIgnore(levels)
+
+    def matcher(self, dir_path: str) -> Callable[[str, bool], bool]:
+        """Return is_ignored(name, is_dir) for entries of dir_path, with relative prefixes computed once."""
+        if not self.levels:
+            return lambda name, is_dir: False
+        prefixes = []
+        for base_dir, ignore_file in reversed(self.levels):
+            prefix = dir_path[len(base_dir) + 1:] + "/" if dir_path != base_dir else ""
+            prefixes.append((ignore_file, prefix))
+
+        def is_ignored(name: str, is_dir: bool) -> bool:
+            for ignore_file, prefix in prefixes:
+                decision = ignore_file.match(prefix + name, name, is_dir)
+                if decision is not None:
+                    return decision
+            return False
+        return is_ignored
+
+    @classmethod
+    def for_parent_of(cls, path: str, root: Optional[str] = None) -> "DirectoryIgnore":
+        """
+        Rules inherited by path from root (and root/.git/info/exclude) down to the parent of path.
+        Without a root only the ignore files found at and below path apply.
+        """
+        ignore = cls()
+        if root is None:
+            return ignore
+        root = os.path.normpath(root)
+        path = os.path.normpath(path)
+        exclude_file = load_ignore_file(os.path.join(root, ".git", "info", "exclude"))
+        if exclude_file is not None and exclude_file.rules:
+            ignore = cls(((root, exclude_file),))
+        if path == root or not path.startswith(root + os.sep):
+            return ignore
+
+        dir_path = root
+        parts = os.path.relpath(os.path.dirname(path), root).split(os.sep)
+        for part in [""] + [part for part in parts if part not in ("", ".")]:
+            dir_path = os.path.join(dir_path, part) if part else dir_path
+            ignore = ignore.child(dir_path, IGNORE_FILES)
+        return ignore
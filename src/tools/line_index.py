@@ -0,0 +1,112 @@
+import re
+from array import array
+from bisect import bisect_right
+from typing import List, Optional, Tuple
+
+NEWLINE = re.compile(b"\n")
+
+
+class LineIndex:
+    """
+    Byte offsets of the line starts of a file's content (bytes, or a read-only mmap of large
+    files). Built with one scan; afterwards reading any range of lines costs O(range). Lines are
+    split on \\n only (a trailing \\r is dropped), so line numbers match editors and ctags.
+    Use file_cache.get_line_index(path) to get the cached index of a file.
+    """
+
+    def __init__(self, data):
+        self._data = data
+        size = len(data)
+        self._offsets = array("q", [0])
+        self._offsets.extend(match.end() for match in NEWLINE.finditer(self._data))
+        if self._offsets[-1] == size and size:
+            self._offsets.pop()  # no line after the final newline
+        self._size = size
+
+    def __len__(self) -> int:
+        return len(self._offsets) if self._size else 0
+
+    def lines(self, start: int, end: int) -> List[str]:
+        """Lines start..end (1-based, inclusive, clamped to the file)."""
+        start, end = max(start, 1), min(end, len(self))
+        if start > end:
+            return []
+        stop = self._offsets[end] if end < len(self._offsets) else self._size
+        return split_lines(self._data[self._offsets[start - 1]:stop])
+
+    def line_at(self, offset: int) -> int:
+        """1-based number of the line containing byte offset."""
+        return bisect_right(self._offsets, offset)
+
+    def find(self, text: bytes, line_start: bool = True) -> Optional[int]:
+        """Number of the first line containing (or, with line_start, starting with) text."""
+        if line_start:
+            if self._data[:len(text)] == text:
+                return 1
+            offset = self._data.find(b"\n" + text)
+            return self.line_at(offset + 1) if offset != -1 else None
+        offset = self._data.find(text)
+        return self.line_at(offset) if offset != -1 else None
+
+
+def split_lines(data) -> List[str]:
+    """Decoded lines of data, split like LineIndex splits them."""
+    text = data[:].decode("utf-8", errors="replace")  # [:] copies an mmap into bytes
+    lines = text.split("\n")
+    if lines[-1] == "":
+        lines.pop()
+    return [line[:-1] if line.endswith("\r") else line for line in lines] if "\r" in text else lines
+
+
+def _indentation(line: str) -> int:
+    return len(line) - len(line.lstrip(" \t"))
+
+
+def block_end(index: LineIndex, start: int, chunk: int = 200) -> int:
+    """
+    Last line of the block starting at line start, by indentation: the block ends before the
+    next non-blank line indented no deeper than the first line, or on it if that line only
+    closes brackets (`}`, `end` style languages are not recognized).
+    """
+    first = index.lines(start, start)
+    if not first:
+        return start
+    indentation = _indentation(first[0])
+    last_code = start
+    number = start + 1
+    while number <= len(index):
+        for line in index.lines(number, number + chunk - 1):
+            stripped = line.strip()
+            if stripped:
+                if _indentation(line) <= indentation:
+                    return number if stripped[0] in ")]}" else last_code
+                last_code = number
+            number += 1
+    return last_code
+
+
+def block_start(index: LineIndex, start: int) -> int:
+    """First line of the decorators / annotations directly above line start."""
+    first = index.lines(start, start)
+    indentation = _indentation(first[0]) if first else 0
+    while start > 1:
+        above = index.lines(start - 1, start - 1)[0]
+        if not above.lstrip().startswith("@") or _indentation(above) != indentation:
+            break
+        start -= 1
+    return start
+
+
+def pattern_text(address: str) -> Tuple[Optional[bytes], bool]:
+    """
+    Text of a ctags search pattern address (/^text$/ or ?^text$?), and whether it is anchored at
+    the line start; None for other addresses.
+    """
+    if len(address) < 2 or address[0] not in "/?" or address[-1] != address[0]:
+        return None, False
+    body = address[1:-1]
+    anchored = body.startswith("^")
+    body = body[1:] if anchored else body
+    body = body[:-1] if body.endswith("$") else body
+    body = re.sub(r"\\([\\/?])", r"\1", body)
+    return body.encode("utf-8", errors="surrogateescape"), anchored
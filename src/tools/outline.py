@@ -0,0 +1,92 @@
+import ast
+import re
+import subprocess
+from typing import List
+
+from .base import ToolAbortedException
+from .file_cache import read_file
+from .tags_index import TagEntry
+
+# Kinds listed in a ctags outline (long names, --fields=+K); members of functions are left out
+OUTLINE_KINDS = {
+    "class", "interface", "struct", "enum", "trait", "module", "namespace", "package", "type", "typedef",
+    "function", "method", "member", "constructor", "macro", "singletonMethod", "func", "fn", "implementation",
+}
+_SCOPE_SEPARATOR = re.compile(r"\.|::|/")
+# Outlines up to this many lines are returned as they are: they already are the summary of the file
+MAX_OUTLINE_LINES = 400
+
+
+def _doc_line(node: ast.AST) -> str:
+    doc = ast.get_docstring(node, clean=True)
+    return doc.strip().splitlines()[0] if doc and doc.strip() else ""
+
+
+def _outline_line(depth: int, header: str, start: int, end: int, doc: str) -> str:
+    return f"{'  ' * depth}{header}  [{start}-{end}]" + (f"  {doc}" if doc else "")
+
+
+def _python_outline(node: ast.AST, depth: int, items: List[str]) -> None:
+    for child in ast.iter_child_nodes(node):
+        if not isinstance(child, (ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)):
+            continue
+        decorators = "".join(f"@{ast.unparse(decorator)} " for decorator in child.decorator_list)
+        start = min([child.lineno] + [decorator.lineno for decorator in child.decorator_list])
+        if isinstance(child, ast.ClassDef):
+            bases = [ast.unparse(base) for base in child.bases] + [ast.unparse(keyword) for keyword in child.keywords]
+            header = f"{decorators}class {child.name}" + (f"({', '.join(bases)})" if bases else "")
+        else:
+            prefix = "async def" if isinstance(child, ast.AsyncFunctionDef) else "def"
+            returns = f" -> {ast.unparse(child.returns)}" if child.returns else ""
+            header = f"{decorators}{prefix} {child.name}({ast.unparse(child.args)}){returns}"
+        items.append(_outline_line(depth, header, start, child.end_lineno, _doc_line(child)))
+        if isinstance(child, ast.ClassDef):
+            _python_outline(child, depth + 1, items)
+
+
+def python_outline(source: bytes) -> List[str]:
+    """
+    Classes and functions (with methods and nested classes, not the locals of functions) of a
+    Python module, one indented line each: signature, line span and first docstring line.
+    Raises SyntaxError for sources ast cannot parse.
+    """
+    module = ast.parse(source)
+    items = []
+    doc = _doc_line(module)
+    if doc:
+        items.append(doc)
+    _python_outline(module, 0, items)
+    return items
+
+
+def ctags_outline(file_path: str) -> List[str]:
+    """The same outline for any language ctags knows, from a ctags run over file_path alone."""
+    try:
+        output = subprocess.run(
+            ["ctags", "-f", "-", "--sort=no", "--fields=+nKSe", file_path], stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL, check=True, text=True, errors="surrogateescape"
+        ).stdout
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        raise ToolAbortedException(f"No outline of {file_path}: it is not Python and ctags (universal-ctags) failed.")
+
+    entries = [TagEntry(line) for line in output.splitlines() if line and not line.startswith("!_")]
+    items = []
+    for entry in sorted(entries, key=lambda entry: entry.line):
+        if entry.kind not in OUTLINE_KINDS:
+            continue
+        fields = dict(entry.fields)
+        end = fields.get("end", "")
+        depth = len(_SCOPE_SEPARATOR.split(entry.scope)) if entry.scope else 0
+        header = f"{entry.kind} {entry.name}{fields.get('signature', '')}"
+        items.append(_outline_line(depth, header, entry.line, int(end) if end.isdigit() else entry.line, ""))
+    return items
+
+
+def file_outline(file_path: str) -> List[str]:
+    """Outline of a source file: parsed with ast for Python, through ctags for other languages."""
+    if file_path.endswith((".py", ".pyi")):
+        try:
+            return python_outline(read_file(file_path)[:])
+        except (SyntaxError, ValueError):
+            pass  # e.g. Python 2 sources, ctags still reads them
+    return ctags_outline(file_path)
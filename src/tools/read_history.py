@@ -0,0 +1,56 @@
+import difflib
+import os
+from typing import Dict, List, Optional, Tuple
+
+# A diff is sent instead of the content only if it has at most this share of the content's lines
+MAX_DIFF_RATIO = 0.5
+DIFF_CONTEXT_LINES = 3
+
+ReadKey = Tuple[str, Optional[int], Optional[int]]
+
+
+def read_key(file_path: str, start_line: Optional[int] = None, end_line: Optional[int] = None) -> ReadKey:
+    """Key of a read: the real path and the line range (None, None for the whole file)."""
+    return os.path.realpath(file_path), start_line, end_line
+
+
+class ReadHistory:
+    """
+    The file contents the model has received in this session (whole files and line ranges, by
+    turn), so that a repeat read can be answered with "unchanged" or a diff against the version
+    in the conversation instead of the whole content again. Only content that reached the model
+    as it is may be recorded: a summarized read leaves the model without the lines.
+    """
+
+    def __init__(self):
+        self.turn = 0
+        self._versions: Dict[ReadKey, Tuple[int, List[str]]] = {}
+
+    def next_turn(self) -> int:
+        self.turn += 1
+        return self.turn
+
+    def record(self, key: ReadKey, lines: List[str]) -> None:
+        """Remember lines as sent in this turn (an unchanged version keeps the turn it was first sent in)."""
+        previous = self._versions.get(key)
+        if previous is None or previous[1] != lines:
+            self._versions[key] = (self.turn, lines)
+
+    def repeat_read(self, key: ReadKey, lines: List[str]) -> Optional[List[str]]:
+        """
+        What to send instead of lines if key was read before: a one-line notice when the content
+        is unchanged, else a unified diff against the version sent, if it is small enough.
+        None if the content has to be sent (never read, or too many changes).
+        """
+        previous = self._versions.get(key)
+        if previous is None:
+            return None
+        turn, sent = previous
+        if sent == lines:
+            return [f"[unchanged since it was read in turn {turn}]"]
+        diff = list(difflib.unified_diff(
+            sent, lines, fromfile=f"{key[0]} (turn {turn})", tofile=key[0], lineterm="", n=DIFF_CONTEXT_LINES
+        ))
+        if len(diff) > MAX_DIFF_RATIO * len(lines):
+            return None
+        return [f"[changed since it was read in turn {turn}, diff against that version:]"] + diff
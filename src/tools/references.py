@@ -0,0 +1,351 @@
+import json
+import logging
+import os
+import re
+import struct
+import threading
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from .file_cache import read_file
+from .snapshot import INDEX_DIR, ensure_index_dir
+from .watcher import get_watcher
+
+logger = logging.getLogger(__name__)
+
+REFERENCES_FILE = "references.idx"
+REFERENCES_VERSION = 2
+# Index file layout: magic, header length, JSON header (plain data and the sizes of the binary
+# sections), binary sections. Indexes are read from project checkouts, so nothing in them may be
+# executable (as a pickle would be).
+INDEX_MAGIC = b"CODESEARCH-INDEX\n"
+HEADER_LENGTH = struct.Struct("<Q")
+# Larger files are mostly generated or minified, they are listed but not tokenized
+MAX_INDEXED_FILE_SIZE = 1024 * 1024
+# Save after this many re-indexed files; otherwise changes are saved by save_reference_indexes()
+SAVE_AFTER_CHANGED_FILES = 200
+# Rebuild the postings once this share of file ids belongs to deleted or changed files
+COMPACT_RATIO = 0.3
+
+IDENTIFIER = re.compile(rb"(?<![0-9A-Za-z_])[A-Za-z_][A-Za-z0-9_]*")
+
+
+def tokenize(content: bytes) -> Dict[str, List[int]]:
+    """Map every identifier in content to the (ascending, distinct) line numbers it occurs on."""
+    occurrences: Dict[str, List[int]] = {}
+    line = 1
+    position = 0
+    for match in IDENTIFIER.finditer(content):
+        start = match.start()
+        line += content.count(b"\n", position, start)
+        position = start
+        name = match.group().decode("ascii")
+        lines = occurrences.get(name)
+        if lines is None:
+            occurrences[name] = [line]
+        elif lines[-1] != line:
+            lines.append(line)
+    return occurrences
+
+
+def _append_varint(out: bytearray, value: int) -> None:
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data: bytes, position: int) -> Tuple[int, int]:
+    value = shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, position
+        shift += 7
+
+
+def encode_block(out: bytearray, file_id: int, lines: List[int]) -> None:
+    """Append the postings of one file: file id, count, then the line numbers as deltas."""
+    _append_varint(out, file_id)
+    _append_varint(out, len(lines))
+    previous = 0
+    for line in lines:
+        _append_varint(out, line - previous)
+        previous = line
+
+
+def decode_blocks(data: bytes) -> Iterator[Tuple[int, List[int]]]:
+    position = 0
+    while position < len(data):
+        file_id, position = _read_varint(data, position)
+        count, position = _read_varint(data, position)
+        lines = []
+        line = 0
+        for _ in range(count):
+            delta, position = _read_varint(data, position)
+            line += delta
+            lines.append(line)
+        yield file_id, lines
+
+
+def write_index(f, data: dict) -> None:
+    """Write data (JSON values, and bytes values as binary sections) in the index file layout."""
+    header = {name: value for name, value in data.items() if not isinstance(value, bytes)}
+    sections = [(name, value) for name, value in data.items() if isinstance(value, bytes)]
+    header["sections"] = [[name, len(value)] for name, value in sections]
+    encoded = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    f.write(INDEX_MAGIC + HEADER_LENGTH.pack(len(encoded)) + encoded)
+    for _, value in sections:
+        f.write(value)
+
+
+def read_index(raw: bytes) -> dict:
+    """Data written by write_index; raises ValueError for anything else."""
+    if not raw.startswith(INDEX_MAGIC):
+        raise ValueError("not a codesearch index (or an index of an older version)")
+    position = len(INDEX_MAGIC) + HEADER_LENGTH.size
+    (length,) = HEADER_LENGTH.unpack_from(raw, len(INDEX_MAGIC))
+    data = json.loads(raw[position:position + length].decode("utf-8"))
+    position += length
+    for name, size in data.pop("sections"):
+        if position + size > len(raw):
+            raise ValueError(f"index section {name} is cut off")
+        data[name] = raw[position:position + size]
+        position += size
+    return data
+
+
+class ReferenceIndex:
+    """
+    Persistent identifier occurrence index for the files below root (see ctags.list_source_files).
+
+    For every identifier the postings are kept as one bytes object of varint-encoded blocks, one
+    block per file: file id, number of lines, line number deltas. A changed file gets a new file id
+    and its blocks are appended at the end of the postings; the old id is marked as deleted and
+    skipped by lookups until the next compaction. Changes are found by comparing size and mtime
+    of every file, or from the change log while a FileWatcher runs.
+
+    The index is written to <root>/.codesearch/references.idx. Subclasses index other per-file
+    data by overriding _index_content, _remap_postings, _serialize and _deserialize.
+    """
+    index_file = REFERENCES_FILE
+    version = REFERENCES_VERSION
+
+    def __init__(self, root: str):
+        self.root = os.path.realpath(root)
+        self.index_path = os.path.join(self.root, INDEX_DIR, self.index_file)
+        # file id -> (relative path, mtime_ns, size), None once the file was deleted or re-indexed
+        self.files: List[Optional[Tuple[str, int, int]]] = []
+        self.file_ids: Dict[str, int] = {}
+        self.postings: Dict[str, bytearray] = {}
+        self._deleted = 0
+        self._unsaved = 0
+        self._loaded = False
+        self._watch_cursor: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def refresh(self) -> None:
+        """Re-index new and changed files and drop deleted ones."""
+        with self._lock:
+            if not self._loaded:
+                self._load()
+                self._loaded = True
+            watcher = get_watcher(self.root)
+            if watcher is not None and self._watch_cursor is not None:
+                watcher.flush()
+                cursor, paths = watcher.change_log.changes_since(self._watch_cursor)
+                if paths is not None:
+                    self._watch_cursor = cursor
+                    candidates = {
+                        os.path.relpath(path, self.root) for path in paths if path.startswith(self.root + os.sep)
+                    }
+                    self._update({
+                        path for path in candidates
+                        if path in self.file_ids
+                        or (os.path.isfile(os.path.join(self.root, path)) and path not in ("tags", "tags.tmp"))
+                    })
+                    return
+            self._watch_cursor = watcher.change_log.cursor() if watcher is not None else None
+
+            from .ctags import list_source_files
+            self._update(set(list_source_files(self.root)), complete=True)
+
+    def _update(self, paths: Set[str], complete: bool = False) -> None:
+        """Re-index paths whose stat changed; with complete=True, paths is the full file list."""
+        changed = 0
+        initial = not self.files
+        if complete:
+            for path in [path for path in self.file_ids if path not in paths]:
+                self._remove(path)
+                changed += 1
+        for path in sorted(paths):
+            try:
+                stat = os.stat(os.path.join(self.root, path))
+            except OSError:
+                if path in self.file_ids:
+                    self._remove(path)
+                    changed += 1
+                continue
+            file_id = self.file_ids.get(path)
+            if file_id is not None and self.files[file_id][1:] == (stat.st_mtime_ns, stat.st_size):
+                continue
+            if file_id is not None:
+                self._remove(path)
+            self._add(path, stat.st_mtime_ns, stat.st_size)
+            changed += 1
+        if not changed:
+            return
+
+        logger.info(f"{type(self).__name__}: {changed} files updated")
+        self._unsaved += changed
+        if self._deleted > COMPACT_RATIO * len(self.files):
+            self._compact()
+        if initial or self._unsaved >= SAVE_AFTER_CHANGED_FILES:
+            self._save()
+
+    def _add(self, path: str, mtime_ns: int, size: int) -> None:
+        file_id = len(self.files)
+        self.files.append((path, mtime_ns, size))
+        self.file_ids[path] = file_id
+        if size > MAX_INDEXED_FILE_SIZE:
+            return
+        try:
+            content = read_file(os.path.join(self.root, path), populate=False)
+        except OSError as e:
+            logger.warning(f"Could not index {path}: {e}")
+            return
+        if b"\0" in content[:8192]:
+            return
+        self._index_content(file_id, content)
+
+    def _index_content(self, file_id: int, content: bytes) -> None:
+        for name, lines in tokenize(content).items():
+            encoded = self.postings.get(name)
+            if encoded is None:
+                encoded = self.postings[name] = bytearray()
+            encode_block(encoded, file_id, lines)
+
+    def _remove(self, path: str) -> None:
+        file_id = self.file_ids.pop(path)
+        self.files[file_id] = None
+        self._deleted += 1
+
+    def _compact(self) -> None:
+        """Drop the postings of deleted file ids and renumber the remaining files."""
+        new_ids = {}
+        files = []
+        for file_id, entry in enumerate(self.files):
+            if entry is not None:
+                new_ids[file_id] = len(files)
+                files.append(entry)
+        self.postings = self._remap_postings(new_ids)
+        self.files = files
+        self.file_ids = {entry[0]: file_id for file_id, entry in enumerate(files)}
+        self._deleted = 0
+
+    def _remap_postings(self, new_ids: Dict[int, int]) -> Dict[str, bytearray]:
+        postings = {}
+        for name, encoded in self.postings.items():
+            compacted = bytearray()
+            for file_id, lines in decode_blocks(encoded):
+                if file_id in new_ids:
+                    encode_block(compacted, new_ids[file_id], lines)
+            if compacted:
+                postings[name] = compacted
+        return postings
+
+    def lookup(self, name: str, path_prefix: str = "") -> List[Tuple[str, int]]:
+        """(relative path, line) of every line containing the identifier name, below path_prefix."""
+        with self._lock:
+            encoded = self.postings.get(name)
+            if encoded is None:
+                return []
+            result = []
+            for file_id, lines in decode_blocks(bytes(encoded)):
+                entry = self.files[file_id] if file_id < len(self.files) else None
+                if entry is None or not entry[0].startswith(path_prefix):
+                    continue
+                result.extend((entry[0], line) for line in lines)
+            return result
+
+    def _load(self) -> None:
+        try:
+            with open(self.index_path, "rb") as f:
+                data = read_index(f.read())
+            if data.get("version") != self.version:
+                return
+            self.files = [tuple(entry) if entry is not None else None for entry in data["files"]]
+            self._deserialize(data)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable index {self.index_path}: {e}")
+            self._clear()
+            return
+        self.file_ids = {entry[0]: file_id for file_id, entry in enumerate(self.files) if entry is not None}
+        self._deleted = len(self.files) - len(self.file_ids)
+
+    def _clear(self) -> None:
+        """Drop what a failed _load may have read."""
+        self.files = []
+        self.postings = {}
+
+    def _deserialize(self, data: dict) -> None:
+        blob = data["postings"]
+        position = 0
+        while position < len(blob):
+            length, position = _read_varint(blob, position)
+            name = blob[position:position + length].decode("ascii")
+            length, position = _read_varint(blob, position + length)
+            self.postings[name] = bytearray(blob[position:position + length])
+            position += length
+
+    def _serialize(self) -> dict:
+        """Plain data to store in the index; bytes values are stored as binary sections."""
+        blob = bytearray()
+        for name, encoded in self.postings.items():
+            _append_varint(blob, len(name))
+            blob += name.encode("ascii")
+            _append_varint(blob, len(encoded))
+            blob += encoded
+        return {"postings": bytes(blob)}
+
+    def _save(self) -> None:
+        data = {"version": self.version, "files": self.files, **self._serialize()}
+        try:
+            ensure_index_dir(self.root)
+            tmp_path = f"{self.index_path}.tmp"
+            with open(tmp_path, "wb") as f:
+                write_index(f, data)
+            os.replace(tmp_path, self.index_path)
+            self._unsaved = 0
+        except OSError as e:
+            logger.warning(f"Could not write index {self.index_path}: {e}")
+
+    def save_if_dirty(self) -> None:
+        with self._lock:
+            if self._unsaved:
+                self._save()
+
+
+_indexes: Dict[str, ReferenceIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_reference_index(root: str) -> ReferenceIndex:
+    """Return the process-wide references index for root, creating it on first use."""
+    key = os.path.realpath(root)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = _indexes[key] = ReferenceIndex(key)
+        return index
+
+
+def save_reference_indexes() -> None:
+    """Write indexes with changes that were not saved yet."""
+    with _indexes_lock:
+        indexes = list(_indexes.values())
+    for index in indexes:
+        index.save_if_dirty()
@@ -0,0 +1,113 @@
+import fnmatch
+import logging
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from .ignore import IGNORE_FILES, DirectoryIgnore, ExcludeMatcher
+from ..config.settings import DIRECTORY_WORKERS
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class DirListing:
+    """Result of scanning a single directory.
+
+    Attributes:
+        files: (path, size, mtime) for every file that passed the file filter
+        dirs: Paths of subdirectories that are not excluded
+        mtime: Modification time of the directory itself (None if stat failed)
+        ignore: Ignore rules in effect inside this directory (not persisted)
+    """
+    files: List[Tuple[str, int, float]] = field(default_factory=list)
+    dirs: List[str] = field(default_factory=list)
+    mtime: Optional[float] = None
+    ignore: Optional[DirectoryIgnore] = field(default=None, compare=False, repr=False)
+
+
+def scan_directory(
+    path: str,
+    exclude: ExcludeMatcher,
+    file_filter: Optional[str] = None,
+    ignore: Optional[DirectoryIgnore] = None,
+    stat_files: bool = True
+) -> Optional[DirListing]:
+    """
+    List one directory with os.scandir. Returns None if it cannot be read.
+    Subdirectories matching exclude and entries ignored by ignore (the rules inherited from the
+    parent directories) are skipped, so ignored subtrees are never listed themselves.
+    Without stat_files, files are listed with size and mtime 0 (no stat call per file).
+    """
+    try:
+        entries = list(os.scandir(path))
+    except PermissionError as e:
+        logger.warning(f"Permission denied accessing {path}: {e}")
+        return None
+    except OSError as e:
+        logger.error(f"Error accessing {path}: {e}")
+        return None
+
+    listing = DirListing()
+    is_ignored = None
+    if ignore is not None:
+        listing.ignore = ignore.child(path, [entry.name for entry in entries if entry.name in IGNORE_FILES])
+        is_ignored = listing.ignore.matcher(path)
+
+    for entry in entries:
+        is_dir = entry.is_dir(follow_symlinks=False)
+        if is_ignored is not None and is_ignored(entry.name, is_dir):
+            continue
+        if is_dir:
+            if not exclude.matches(entry.name):
+                listing.dirs.append(entry.path)
+        elif file_filter is None or fnmatch.fnmatch(entry.name, file_filter):
+            if not stat_files:
+                listing.files.append((entry.path, 0, 0.0))
+                continue
+            try:
+                stat = entry.stat()
+                listing.files.append((entry.path, stat.st_size, stat.st_mtime))
+            except (PermissionError, OSError) as e:
+                logger.warning(f"Error accessing {entry.path}: {e}")
+
+    try:
+        listing.mtime = os.stat(path).st_mtime
+    except (PermissionError, OSError) as e:
+        logger.warning(f"Error accessing {path}: {e}")
+    return listing
+
+
+def scan_tree(
+    path: str,
+    exclude: ExcludeMatcher,
+    file_filter: Optional[str] = None,
+    max_depth: int = 999999,
+    workers: int = DIRECTORY_WORKERS,
+    ignore: Optional[DirectoryIgnore] = None
+) -> Dict[str, Optional[DirListing]]:
+    """
+    List every directory below path (up to max_depth) with a pool of scandir worker
+    threads fed from a work queue. Returns a mapping of directory path to its listing.
+    ignore holds the rules inherited by path; pass None to disable ignore files.
+    """
+    listings: Dict[str, Optional[DirListing]] = {}
+    if max_depth < 0:
+        return listings
+
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as pool:
+        pending = {pool.submit(scan_directory, path, exclude, file_filter, ignore): (path, 0)}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                dir_path, depth = pending.pop(future)
+                listing = future.result()
+                listings[dir_path] = listing
+                if listing is None or depth + 1 > max_depth:
+                    continue
+                for sub_dir in listing.dirs:
+                    future = pool.submit(scan_directory, sub_dir, exclude, file_filter, listing.ignore)
+                    pending[future] = (sub_dir, depth + 1)
+
+    return listings
@@ -0,0 +1,242 @@
+import fnmatch
+import json
+import logging
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+
+try:
+    import re._parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+from .base import BaseTool
+from .ctags import list_source_files, shard_files
+from .file_cache import read_file
+from .file_kind import SNIFF_BYTES, classify_content, classify_name
+from .trigram import get_trigram_index
+from .types import BaseToolResult
+from ..config.settings import SEARCH_WORKERS
+from ..shared import colored_print
+
+logger = logging.getLogger(__name__)
+
+# Below this many bytes to scan the files are searched in-process, a pool round trip costs more
+PARALLEL_SEARCH_MIN_BYTES = 8 * 1024 * 1024
+# From this many bytes to scan the candidate files are narrowed down with the trigram index first
+TRIGRAM_INDEX_MIN_BYTES = 32 * 1024 * 1024
+MIN_PREFILTER_LITERAL = 3
+BINARY_CHECK_BYTES = 8192
+
+# (relative path, line, column, text, context before, context after, file match cap reached)
+Match = Tuple[str, int, int, str, List[str], List[str], bool]
+
+
+def required_literal(pattern: str, flags: int = 0) -> Optional[str]:
+    """
+    Longest run of literal characters every match of pattern must contain, used to skip files
+    with one bytes.find() before running the regex. None if there is no usable literal, also if
+    the pattern turns on case-insensitive matching with an inline flag like (?i): bytes.find()
+    is case sensitive. (Scoped groups like (?i:...) are not literals, so they end a run.)
+    """
+    try:
+        parsed = sre_parse.parse(pattern, flags)
+    except re.error:
+        return None
+    if parsed.state.flags & re.IGNORECASE and not flags & re.IGNORECASE:
+        return None
+    best, run = "", []
+    for op, value in parsed:
+        if op is sre_parse.LITERAL:
+            run.append(chr(value))
+            continue
+        if op is sre_parse.BRANCH:
+            return None
+        best = max(best, "".join(run), key=len)
+        run = []
+    best = max(best, "".join(run), key=len)
+    return best if len(best) >= MIN_PREFILTER_LITERAL else None
+
+
+def _decode(line: bytes) -> str:
+    return line.decode("utf-8", errors="replace").rstrip("\r")
+
+
+def search_files(root: str, rel_paths: List[str], pattern: str, flags: int, literal: Optional[str],
+                 context_lines: int, max_matches_per_file: int, include_generated: bool = False) -> List[Match]:
+    """
+    Search rel_paths (below root) for pattern; runs in the worker processes of the search pool.
+    Unless include_generated, the matches in a lock, minified or generated file are collapsed
+    into one stub record at its first match.
+    """
+    regex = re.compile(pattern.encode("utf-8"), flags)
+    literal_bytes = literal.encode("utf-8") if literal is not None else None
+    matches: List[Match] = []
+    for rel_path in rel_paths:
+        try:
+            data = read_file(os.path.join(root, rel_path), populate=False)
+        except OSError:
+            continue
+        if not data or b"\0" in data[:BINARY_CHECK_BYTES]:
+            continue
+        if literal_bytes is not None and data.find(literal_bytes) == -1:
+            continue
+        if not include_generated:
+            kind = classify_name(os.path.basename(rel_path)) or classify_content(data[:SNIFF_BYTES])
+            if kind is not None:
+                first = regex.search(data)
+                if first is not None and kind != "binary":
+                    line = data.count(b"\n", 0, first.start()) + 1
+                    matches.append((rel_path, line, 1, f"[{kind} file, matches not shown]", [], [], False))
+                continue
+        matches.extend(_search_file(data, rel_path, regex, context_lines, max_matches_per_file))
+    return matches
+
+
+def _search_file(data, rel_path: str, regex, context_lines: int, max_matches_per_file: int) -> List[Match]:
+    matches: List[Match] = []
+    line = 1
+    counted_until = 0
+    last_line = 0
+    for match in regex.finditer(data):
+        start = match.start()
+        line += data[counted_until:start].count(b"\n")
+        counted_until = start
+        if line == last_line:
+            continue  # one record per line, like grep
+        last_line = line
+        line_start = data.rfind(b"\n", 0, start) + 1
+        line_end = data.find(b"\n", start)
+        line_end = len(data) if line_end == -1 else line_end
+
+        before, after = [], []
+        if context_lines:
+            position = line_start
+            for _ in range(context_lines):
+                if position == 0:
+                    break
+                previous = data.rfind(b"\n", 0, position - 1) + 1
+                before.insert(0, _decode(data[previous:position - 1]))
+                position = previous
+            position = line_end
+            for _ in range(context_lines):
+                if position >= len(data):
+                    break
+                following = data.find(b"\n", position + 1)
+                following = len(data) if following == -1 else following
+                after.append(_decode(data[position + 1:following]))
+                position = following
+
+        column = len(data[line_start:start].decode("utf-8", errors="replace")) + 1
+        capped = len(matches) + 1 == max_matches_per_file
+        matches.append((rel_path, line, column, _decode(data[line_start:line_end]), before, after, capped))
+        if capped:
+            break
+    return matches
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    """Process pool shared by all searches, so workers are started only once per session."""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(max_workers=workers)
+            _pool_workers = workers
+        return _pool
+
+
+def match_to_json(match: Match) -> str:
+    rel_path, line, column, text, before, after, capped = match
+    record = {"file": rel_path, "line": line, "column": column, "text": text}
+    if before or after:
+        record["context_before"] = before
+        record["context_after"] = after
+    if capped:
+        record["file_match_cap_reached"] = True
+    return json.dumps(record)
+
+
+class SearchTool(BaseTool):
+    name = "search"
+
+    def get_tool_text_start(self, pattern: str, path: str = "", is_regex: bool = False, ignore_case: bool = False,
+                            file_glob: str = "", limit: int = 50, **kwargs) -> List[str]:
+        return [
+            "Search file contents",
+            f"pattern: {pattern}",
+            f"path: {path}",
+            f"is_regex: {is_regex}, ignore_case: {ignore_case}, file_glob: {file_glob or '*'}",
+            f"limit: {limit} lines (it summarizes output if above)"
+        ]
+
+    def print_verbose_output(self, result: BaseToolResult):
+        for item in result['items']:
+            record = json.loads(item)
+            for text in record.get("context_before", []):
+                colored_print(f"{record['file']}-{text}", color="YELLOW")
+            colored_print(f"{record['file']}:{record['line']}:{record['column']}: {record['text']}", color="YELLOW")
+            for text in record.get("context_after", []):
+                colored_print(f"{record['file']}-{text}", color="YELLOW")
+
+    def _run(self, intention_of_this_call: str, pattern: str, path: str, project_root: str = None,
+             is_regex: bool = False, ignore_case: bool = False, file_glob: str = "", context_lines: int = 0,
+             max_matches_per_file: int = 20, workers: int = SEARCH_WORKERS, limit: int = 50,
+             include_generated: bool = False, **kwargs) -> BaseToolResult:
+        """
+        Search the files below path (tracked by git, or not ignored outside git repositories) for
+        pattern. Binary files are skipped, lock, minified and generated files reported with one stub
+        record unless include_generated. On large trees only the files the trigram index
+        reports as candidates are searched. Returns one JSON record per matching line with file
+        (relative to project_root), line, column, text and optional context lines.
+        """
+        root = os.path.realpath(project_root or (path if os.path.isdir(path) else os.path.dirname(path)))
+        target = os.path.relpath(os.path.realpath(path), root)
+        target = "" if target == "." else target
+
+        flags = re.MULTILINE | (re.IGNORECASE if ignore_case else 0)
+        regex_pattern = pattern if is_regex else re.escape(pattern)
+        re.compile(regex_pattern, flags)  # raise re.error here instead of in the workers
+        literal = pattern if not is_regex else required_literal(pattern, flags)
+        if literal is not None and (len(literal) < MIN_PREFILTER_LITERAL or (ignore_case and literal.lower() != literal.upper())):
+            literal = None
+
+        rel_paths = [
+            rel_path for rel_path in list_source_files(root)
+            if (not target or rel_path == target or rel_path.startswith(target + os.sep))
+            and (not file_glob or fnmatch.fnmatch(os.path.basename(rel_path), file_glob))
+        ]
+        sizes = {}
+        for rel_path in rel_paths:
+            try:
+                sizes[rel_path] = os.path.getsize(os.path.join(root, rel_path))
+            except OSError:
+                pass
+        if sum(sizes.values()) >= TRIGRAM_INDEX_MIN_BYTES:
+            index = get_trigram_index(root)
+            index.refresh()
+            candidates = index.candidates(regex_pattern.encode("utf-8"), flags)
+            if candidates is not None:
+                sizes = {rel_path: sizes[rel_path] for rel_path in candidates if rel_path in sizes}
+
+        args = (regex_pattern, flags, literal, context_lines, max_matches_per_file, include_generated)
+        if workers > 1 and sum(sizes.values()) >= PARALLEL_SEARCH_MIN_BYTES:
+            # A few shards per worker, so a slow shard does not leave the other workers idle
+            shards = shard_files(sizes, workers * 4)
+            pool = _get_pool(workers)
+            futures = [pool.submit(search_files, root, shard, *args) for shard in shards]
+            matches = [match for future in futures for match in future.result()]
+        else:
+            matches = search_files(root, sorted(sizes), *args)
+        matches.sort(key=lambda match: (match[0], match[1]))
+
+        items = [match_to_json(match) for match in matches]
+        return BaseToolResult(total_count=len(items), items=items)
@@ -0,0 +1,143 @@
+import asyncio
+import logging
+import os
+import shlex
+import signal
+import threading
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SHELL = "/bin/sh"
+READ_CHUNK_SIZE = 64 * 1024
+
+
+class ShellSession:
+    """
+    Long-lived /bin/sh that runs terminal commands one after another, so a command costs a fork
+    of the running shell instead of starting a new shell process.
+
+    Every command is sent over stdin as `(eval '<command>') </dev/null 2>&1` followed by a printf
+    of a per-command sentinel and the exit status. The subshell keeps commands as isolated as
+    separate processes: cd, exports and syntax errors do not affect the next command. When a
+    command times out or hits an output cap, the shell (with everything it started) is killed;
+    a dead shell is started again on the next command.
+    """
+
+    def __init__(self, cwd: str):
+        self.cwd = cwd
+        self.restarts = 0
+        self._process = None
+        self._loop = None
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def run(self, command: str, timeout: float, max_lines: int, max_bytes: int) \
+            -> Tuple[List[str], Optional[str], Optional[int]]:
+        """Run command; returns the output lines, the truncation reason (or None) and the exit status."""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # The process and the lock belong to the event loop that created them
+            self.close()
+            self._loop = loop
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._process is None or self._process.returncode is not None:
+                if self._process is not None:
+                    self.restarts += 1
+                    logger.info(f"Restarting shell session in {self.cwd} (exit status {self._process.returncode})")
+                self._process = await asyncio.create_subprocess_exec(
+                    SHELL, stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.STDOUT, cwd=self.cwd, start_new_session=True
+                )
+
+            sentinel = f"__codesearch_{uuid.uuid4().hex}__"
+            script = f"(eval {shlex.quote(command)}) </dev/null 2>&1\nprintf '\\n%s %d\\n' {sentinel} $?\n"
+            lines: List[str] = []
+            try:
+                self._process.stdin.write(script.encode("utf-8", errors="surrogateescape"))
+                await self._process.stdin.drain()
+                reason, status = await asyncio.wait_for(
+                    self._read_until(sentinel.encode(), lines, max_lines, max_bytes), timeout
+                )
+            except asyncio.TimeoutError:
+                reason, status = "timeout", None
+            except (BrokenPipeError, ConnectionResetError):
+                reason, status = None, None
+            except asyncio.CancelledError:
+                # The rest of the command's output would be read by the next command
+                self.close()
+                raise
+            if reason or status is None:
+                await self.aclose()
+            return lines, reason, status
+
+    async def _read_until(self, sentinel: bytes, lines: List[str], max_lines: int, max_bytes: int) \
+            -> Tuple[Optional[str], Optional[int]]:
+        pending = b""
+        total_bytes = 0
+        stdout = self._process.stdout
+        while True:
+            chunk = await stdout.read(READ_CHUNK_SIZE)
+            if not chunk:
+                # The shell died
+                if pending:
+                    lines.append(pending.decode("utf-8", errors="replace"))
+                return None, None
+            total_bytes += len(chunk)
+            *complete, pending = (pending + chunk).split(b"\n")
+            for line in complete:
+                if line.startswith(sentinel):
+                    # The printf starts with a newline so the sentinel is on a line of its own;
+                    # that newline ends the last output line or adds an empty one
+                    if lines and lines[-1] == "":
+                        lines.pop()
+                    return None, int(line[len(sentinel):])
+                lines.append(line.decode("utf-8", errors="replace"))
+                if len(lines) >= max_lines:
+                    return "line_cap", None
+            if total_bytes >= max_bytes:
+                return "byte_cap", None
+
+    def close(self) -> None:
+        """Kill the shell and all processes it started."""
+        if self._process is not None and self._process.returncode is None:
+            try:
+                os.killpg(self._process.pid, signal.SIGKILL)
+            except (ProcessLookupError, PermissionError):
+                pass
+        self._process = None
+
+    async def aclose(self) -> None:
+        """Kill the shell and wait for it, so its pipes are closed before the event loop ends."""
+        process = self._process
+        if process is None or self._loop is not asyncio.get_running_loop():
+            self.close()
+            return
+        self.close()
+        # A paused pipe transport never sees EOF, and wait() also waits for the pipes to close
+        while await process.stdout.read(READ_CHUNK_SIZE):
+            pass
+        await process.wait()
+
+
+_sessions: Dict[str, ShellSession] = {}
+_sessions_lock = threading.Lock()
+
+
+def get_shell_session(cwd: str) -> ShellSession:
+    """Return the process-wide shell session running commands in cwd, creating it on first use."""
+    key = os.path.realpath(cwd)
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = _sessions[key] = ShellSession(key)
+        return session
+
+
+async def stop_shell_sessions() -> None:
+    with _sessions_lock:
+        sessions = list(_sessions.values())
+        _sessions.clear()
+    for session in sessions:
+        await session.aclose()
@@ -0,0 +1,287 @@
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from .ignore import IGNORE_FILES, DirectoryIgnore, ExcludeMatcher
+from .scanner import DirListing, scan_directory, scan_tree
+from .watcher import get_watcher
+from ..config.settings import DIRECTORY_WORKERS
+
+logger = logging.getLogger(__name__)
+
+INDEX_DIR = ".codesearch"
+SNAPSHOT_FILE = "directory_snapshot.json"
+SNAPSHOT_VERSION = 2
+
+
+def _ignore_files(listing: DirListing) -> List[Tuple[str, int, float]]:
+    return [entry for entry in listing.files if os.path.basename(entry[0]) in IGNORE_FILES]
+
+
+def _file_stats(paths: List[str]) -> List[Optional[Tuple[int, float]]]:
+    stats = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            stats.append((stat.st_size, stat.st_mtime))
+        except OSError:
+            stats.append(None)
+    return stats
+
+
+def _dir_mtimes(paths: List[str]) -> List[Optional[float]]:
+    mtimes = []
+    for path in paths:
+        try:
+            mtimes.append(os.stat(path).st_mtime)
+        except OSError:
+            mtimes.append(None)
+    return mtimes
+
+
+def ensure_index_dir(project_root: str) -> str:
+    """Create <project_root>/.codesearch (ignored by git) if needed and return its path."""
+    index_dir = os.path.join(project_root, INDEX_DIR)
+    try:
+        os.makedirs(index_dir, exist_ok=True)
+        gitignore = os.path.join(index_dir, ".gitignore")
+        if not os.path.exists(gitignore):
+            with open(gitignore, 'w', encoding='utf-8') as f:
+                f.write("*\n")
+    except OSError as e:
+        logger.warning(f"Could not create index directory {index_dir}: {e}")
+    return index_dir
+
+
+class DirectorySnapshot:
+    """
+    Persistent index of the directory tree below project_root.
+
+    Every directory is stored with its mtime, its subdirectories and the size and mtime of
+    its files. refresh() only re-lists directories whose mtime changed (an entry was added,
+    removed or renamed), so repeated scans of an unchanged tree cost one stat() per directory.
+    Size and mtime of files in unchanged directories are served from the snapshot.
+
+    Entries ignored by .gitignore/.ignore files are not indexed. If one of these files changes,
+    the subtree below it is scanned again.
+
+    While a FileWatcher runs for project_root, refresh() re-lists only the parents of the paths
+    in its change log and skips the stat() pass; the file is then written by save_snapshots().
+
+    The snapshot is written to <project_root>/.codesearch/directory_snapshot.json.
+    """
+
+    def __init__(self, project_root: str, exclude_dirs: List[str], workers: int = DIRECTORY_WORKERS):
+        self.root = os.path.realpath(project_root)
+        self.exclude_dirs = sorted(set(exclude_dirs))
+        self.exclude = ExcludeMatcher(self.exclude_dirs)
+        self.workers = workers
+        self.listings: Dict[str, DirListing] = {}
+        self.snapshot_path = os.path.join(self.root, INDEX_DIR, SNAPSHOT_FILE)
+        self._loaded = False
+        self._dirty = False
+        self._watch_cursor: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def covers(self, path: str, exclude_dirs: List[str]) -> bool:
+        """True if a query for path with exclude_dirs (and ignore files) can be answered from this snapshot."""
+        return path in self.listings and set(self.exclude_dirs).issubset(exclude_dirs)
+
+    def refresh(self, force_rebuild: bool = False) -> None:
+        """Bring the snapshot up to date, re-listing only directories whose mtime changed."""
+        with self._lock:
+            if not self._loaded and not force_rebuild:
+                self._load()
+                self._loaded = True
+            watcher = get_watcher(self.root)
+            if watcher is not None and not force_rebuild and self.listings and self._watch_cursor is not None:
+                watcher.flush()
+                cursor, paths = watcher.change_log.changes_since(self._watch_cursor)
+                if paths is not None:
+                    self._watch_cursor = cursor
+                    self._apply_changes(paths)
+                    return
+                logger.info("Directory snapshot: watcher lost events, checking all directories")
+            # Changes recorded while the full refresh runs are applied again next time, which is harmless
+            self._watch_cursor = watcher.change_log.cursor() if watcher is not None else None
+
+            if force_rebuild or not self.listings:
+                self._rebuild()
+                self._loaded = True
+                return
+
+            known = list(self.listings.items())
+            paths = [path for path, _ in known]
+            # stat() in one batch per worker; a future per directory costs more than the stat itself
+            batch_size = max(len(paths) // max(self.workers, 1), 256)
+            with ThreadPoolExecutor(max_workers=max(self.workers, 1)) as pool:
+                batches = pool.map(_dir_mtimes, [paths[i:i + batch_size] for i in range(0, len(paths), batch_size)])
+                mtimes = [mtime for batch in batches for mtime in batch]
+            changed = sorted(
+                path for (path, listing), mtime in zip(known, mtimes)
+                if mtime is None or mtime != listing.mtime
+            )
+            # Edited ignore files do not change the directory mtime, so they are checked separately
+            ignore_files = [
+                (path, entry) for path, listing in known for entry in _ignore_files(listing)
+            ]
+            ignore_stats = _file_stats([entry[0] for _, entry in ignore_files])
+            rescan = {
+                path for (path, (_, size, mtime)), stat in zip(ignore_files, ignore_stats)
+                if stat != (size, mtime)
+            }
+            if not changed and not rescan:
+                return
+
+            logger.info(f"Directory snapshot: {len(changed)} of {len(known)} directories changed")
+            self._rescan(changed, rescan)
+            self._save()
+
+    def _apply_changes(self, paths) -> None:
+        """Re-list the directories containing the changed paths reported by the watcher."""
+        changed = set()
+        rescan = set()
+        for path in paths:
+            parent = os.path.dirname(path)
+            if parent in self.listings:
+                changed.add(parent)
+                if os.path.basename(path) in IGNORE_FILES:
+                    rescan.add(parent)
+            if path in self.listings:
+                changed.add(path)
+        if not changed:
+            return
+        logger.info(f"Directory snapshot: {len(changed)} directories changed (watcher)")
+        self._rescan(sorted(changed), rescan)
+        self._dirty = True
+
+    def _rescan(self, changed: List[str], rescan: set) -> None:
+        """Re-list changed directories and rescan the subtrees in rescan completely."""
+        removed = []
+        for path in changed:
+            old = self.listings.get(path)
+            if old is None or path in rescan:
+                continue
+            new = scan_directory(path, self.exclude, ignore=DirectoryIgnore.for_parent_of(path, self.root))
+            if new is None:
+                removed.append(path)
+                continue
+            if _ignore_files(new) != _ignore_files(old):
+                rescan.add(path)
+                continue
+            self.listings[path] = new
+            removed.extend(set(old.dirs) - set(new.dirs))
+            for added in set(new.dirs) - set(old.dirs):
+                self._add_subtree(added)
+        self._remove_subtrees(removed)
+
+        # Rescan whole subtrees whose ignore rules changed, outermost directories only
+        rescan_roots = [
+            path for path in sorted(rescan)
+            if not any(path.startswith(other + os.sep) for other in rescan)
+        ]
+        self._remove_subtrees(rescan_roots)
+        for path in rescan_roots:
+            if os.path.isdir(path):
+                self._add_subtree(path)
+
+    def _rebuild(self) -> None:
+        logger.info(f"Rebuilding directory snapshot for {self.root}")
+        # Create the index directory first, otherwise it changes the root mtime right after the scan
+        ensure_index_dir(self.root)
+        self.listings = {}
+        self._add_subtree(self.root)
+        self._save()
+
+    def _add_subtree(self, path: str) -> None:
+        ignore = DirectoryIgnore.for_parent_of(path, self.root)
+        scanned = scan_tree(path, self.exclude, workers=self.workers, ignore=ignore)
+        self.listings.update({p: listing for p, listing in scanned.items() if listing is not None})
+
+    def _remove_subtrees(self, paths: List[str]) -> None:
+        if not paths:
+            return
+        prefixes = tuple(path + os.sep for path in paths)
+        roots = set(paths)
+        self.listings = {
+            path: listing for path, listing in self.listings.items()
+            if path not in roots and not path.startswith(prefixes)
+        }
+
+    def _load(self) -> None:
+        try:
+            with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable directory snapshot {self.snapshot_path}: {e}")
+            return
+
+        if data.get("version") != SNAPSHOT_VERSION or data.get("exclude_dirs") != self.exclude_dirs:
+            logger.info("Directory snapshot is outdated, it will be rebuilt")
+            return
+
+        listings = {}
+        for rel_dir, (mtime, files, dirs) in data["dirs"].items():
+            dir_path = os.path.normpath(os.path.join(self.root, rel_dir))
+            listings[dir_path] = DirListing(
+                files=[(os.path.join(dir_path, name), size, file_mtime) for name, size, file_mtime in files],
+                dirs=[os.path.join(dir_path, name) for name in dirs],
+                mtime=mtime
+            )
+        self.listings = listings
+
+    def save_if_dirty(self) -> None:
+        with self._lock:
+            if self._dirty:
+                self._save()
+
+    def _save(self) -> None:
+        self._dirty = False
+        data = {
+            "version": SNAPSHOT_VERSION,
+            "exclude_dirs": self.exclude_dirs,
+            "dirs": {
+                os.path.relpath(dir_path, self.root): [
+                    listing.mtime,
+                    [[os.path.basename(path), size, mtime] for path, size, mtime in listing.files],
+                    [os.path.basename(path) for path in listing.dirs]
+                ]
+                for dir_path, listing in self.listings.items()
+            }
+        }
+        try:
+            ensure_index_dir(self.root)
+            tmp_path = f"{self.snapshot_path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, separators=(",", ":"))
+            os.replace(tmp_path, self.snapshot_path)
+        except OSError as e:
+            logger.warning(f"Could not write directory snapshot {self.snapshot_path}: {e}")
+
+
+_snapshots: Dict[str, DirectorySnapshot] = {}
+_snapshots_lock = threading.Lock()
+
+
+def get_snapshot(project_root: str, exclude_dirs: List[str]) -> DirectorySnapshot:
+    """Return the process-wide snapshot for project_root, creating it on first use."""
+    key = os.path.realpath(project_root)
+    with _snapshots_lock:
+        snapshot = _snapshots.get(key)
+        if snapshot is None or snapshot.exclude_dirs != sorted(set(exclude_dirs)):
+            snapshot = DirectorySnapshot(key, exclude_dirs)
+            _snapshots[key] = snapshot
+        return snapshot
+
+
+def save_snapshots() -> None:
+    """Write snapshots that were only updated in memory from watcher events."""
+    with _snapshots_lock:
+        snapshots = list(_snapshots.values())
+    for snapshot in snapshots:
+        snapshot.save_if_dirty()
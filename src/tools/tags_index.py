@@ -0,0 +1,244 @@
+import bisect
+import logging
+import mmap
+import os
+import re
+import threading
+from array import array
+from typing import Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Name of every tag line; pseudo tags ("!_TAG_...") are filtered out while indexing
+_TAG_NAME = re.compile(rb"^([^\t\n]*)\t", re.MULTILINE)
+_SORTED_HEADER = re.compile(rb"^!_TAG_FILE_SORTED\t(\d)", re.MULTILINE)
+# First extension field of every tag line (the kind, as ctags writes it), skipping over the address
+_KIND_FIELD = re.compile(
+    rb'^(?!!_)[^\t\n]*\t[^\t\n]*\t(?:/[^/\\\n]*(?:\\.[^/\\\n]*)*/|\?[^?\\\n]*(?:\\.[^?\\\n]*)*\?|\d+)'
+    rb';"\t(?:kind:)?([^\t\r\n:]*)(?=[\t\r\n]|$)',
+    re.MULTILINE
+)
+# Tag fields that are not the enclosing scope of a symbol (universal-ctags writes e.g. class:Parser)
+NOT_SCOPE_FIELDS = {"end", "signature", "roles", "access", "typeref", "inherits", "implementation", "language"}
+
+
+def _decode(value: bytes) -> str:
+    return value.decode("utf-8", errors="surrogateescape")
+
+
+def _split_address(rest: str) -> Tuple[str, str]:
+    """Split "<address>;\"\t<fields>" into the address and the remainder after it."""
+    if rest[:1] in ("/", "?"):
+        delimiter = rest[0]
+        i = 1
+        while i < len(rest):
+            if rest[i] == "\\":
+                i += 2
+                continue
+            if rest[i] == delimiter:
+                return rest[:i + 1], rest[i + 1:]
+            i += 1
+        return rest, ""
+    end = len(rest)
+    for separator in (';"', "\t"):
+        pos = rest.find(separator)
+        if pos != -1:
+            end = min(end, pos)
+    return rest[:end], rest[end:]
+
+
+class TagEntry:
+    """One parsed tags line, with the fields readtags treats specially split out."""
+    __slots__ = ("name", "file", "address", "kind", "file_scope", "line", "fields")
+
+    def __init__(self, line: str):
+        self.name, self.file, rest = (line.split("\t", 2) + ["", ""])[:3]
+        self.address, rest = _split_address(rest)
+        self.kind = ""
+        self.file_scope = False
+        self.line = int(self.address) if self.address.isdigit() else 0
+        self.fields: List[Tuple[str, str]] = []
+        if rest.startswith(';"'):
+            for field in rest[2:].split("\t"):
+                if not field:
+                    continue
+                key, colon, value = field.partition(":")
+                if not colon:
+                    self.kind = key
+                elif key == "kind":
+                    self.kind = value
+                elif key == "file":
+                    self.file_scope = True
+                elif key == "line":
+                    self.line = int(value) if value.isdigit() else 0
+                else:
+                    self.fields.append((key, value))
+
+    @property
+    def scope(self) -> str:
+        """Name of the enclosing class, namespace, ... ("" at the top level)."""
+        return next((value for key, value in self.fields if key not in NOT_SCOPE_FIELDS), "")
+
+    def format(self, line_numbers: bool = True) -> str:
+        """Format like `readtags -e [-n]`: ;" appears before the first extension field only."""
+        parts = [f"{self.name}\t{self.file}\t{self.address}"]
+        extensions = []
+        if self.kind:
+            extensions.append(f"\tkind:{self.kind}")
+        if self.file_scope:
+            extensions.append("\tfile:")
+        if line_numbers and self.line > 0:
+            extensions.append(f"\tline:{self.line}")
+        extensions.extend(f"\t{key}:{value}" for key, value in self.fields)
+        if extensions:
+            parts.append(';"')
+            parts.extend(extensions)
+        return "".join(parts)
+
+
+class TagsIndex:
+    """
+    In-process reader for a ctags tags file, replacing one readtags process per query.
+
+    The file is memory-mapped and only the byte offset of every tag line plus the tag names
+    (one "\\n" separated string) are kept in memory. Exact and prefix lookups are binary searches:
+    over the file order if the file is sorted case-sensitively, otherwise (and for ignore_case)
+    over a case-folded order built on first use. Kinds get a secondary index on first use and
+    regular expressions are matched against the names only; a line is parsed when it is returned.
+    """
+
+    def __init__(self, tags_file: str):
+        self.tags_file = tags_file
+        with open(tags_file, "rb") as f:
+            stat = os.fstat(f.fileno())
+            self.stat_key = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if stat.st_size else b""
+
+        sorted_header = _SORTED_HEADER.search(self._data, 0, 4096)
+        self.sort_method = int(sorted_header.group(1)) if sorted_header else 0
+
+        self._offsets = array("q")
+        self._name_starts = array("q")
+        names = []
+        position = 0
+        for match in _TAG_NAME.finditer(self._data):
+            name = match.group(1)
+            if name.startswith(b"!_"):
+                continue
+            self._offsets.append(match.start())
+            self._name_starts.append(position)
+            name = _decode(name)
+            names.append(name)
+            position += len(name) + 1
+        self._name_starts.append(position)
+        self._names = "\n".join(names) + "\n"
+
+        self._order: Optional[array] = None if self.sort_method == 1 else self._sorted_order(names, str)
+        self._folded_order: Optional[array] = self._sorted_order(names, str.lower) if self.sort_method == 2 else None
+        self._kinds: Optional[Dict[str, array]] = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    @staticmethod
+    def _sorted_order(names: Sequence[str], key) -> array:
+        return array("l", sorted(range(len(names)), key=lambda i: key(names[i])))
+
+    def name(self, i: int) -> str:
+        return self._names[self._name_starts[i]:self._name_starts[i + 1] - 1]
+
+    def line(self, i: int) -> str:
+        start = self._offsets[i]
+        end = self._data.find(b"\n", start)
+        return _decode(self._data[start:end if end != -1 else len(self._data)]).rstrip("\r")
+
+    def entry(self, i: int) -> TagEntry:
+        return TagEntry(self.line(i))
+
+    def format(self, indices: Sequence[int], line_numbers: bool = True) -> List[str]:
+        return [self.entry(i).format(line_numbers) for i in indices]
+
+    # Queries, each returning tag indices in the order readtags prints them
+
+    def all(self) -> range:
+        return range(len(self))
+
+    def lookup(self, name: str, prefix: bool = False, ignore_case: bool = False) -> List[int]:
+        """Tags whose name equals (or starts with) name."""
+        if ignore_case:
+            with self._lock:
+                if self._folded_order is None:
+                    self._folded_order = self._sorted_order([self.name(i) for i in range(len(self))], str.lower)
+            order, key, name = self._folded_order, str.lower, name.lower()
+        else:
+            order, key = self._order, None
+
+        count = len(self)
+        position = lambda k: order[k] if order is not None else k
+        value = (lambda k: key(self.name(position(k)))) if key else (lambda k: self.name(position(k)))
+
+        low, high = 0, count
+        while low < high:
+            mid = (low + high) // 2
+            if value(mid) < name:
+                low = mid + 1
+            else:
+                high = mid
+        result = []
+        while low < count:
+            current = value(low)
+            if current != name and not (prefix and current.startswith(name)):
+                break
+            result.append(position(low))
+            low += 1
+        return sorted(result) if order is not None else result
+
+    def of_kind(self, kind: str) -> Sequence[int]:
+        with self._lock:
+            if self._kinds is None:
+                kinds: Dict[str, array] = {}
+                for match in _KIND_FIELD.finditer(self._data):
+                    i = bisect.bisect_right(self._offsets, match.start()) - 1
+                    kinds.setdefault(_decode(match.group(1)), array("l")).append(i)
+                self._kinds = kinds
+        return self._kinds.get(kind, array("l"))
+
+    def search(self, pattern: str, kind: Optional[str] = None) -> List[int]:
+        """
+        Tags whose name matches the regular expression pattern (searched anywhere in the name,
+        ^ and $ anchor at the name boundaries), optionally of one kind. Raises re.error.
+        """
+        regex = re.compile(pattern, re.MULTILINE)
+        found = []
+        last = -1
+        for match in regex.finditer(self._names):
+            if "\n" in match.group(0):
+                # The match spans several names and may hide a real one, check name by name instead
+                found = [i for i in range(len(self)) if regex.search(self.name(i))]
+                break
+            i = bisect.bisect_right(self._name_starts, match.start()) - 1
+            if i != last and i < len(self):
+                found.append(i)
+                last = i
+        if kind is not None:
+            kind_indices = set(self.of_kind(kind))
+            found = [i for i in found if i in kind_indices]
+        return found
+
+
+_indexes: Dict[str, TagsIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_tags_index(tags_file: str) -> TagsIndex:
+    """Return the index of tags_file, re-reading it only when the file was replaced or modified."""
+    key = os.path.realpath(tags_file)
+    stat = os.stat(key)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None or index.stat_key != (stat.st_mtime_ns, stat.st_size, stat.st_ino):
+            logger.info(f"Indexing tags file {tags_file}")
+            index = TagsIndex(key)
+            _indexes[key] = index
+        return index
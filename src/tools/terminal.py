@@ -1,14 +1,28 @@
+import asyncio
+import logging
+import os
 import shlex
-import subprocess
-from typing import List
+import signal
+from typing import List, Optional, Tuple
 
 from .base import BaseTool
+from .command_cache import get_command_cache
+from .shell_session import get_shell_session
 from .types import BaseToolResult
+from ..config.settings import TERMINAL_MAX_BYTES, TERMINAL_PERSISTENT_SHELL, TERMINAL_TIMEOUT
 from ..shared import colored_print
+from ..summarize_agent.main_agent import MAX_TOOL_OUTPUT_BYTES, MAX_TOOL_OUTPUT_LINES
+
+logger = logging.getLogger(__name__)
+
+# Output the summarizer would not take in is not read
+DEFAULT_MAX_BYTES = min(TERMINAL_MAX_BYTES, MAX_TOOL_OUTPUT_BYTES or TERMINAL_MAX_BYTES)
 
 #AI? when i ŕun a command which involves a pipe I got an error, i.e. find: paths must precede expression: `|' on find . -type f -name "*.razor" -o -name "*.razor.cs" | sort. Why? and how to fix
 
 class TerminalTool(BaseTool):
+    name = "terminal"
+
     def get_tool_text_start(self, command: str, limit: int = 50, **kwargs) -> List[str]:
         return [
             "Run terminal command",
@@ -20,31 +34,122 @@ class TerminalTool(BaseTool):
         for line in result['items']:
             colored_print(line, color="YELLOW")
 
-    def _run(self, intention_of_this_call: str, command: str, limit: int = 50, root_dir: str = None, **kwargs) -> BaseToolResult:
-        """Execute a shell command and return its output."""
+    def get_tool_text_end(self, result: BaseToolResult, **kwargs) -> str:
+        text = super().get_tool_text_end(result, **kwargs)
+        if result.get('is_truncated'):
+            # Only the lines read before the command was stopped are counted
+            text = text.replace("total_lines: ", "total_lines: at least ")
+            text += f", output truncated ({result['truncation_reason']})"
+        if result.get('is_cached'):
+            text += ", cached"
+        return text
+
+    def get_cached_result(self, command: str, limit: int = 50, root_dir: str = None,
+                          max_lines: int = MAX_TOOL_OUTPUT_LINES, max_bytes: int = DEFAULT_MAX_BYTES,
+                          **kwargs) -> Optional[BaseToolResult]:
+        """Look up read-only commands in the command cache of root_dir (see command_cache.py)."""
+        cache = get_command_cache(root_dir or os.getcwd())
+        key = cache.key(command, max_lines=max_lines, max_bytes=max_bytes)
+        return cache.get(key) if key is not None else None
+
+    def cache_result(self, result: BaseToolResult, root_dir: str = None, **kwargs) -> None:
+        # A timed out command may produce more output on the next run
+        if result.get('cache_key') is None or result.get('truncation_reason') == "timeout":
+            return
+        get_command_cache(root_dir or os.getcwd()).put(result['cache_key'], result)
+
+    async def _run(self, intention_of_this_call: str, command: str, limit: int = 50, root_dir: str = None,
+                   timeout: float = TERMINAL_TIMEOUT, max_lines: int = MAX_TOOL_OUTPUT_LINES,
+                   max_bytes: int = DEFAULT_MAX_BYTES, persistent_shell: bool = TERMINAL_PERSISTENT_SHELL,
+                   **kwargs) -> BaseToolResult:
+        """
+        Execute a shell command and return its output (stdout and stderr).
+
+        The output is read while the command runs. The command (with all processes it started)
+        is killed after timeout seconds or once max_lines lines or max_bytes bytes were read
+        (is_truncated, total_count then only counts the lines read). The
+        defaults stop where the summarizer stops taking output in (MAX_TOOL_OUTPUT_LINES and
+        MAX_TOOL_OUTPUT_BYTES, all map-reduce chunks when it is on). With persistent_shell the
+        command runs in the long-lived shell of root_dir (see shell_session.py) instead of a new
+        process. The command cache key is taken before the command starts and returned as
+        cache_key, so the output is stored for the tree state it was read from.
+        """
+        cache_key = get_command_cache(root_dir or os.getcwd()).key(command, max_lines=max_lines, max_bytes=max_bytes)
+        if persistent_shell:
+            session = get_shell_session(root_dir or os.getcwd())
+            lines, reason, _ = await session.run(command, timeout, max_lines, max_bytes)
+        else:
+            lines, reason = await self._spawn(command, root_dir, timeout, max_lines, max_bytes)
+        if reason:
+            logger.info(f"Terminal command stopped ({reason}): {command}")
+
+        result = BaseToolResult(total_count=len(lines), items=lines)
+        if cache_key is not None:
+            result['cache_key'] = cache_key
+        if reason:
+            result.update(is_truncated=True, truncation_reason=reason)
+        return result
+
+    async def _spawn(self, command: str, root_dir: Optional[str], timeout: float, max_lines: int,
+                     max_bytes: int) -> Tuple[List[str], Optional[str]]:
+        # Use shell=True for commands with pipes or shell operators
+        if any(op in command for op in ['|', '>', '<', '>>', '&&', '||']):
+            process = await asyncio.create_subprocess_shell(
+                command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT,
+                cwd=root_dir, start_new_session=True
+            )
+        else:
+            # Original behavior for simple commands
+            process = await asyncio.create_subprocess_exec(
+                *shlex.split(command), stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT,
+                cwd=root_dir, start_new_session=True
+            )
+
+        lines: List[str] = []
+        try:
+            reason = await asyncio.wait_for(self._read_lines(process, lines, max_lines, max_bytes), timeout)
+        except asyncio.TimeoutError:
+            reason = "timeout"
+        except asyncio.CancelledError:
+            # The call was cancelled (the response was interrupted): do not leave the command running
+            await self._stop(process)
+            raise
+        if reason:
+            await self._stop(process)
+        await process.wait()
+        return lines, reason
+
+    async def _stop(self, process) -> None:
+        self._kill(process)
+        # A paused pipe transport never sees EOF, and wait() also waits for the pipes to close
+        while await process.stdout.read(64 * 1024):
+            pass
+        await process.wait()
+
+    @staticmethod
+    async def _read_lines(process, lines: List[str], max_lines: int, max_bytes: int) -> Optional[str]:
+        """Append output lines to lines; returns the reason if reading stopped before the end."""
+        pending = b""
+        total_bytes = 0
+        while True:
+            chunk = await process.stdout.read(64 * 1024)
+            if not chunk:
+                break
+            total_bytes += len(chunk)
+            *complete, pending = (pending + chunk).split(b"\n")
+            lines.extend(line.decode("utf-8", errors="replace") for line in complete)
+            if len(lines) >= max_lines:
+                del lines[max_lines:]
+                return "line_cap"
+            if total_bytes >= max_bytes:
+                return "byte_cap"
+        if pending:
+            lines.append(pending.decode("utf-8", errors="replace"))
+        return None
+
+    @staticmethod
+    def _kill(process) -> None:
         try:
-            # Use shell=True for commands with pipes or shell operators
-            if any(op in command for op in ['|', '>', '<', '>>', '&&', '||']):
-                output = subprocess.check_output(
-                    command,
-                    stderr=subprocess.STDOUT,
-                    universal_newlines=True,
-                    cwd=root_dir,
-                    shell=True  # Enable shell processing for commands with pipes/operators
-                )
-            else:
-                # Original behavior for simple commands
-                output = subprocess.check_output(
-                    shlex.split(command),
-                    stderr=subprocess.STDOUT,
-                    universal_newlines=True,
-                    cwd=root_dir
-                )
-        except subprocess.CalledProcessError as e:
-            output = e.output
-
-        lines = output.splitlines()
-        return BaseToolResult(
-            total_count=len(lines),
-            items=lines
-        )
+            os.killpg(process.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
@@ -0,0 +1,345 @@
+import logging
+import os
+import threading
+import zlib
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Union
+
+try:
+    import re._parser as sre_parse
+    import re._constants as sre_constants
+except ImportError:  # Python < 3.11
+    import sre_parse
+    import sre_constants
+
+from .references import MAX_INDEXED_FILE_SIZE, ReferenceIndex, _append_varint, _read_varint
+
+logger = logging.getLogger(__name__)
+
+TRIGRAMS_FILE = "trigrams.idx"
+TRIGRAMS_VERSION = 2
+# Character classes with more (case folded) bytes than this are treated like "."
+MAX_CLASS_SIZE = 8
+# Largest set of exact strings / prefixes / suffixes tracked while analyzing a regex
+MAX_EXACT_STRINGS = 16
+# Stop intersecting an AND query once a term has this many times more ids than the candidates
+SKIP_TERM_RATIO = 8
+
+# A query is None (every file matches), a trigram, or ("and" | "or", [queries])
+Query = Union[None, bytes, Tuple[str, list]]
+
+
+def file_trigrams(content: bytes) -> Set[bytes]:
+    """
+    Trigrams of the ASCII-lowercased content, line by line (trigrams spanning a newline are not
+    indexed; query analysis treats a newline in a pattern like any other character).
+    """
+    trigrams = set()
+    for line in set(content.lower().split(b"\n")):
+        trigrams.update(zip(line, line[1:], line[2:]))
+    return {bytes(trigram) for trigram in trigrams}
+
+
+def and_query(*queries: Query) -> Query:
+    items = []
+    for query in queries:
+        if query is None:
+            continue
+        if isinstance(query, tuple) and query[0] == "and":
+            items.extend(query[1])
+        elif query not in items:
+            items.append(query)
+    if not items:
+        return None
+    return items[0] if len(items) == 1 else ("and", items)
+
+
+def or_query(*queries: Query) -> Query:
+    items = []
+    for query in queries:
+        if query is None:
+            return None
+        if isinstance(query, tuple) and query[0] == "or":
+            items.extend(query[1])
+        elif query not in items:
+            items.append(query)
+    return items[0] if len(items) == 1 else ("or", items)
+
+
+def strings_query(strings: Iterable[bytes]) -> Query:
+    """Query for "contains one of strings"; None if any string is too short to have a trigram."""
+    alternatives = []
+    for string in sorted(strings):
+        if len(string) < 3:
+            return None
+        alternatives.append(and_query(*(string[i:i + 3] for i in range(len(string) - 2))))
+    return or_query(*alternatives)
+
+
+class _Info:
+    """
+    What is known about the matches of a regex node, after Russ Cox's trigram query analysis:
+    the complete set of strings it matches (exact, if small and known), otherwise prefixes and
+    suffixes every match starts / ends with, plus a query every match satisfies.
+    """
+    __slots__ = ("exact", "prefix", "suffix", "match")
+
+    def __init__(self, exact: Optional[Set[bytes]] = None, prefix: Set[bytes] = frozenset([b""]),
+                 suffix: Set[bytes] = frozenset([b""]), match: Query = None):
+        self.exact = exact
+        self.prefix = prefix
+        self.suffix = suffix
+        self.match = match
+
+    def query(self) -> Query:
+        return and_query(self.match, strings_query(self.exact)) if self.exact is not None else self.match
+
+    def starts(self) -> Set[bytes]:
+        return {string[:2] for string in self.exact} if self.exact is not None else self.prefix
+
+    def ends(self) -> Set[bytes]:
+        return {string[-2:] for string in self.exact} if self.exact is not None else self.suffix
+
+
+def _simplify(info: _Info) -> _Info:
+    if info.exact is not None and len(info.exact) > MAX_EXACT_STRINGS:
+        info = _Info(None, info.starts(), info.ends(), info.query())
+    if len(info.prefix) > MAX_EXACT_STRINGS:
+        info.prefix = {b""}
+    if len(info.suffix) > MAX_EXACT_STRINGS:
+        info.suffix = {b""}
+    return info
+
+
+def _concat(x: _Info, y: _Info) -> _Info:
+    if x.exact is not None and y.exact is not None and len(x.exact) * len(y.exact) <= MAX_EXACT_STRINGS:
+        return _Info({a + b for a in x.exact for b in y.exact}, match=and_query(x.match, y.match))
+    match = and_query(x.query(), y.query())
+    ends, starts = x.ends(), y.starts()
+    if len(ends) * len(starts) > MAX_EXACT_STRINGS:
+        return _simplify(_Info(None, x.starts(), y.ends(), match))
+    match = and_query(match, strings_query({a + b for a in ends for b in starts}))
+    # Keep extending the known prefix / suffix through exact neighbours
+    prefix = {(a + b)[:2] for a in x.exact for b in starts} if x.exact is not None else x.prefix
+    suffix = {(a + b)[-2:] for a in ends for b in y.exact} if y.exact is not None else y.suffix
+    return _simplify(_Info(None, prefix, suffix, match))
+
+
+def _alternate(x: _Info, y: _Info) -> _Info:
+    if x.exact is not None and y.exact is not None:
+        return _simplify(_Info(x.exact | y.exact, match=or_query(x.match, y.match)))
+    return _simplify(_Info(None, x.starts() | y.starts(), x.ends() | y.ends(), or_query(x.query(), y.query())))
+
+
+def _class_bytes(items) -> Optional[Set[bytes]]:
+    chars = set()
+    for op, value in items:
+        if op is sre_constants.LITERAL:
+            chars.add(value)
+        elif op is sre_constants.RANGE and value[1] - value[0] < MAX_CLASS_SIZE * 2:
+            chars.update(range(value[0], value[1] + 1))
+        else:  # NEGATE, CATEGORY, large ranges
+            return None
+    folded = {_byte(char) for char in chars}
+    return None if None in folded or len(folded) > MAX_CLASS_SIZE else folded
+
+
+def _byte(value: int) -> Optional[bytes]:
+    # The index is case folded, so the query is too; that also covers re.IGNORECASE
+    if value == 0x0A:
+        return None  # newlines are not part of the indexed trigrams
+    return bytes([value]).lower()
+
+
+def _analyze(pattern) -> _Info:
+    info = _Info({b""})
+    for op, value in pattern:
+        if op is sre_constants.LITERAL:
+            char = _byte(value)
+            node = _Info({char}) if char is not None else _Info()
+        elif op is sre_constants.IN:
+            chars = _class_bytes(value)
+            node = _Info(chars) if chars is not None else _Info()
+        elif op is sre_constants.SUBPATTERN:
+            node = _analyze(value[-1])
+        elif op is sre_constants.BRANCH:
+            node = _analyze(value[1][0])
+            for branch in value[1][1:]:
+                node = _alternate(node, _analyze(branch))
+        elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT) or op.name == "POSSESSIVE_REPEAT":
+            if value[0] == 0:
+                node = _Info()
+            else:
+                # x{n,m} with n >= 1 contains at least one x
+                repeated = _analyze(value[2])
+                node = _Info(None, repeated.starts(), repeated.ends(), repeated.query())
+        elif op in (sre_constants.AT, sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            node = _Info({b""})
+        else:  # ".", negated literals, back references, ...
+            node = _Info()
+        info = _concat(info, node)
+    return info
+
+
+def regex_query(pattern: bytes, flags: int = 0) -> Query:
+    """Trigram query that every file containing a match of the (bytes) regex pattern satisfies."""
+    return _analyze(sre_parse.parse(pattern, flags)).query()
+
+
+def encode_ids(out: bytearray, previous: int, file_id: int) -> None:
+    _append_varint(out, file_id - previous)
+
+
+def decode_ids(data: bytes) -> List[int]:
+    ids = []
+    file_id = position = 0
+    while position < len(data):
+        delta, position = _read_varint(data, position)
+        file_id += delta
+        ids.append(file_id)
+    return ids
+
+
+class TrigramIndex(ReferenceIndex):
+    """
+    Persistent trigram index for the files below root, in the style of Russ Cox's codesearch:
+    for every trigram of the (lowercased) file contents, the ascending ids of the files that
+    contain it, varint delta-encoded. File bookkeeping, incremental updates and compaction are
+    those of ReferenceIndex. On disk the postings are stored as one zlib-compressed section of
+    <root>/.codesearch/trigrams.idx (in the index file layout of references.write_index).
+
+    candidates() turns a regex into a trigram query (see regex_query) and returns the files that
+    may contain a match; they still have to be searched to verify it.
+    """
+    index_file = TRIGRAMS_FILE
+    version = TRIGRAMS_VERSION
+
+    def __init__(self, root: str):
+        super().__init__(root)
+        self.postings: Dict[bytes, bytearray] = {}
+        # Last file id of every posting list, to delta-encode appended ids
+        self._last: Dict[bytes, int] = {}
+        # Files too large to index, they are candidates of every query
+        self.unindexed: Set[int] = set()
+
+    def _add(self, path: str, mtime_ns: int, size: int) -> None:
+        super()._add(path, mtime_ns, size)
+        if size > MAX_INDEXED_FILE_SIZE:
+            self.unindexed.add(self.file_ids[path])
+
+    def _index_content(self, file_id: int, content: bytes) -> None:
+        for trigram in file_trigrams(content):
+            encoded = self.postings.get(trigram)
+            if encoded is None:
+                encoded = self.postings[trigram] = bytearray()
+            encode_ids(encoded, self._last.get(trigram, 0), file_id)
+            self._last[trigram] = file_id
+
+    def _remap_postings(self, new_ids: Dict[int, int]) -> Dict[bytes, bytearray]:
+        postings = {}
+        self._last = {}
+        for trigram, encoded in self.postings.items():
+            compacted = bytearray()
+            previous = 0
+            for file_id in decode_ids(bytes(encoded)):
+                if file_id in new_ids:
+                    encode_ids(compacted, previous, new_ids[file_id])
+                    previous = new_ids[file_id]
+            if compacted:
+                postings[trigram] = compacted
+                self._last[trigram] = previous
+        self.unindexed = {new_ids[file_id] for file_id in self.unindexed if file_id in new_ids}
+        return postings
+
+    def _serialize(self) -> dict:
+        blob = bytearray()
+        for trigram, encoded in self.postings.items():
+            blob += trigram
+            _append_varint(blob, self._last[trigram])
+            _append_varint(blob, len(encoded))
+            blob += encoded
+        return {"postings": zlib.compress(bytes(blob)), "unindexed": sorted(self.unindexed)}
+
+    def _clear(self) -> None:
+        super()._clear()
+        self._last = {}
+        self.unindexed = set()
+
+    def _deserialize(self, data: dict) -> None:
+        blob = zlib.decompress(data["postings"])
+        position = 0
+        while position < len(blob):
+            trigram = blob[position:position + 3]
+            last, position = _read_varint(blob, position + 3)
+            length, position = _read_varint(blob, position)
+            self.postings[trigram] = bytearray(blob[position:position + length])
+            self._last[trigram] = last
+            position += length
+        self.unindexed = {int(file_id) for file_id in data["unindexed"]}
+
+    def _evaluate(self, query: Query, cache: Dict[bytes, Set[int]]) -> Optional[Set[int]]:
+        if query is None:
+            return None
+        if isinstance(query, bytes):
+            if query not in cache:
+                encoded = self.postings.get(query)
+                cache[query] = set(decode_ids(bytes(encoded))) if encoded is not None else set()
+            return cache[query]
+        op, items = query
+        result = None
+        if op == "or":
+            for item in items:
+                result = (result or set()) | self._evaluate(item, cache)
+            return result
+        # Most selective terms first; once the candidates are far fewer than the ids of the
+        # remaining terms, verifying the candidates is cheaper than decoding those postings
+        for item in sorted(items, key=self._estimate):
+            if result is not None and len(result) * SKIP_TERM_RATIO < self._estimate(item):
+                break
+            ids = self._evaluate(item, cache)
+            result = ids if result is None else result & ids
+            if not result:
+                break
+        return result
+
+    def _estimate(self, query: Query) -> int:
+        """Upper bound of the encoded posting bytes a query decodes (about one byte per file id)."""
+        if isinstance(query, bytes):
+            return len(self.postings.get(query, b""))
+        op, items = query
+        estimates = [self._estimate(item) for item in items]
+        return sum(estimates) if op == "or" else min(estimates)
+
+    def candidates(self, pattern: bytes, flags: int = 0) -> Optional[List[str]]:
+        """
+        Relative paths of the indexed files that may contain a match of pattern, sorted, or None
+        if the pattern has no usable trigrams (every file is a candidate).
+        """
+        query = regex_query(pattern, flags)
+        if query is None:
+            return None
+        with self._lock:
+            ids = self._evaluate(query, {}) | self.unindexed
+            paths = [self.files[file_id][0] for file_id in ids if self.files[file_id] is not None]
+        return sorted(paths)
+
+
+_indexes: Dict[str, TrigramIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_trigram_index(root: str) -> TrigramIndex:
+    """Return the process-wide trigram index for root, creating it on first use."""
+    key = os.path.realpath(root)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = _indexes[key] = TrigramIndex(key)
+        return index
+
+
+def save_trigram_indexes() -> None:
+    """Write indexes with changes that were not saved yet."""
+    with _indexes_lock:
+        indexes = list(_indexes.values())
+    for index in indexes:
+        index.save_if_dirty()
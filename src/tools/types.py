@@ -1,4 +1,4 @@
-from typing import TypedDict, List
+from typing import TypedDict, List, Sequence
 
 
 class BaseToolResult(TypedDict, total=False):
@@ -7,15 +7,37 @@ class BaseToolResult(TypedDict, total=False):
     Attributes:
         total_count: Total number of items available (entries/lines/bytes)
         returned_count: Number of items actually returned (for pagination/limits)
-        items: The actual content as list of strings (entries/lines/output)
+        items: The actual content as sequence of strings (entries/lines/output). Tools may
+               return a lazy sequence that serializes its items on access.
         summary: Optional summarized version of the output
         is_summarized: Flag indicating if the output was summarized
+        is_total_estimated: Flag indicating that total_count is an estimate (traversal stopped early)
+        is_truncated: Flag indicating that the output was cut off (command killed or output capped);
+                      total_count then only counts the output read
+        truncation_reason: Why the output was cut off, e.g. "timeout", "line_cap" or "byte_cap"
+        cache_key: Command cache key of the tree state a terminal command ran on, to store its result under
+        start_line: Number of the first line returned, for reads of a part of a file
+        end_line: Number of the last line returned, for reads of a part of a file
+        file_line_count: Number of lines of the whole file, for reads of a part of a file
+        read_key: Key of a file read in the session read history (see read_history.ReadHistory)
+        read_lines: The lines read, to record in the read history once they reached the model
+        is_repeat_read: Flag indicating that items only tell what changed since an earlier read
     """
     total_count: int
     returned_count: int
-    items: List[str]
+    items: Sequence[str]
     summary: List[str] | None
     is_summarized: bool
+    is_total_estimated: bool
+    is_truncated: bool
+    truncation_reason: str
+    cache_key: str
+    start_line: int
+    end_line: int
+    file_line_count: int
+    read_key: tuple
+    read_lines: List[str]
+    is_repeat_read: bool
 
 # Extend like this if needed
 # T = TypeVar('T')
@@ -0,0 +1,351 @@
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+from .ignore import DirectoryIgnore, ExcludeMatcher
+from .scanner import scan_tree
+
+logger = logging.getLogger(__name__)
+
+# inotify constants from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+              | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class ChangeLog:
+    """
+    In-process log of changed paths. Every recorded path gets a sequence number; consumers keep
+    the cursor of the last change they processed and ask for everything after it. If changes
+    were dropped (overflow, event storm, or the consumer is too far behind), changes_since
+    returns None and the consumer has to fall back to a full refresh.
+    """
+
+    def __init__(self, max_entries: int = 100_000):
+        self.max_entries = max_entries
+        self._entries: Deque[Tuple[int, Optional[str]]] = deque()
+        self._next_seq = 1
+        self._lock = threading.Lock()
+
+    def cursor(self) -> int:
+        """Cursor that points behind the latest recorded change."""
+        with self._lock:
+            return self._next_seq - 1
+
+    def record(self, paths: Iterable[str]) -> None:
+        with self._lock:
+            for path in paths:
+                self._append(path)
+
+    def record_overflow(self) -> None:
+        """Mark that changes were lost; every consumer has to do a full refresh."""
+        with self._lock:
+            self._append(None)
+
+    def _append(self, path: Optional[str]) -> None:
+        self._entries.append((self._next_seq, path))
+        self._next_seq += 1
+        while len(self._entries) > self.max_entries:
+            self._entries.popleft()
+
+    def changes_since(self, cursor: int) -> Tuple[int, Optional[Set[str]]]:
+        """Return (new_cursor, changed paths after cursor), or (new_cursor, None) if changes were lost."""
+        with self._lock:
+            new_cursor = self._next_seq - 1
+            if cursor >= new_cursor:
+                return new_cursor, set()
+            if not self._entries or self._entries[0][0] > cursor + 1:
+                return new_cursor, None
+            paths = set()
+            for seq, path in reversed(self._entries):
+                if seq <= cursor:
+                    break
+                if path is None:
+                    return new_cursor, None
+                paths.add(path)
+            return new_cursor, paths
+
+
+class FileWatcher:
+    """
+    Background thread that records changes below root in a ChangeLog.
+
+    Uses Linux inotify (one watch per directory that is not excluded or ignored) and falls back
+    to polling (a full stat scan every poll_interval seconds) when inotify is not available or
+    runs out of watches. Raw events are debounced: a batch is written once no event arrived for
+    debounce seconds, or at the latest after max_delay seconds. Batches larger than max_batch
+    (e.g. a big git checkout) are recorded as a single overflow marker instead.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        exclude_dirs: List[str],
+        debounce: float = 0.2,
+        max_delay: float = 2.0,
+        max_batch: int = 10_000,
+        poll_interval: float = 2.0,
+        use_inotify: bool = True
+    ):
+        self.root = os.path.realpath(root)
+        self.exclude = ExcludeMatcher(exclude_dirs)
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.max_batch = max_batch
+        self.poll_interval = poll_interval
+        self.change_log = ChangeLog()
+        self.backend = "inotify" if use_inotify and _load_libc() is not None else "polling"
+
+        self._pending: Set[str] = set()
+        self._overflow = False
+        self._first_event = 0.0
+        self._last_event = 0.0
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._inotify_fd = -1
+        self._watches: Dict[int, str] = {}
+        self._poll_state: Dict[str, Tuple[int, float]] = {}
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> "FileWatcher":
+        if self.backend == "inotify":
+            try:
+                self._start_inotify()
+            except OSError as e:
+                logger.warning(f"inotify not usable for {self.root} ({e}), falling back to polling")
+                self._close_inotify()
+                self.backend = "polling"
+        if self.backend == "polling":
+            self._poll_state = self._poll_scan()
+        self._thread = threading.Thread(target=self._loop, name="codesearch-watcher", daemon=True)
+        self._thread.start()
+        logger.info(f"Watching {self.root} with {self.backend} ({len(self._watches)} directories)")
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        with self._lock:
+            self._close_inotify()
+
+    def flush(self) -> None:
+        """
+        Write all events received so far to the change log without waiting for the debounce
+        period. Consumers call this before a query; the polling backend only reports what the
+        last poll found.
+        """
+        with self._lock:
+            self._drain_inotify()
+            self._flush_pending(force=True)
+
+    # Event collection
+
+    def _add_events(self, paths: Iterable[str]) -> None:
+        now = time.monotonic()
+        if not self._pending and not self._overflow:
+            self._first_event = now
+        self._last_event = now
+        self._pending.update(paths)
+        if len(self._pending) > self.max_batch:
+            self._pending.clear()
+            self._overflow = True
+
+    def _flush_pending(self, force: bool = False) -> None:
+        if not self._pending and not self._overflow:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_event < self.debounce and now - self._first_event < self.max_delay:
+            return
+        if self._overflow:
+            logger.info("File watcher: event storm, consumers will do a full refresh")
+            self.change_log.record_overflow()
+        else:
+            self.change_log.record(sorted(self._pending))
+        self._pending = set()
+        self._overflow = False
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                if self.backend == "inotify":
+                    select.select([self._inotify_fd], [], [], self.debounce / 2)
+                    with self._lock:
+                        self._drain_inotify()
+                        self._flush_pending()
+                else:
+                    self._stop.wait(self.poll_interval)
+                    with self._lock:
+                        self._poll_once()
+                        self._flush_pending()
+            except Exception as e:
+                logger.error(f"File watcher error: {e}", exc_info=True)
+                self.change_log.record_overflow()
+                self._stop.wait(self.poll_interval)
+
+    # inotify backend
+
+    def _start_inotify(self) -> None:
+        libc = _load_libc()
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._inotify_fd = fd
+        self._watch_tree(self.root, rescan=False)
+
+    def _watch_tree(self, path: str, rescan: bool = True) -> List[str]:
+        """
+        Add watches for path and every directory below it; returns the files found. With rescan
+        the tree is listed again once the watches are in place (until no new directory shows up),
+        so files created in a new directory before its watch existed are not lost.
+        """
+        ignore = DirectoryIgnore.for_parent_of(path, self.root)
+        watched = set(self._watches.values())
+        files = set()
+        libc = _load_libc()
+        while True:
+            listings = scan_tree(path, self.exclude, ignore=ignore)
+            new_dirs = [dir_path for dir_path, listing in listings.items() if listing is not None and dir_path not in watched]
+            for dir_path in new_dirs:
+                wd = libc.inotify_add_watch(self._inotify_fd, os.fsencode(dir_path), WATCH_MASK)
+                if wd < 0:
+                    raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {dir_path}")
+                self._watches[wd] = dir_path
+                watched.add(dir_path)
+            files.update(file_path for listing in listings.values() if listing is not None for file_path, _, _ in listing.files)
+            if not rescan or not new_dirs:
+                return sorted(files)
+
+    def _drain_inotify(self) -> None:
+        while self._inotify_fd >= 0:
+            try:
+                data = os.read(self._inotify_fd, 64 * 1024)
+            except BlockingIOError:
+                return
+            self._parse_events(data)
+
+    def _parse_events(self, data: bytes) -> None:
+        changed = []
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, mask, _, name_len = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + name_len].rstrip(b"\0"))
+            offset += name_len
+
+            if mask & IN_Q_OVERFLOW:
+                self._overflow = True
+                self._add_events([])
+                continue
+            dir_path = self._watches.get(wd)
+            if mask & IN_IGNORED:
+                self._watches.pop(wd, None)
+                continue
+            if dir_path is None:
+                continue
+            path = os.path.join(dir_path, name) if name else dir_path
+            changed.append(path)
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO) and not self.exclude.matches(name):
+                try:
+                    changed.extend(self._watch_tree(path))
+                except OSError as e:
+                    logger.warning(f"Could not watch new directory {path}: {e}")
+                    self._overflow = True
+        if changed:
+            self._add_events(changed)
+
+    def _close_inotify(self) -> None:
+        if self._inotify_fd >= 0:
+            os.close(self._inotify_fd)
+            self._inotify_fd = -1
+        self._watches = {}
+
+    # Polling backend
+
+    def _poll_scan(self) -> Dict[str, Tuple[int, float]]:
+        ignore = DirectoryIgnore.for_parent_of(self.root, self.root)
+        state = {}
+        for dir_path, listing in scan_tree(self.root, self.exclude, ignore=ignore).items():
+            if listing is None:
+                continue
+            state[dir_path] = (0, listing.mtime or 0.0)
+            for file_path, size, mtime in listing.files:
+                state[file_path] = (size, mtime)
+        return state
+
+    def _poll_once(self) -> None:
+        state = self._poll_scan()
+        previous = self._poll_state
+        changed = [path for path, stat in state.items() if previous.get(path) != stat]
+        changed.extend(path for path in previous if path not in state)
+        self._poll_state = state
+        if changed:
+            self._add_events(changed)
+
+
+_libc = None
+
+
+def _load_libc():
+    global _libc
+    if _libc is None:
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            libc.inotify_init1, libc.inotify_add_watch
+            _libc = libc
+        except (OSError, AttributeError):
+            _libc = False
+    return _libc or None
+
+
+_watchers: Dict[str, FileWatcher] = {}
+
+
+def start_watcher(root: str, exclude_dirs: List[str], **kwargs) -> FileWatcher:
+    """Start (or return the running) background watcher for root."""
+    key = os.path.realpath(root)
+    watcher = _watchers.get(key)
+    if watcher is None or not watcher.running:
+        watcher = FileWatcher(key, exclude_dirs, **kwargs).start()
+        _watchers[key] = watcher
+    return watcher
+
+
+def get_watcher(path: str) -> Optional[FileWatcher]:
+    """Return the running watcher whose root contains path, if any."""
+    path = os.path.realpath(path)
+    for root, watcher in _watchers.items():
+        if watcher.running and (path == root or path.startswith(root + os.sep)):
+            return watcher
+    return None
+
+
+def stop_watchers() -> None:
+    for watcher in _watchers.values():
+        watcher.stop()
+    _watchers.clear()